@@ -0,0 +1,64 @@
+import numpy as np
+
+#Bit-plane kernel for trio code histograms.
+#The genotypes of the fathers, mothers and offspring of a stratum are packed into bit-planes, one bit per trio and one plane per
+#genotype value (0, 1, 2, NA), in 64-bit words. The number of trios with trio code father*16 + mother*4 + offspring at a marker is
+#the popcount of planeF[father] & planeM[mother] & planeNB[offspring], so all 64 counts of a marker are computed with bitwise ANDs
+#and popcounts over nTrios/64 words instead of one histogram update per trio.
+
+N_GENOTYPE_VALUES = 4             #0, 1, 2, NA
+N_TRIO_CODES = 64
+PLANE_BUFFER_SIZE = 1<<22         #number of 64-bit words of the (64 x nMarkers x nWords) AND planes held at a time
+
+#SWAR popcount constants
+M1 = np.uint64(0x5555555555555555)
+M2 = np.uint64(0x3333333333333333)
+M4 = np.uint64(0x0f0f0f0f0f0f0f0f)
+H01 = np.uint64(0x0101010101010101)
+
+##Pack one member's genotypes (nMarkers x nTrios, values 0..3) into bit-planes of shape (4 x nMarkers x nWords), dtype uint64.
+#Padding bits of the last word are 0 in every plane, so they are never counted.
+def packPlanes(genotypes):
+	nMarkers,nTrios = genotypes.shape
+	nBytes = ((nTrios+63)/64)*8
+	planes = np.zeros((N_GENOTYPE_VALUES,nMarkers,nBytes),dtype=np.uint8)
+	for value in range(N_GENOTYPE_VALUES):
+		packed = np.packbits(genotypes == value,axis=1)
+		planes[value,:,:packed.shape[1]] = packed
+	return planes.view(np.uint64)
+
+##Number of set bits of each 64-bit word (SWAR). The words are overwritten with their counts.
+def popcount(words):
+	shifted = np.right_shift(words,np.uint64(1))
+	shifted &= M1
+	words -= shifted
+	np.right_shift(words,np.uint64(2),out=shifted)
+	shifted &= M2
+	words &= M2
+	words += shifted
+	np.right_shift(words,np.uint64(4),out=shifted)
+	words += shifted
+	words &= M4
+	words *= H01
+	words >>= np.uint64(56)
+	return words
+
+##Trio code histograms (nMarkers x 64) from the genotypes of the fathers, mothers and offspring of a set of trios (each nMarkers x nTrios).
+#Same counts as np.bincount over the trio codes of each marker.
+def countTrioCodes(fatherGenotypes,motherGenotypes,offspringGenotypes):
+	nMarkers = fatherGenotypes.shape[0]
+	fatherPlanes = packPlanes(fatherGenotypes)
+	motherPlanes = packPlanes(motherGenotypes)
+	offspringPlanes = packPlanes(offspringGenotypes)
+	nWords = fatherPlanes.shape[2]
+	codeCounts = np.zeros((nMarkers,N_TRIO_CODES),dtype=np.int64)
+	#markers are processed in batches so that the AND planes of all 64 codes stay in a bounded buffer
+	batchSize = max(1,PLANE_BUFFER_SIZE/(N_TRIO_CODES*max(nWords,1)))
+	for start in range(0,nMarkers,batchSize):
+		end = min(start+batchSize,nMarkers)
+		#parent planes [father,mother] then trio planes [father,mother,offspring], flattened in trio code order
+		parentPlanes = fatherPlanes[:,None,start:end] & motherPlanes[None,:,start:end]
+		trioPlanes = parentPlanes[:,:,None] & offspringPlanes[None,None,:,start:end]
+		counts = popcount(trioPlanes.reshape(N_TRIO_CODES,end-start,nWords)).sum(axis=2)
+		codeCounts[start:end] = counts.T
+	return codeCounts
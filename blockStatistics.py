@@ -0,0 +1,248 @@
+import numpy as np
+from classMarker import (AutosomalMarker,ChrXMarker,
+	informativeTrioBinc_Additive,informativeTrioBinc_Dominant,informativeTrioBinc_Recessive,informativeTrioBinc_AllModels_ChrX_MaleNB,informativeTrioBinc_Additive_ChrX_FemaleNB,informativeTrioBinc_Dominant_ChrX_FemaleNB,informativeTrioBinc_Recessive_ChrX_FemaleNB,
+	informativeTrioCinc_Additive,informativeTrioCinc_Dominant,informativeTrioCinc_Recessive,informativeTrioCinc_AllModels_ChrX_MaleNB,informativeTrioCinc_Additive_ChrX_FemaleNB,informativeTrioCinc_Dominant_ChrX_FemaleNB,informativeTrioCinc_Recessive_ChrX_FemaleNB,
+	incompleteTrioBinc_Additive,incompleteTrioBinc_Dominant,incompleteTrioBinc_Recessive,incompleteTrioBinc_AllModels_ChrX_MaleNB,incompleteTrioBinc_Additive_ChrX_FemaleNB,incompleteTrioBinc_Dominant_ChrX_FemaleNB,incompleteTrioBinc_Recessive_ChrX_FemaleNB,
+	incompleteTrioCinc_Additive,incompleteTrioCinc_Dominant,incompleteTrioCinc_Recessive,incompleteTrioCinc_AllModels_ChrX_MaleNB,incompleteTrioCinc_Additive_ChrX_FemaleNB,incompleteTrioCinc_Dominant_ChrX_FemaleNB,incompleteTrioCinc_Recessive_ChrX_FemaleNB,
+	informativeTrioU_Additive,informativeTrioU_Dominant,informativeTrioU_Recessive,informativeTrioU_AllModels_ChrX_MaleNB,informativeTrioU_Additive_ChrX_FemaleNB,informativeTrioU_Dominant_ChrX_FemaleNB,informativeTrioU_Recessive_ChrX_FemaleNB,
+	informativeTrioVarU_Additive,informativeTrioVarU_Dominant,informativeTrioVarU_Recessive,informativeTrioVarU_AllModels_ChrX_MaleNB,informativeTrioVarU_Additive_ChrX_FemaleNB,informativeTrioVarU_Dominant_ChrX_FemaleNB,informativeTrioVarU_Recessive_ChrX_FemaleNB,
+	incompleteCaseTrioUmin_Additive,incompleteCaseTrioUmin_Dominant,incompleteCaseTrioUmin_Recessive,incompleteCaseTrioUmin_AllModels_ChrX_MaleNB,incompleteCaseTrioUmin_Additive_ChrX_FemaleNB,incompleteCaseTrioUmin_Dominant_ChrX_FemaleNB,incompleteCaseTrioUmin_Recessive_ChrX_FemaleNB,
+	incompleteCaseTrioVarUmin_Additive,incompleteCaseTrioVarUmin_Dominant,incompleteCaseTrioVarUmin_Recessive,incompleteCaseTrioVarUmin_AllModels_ChrX_MaleNB,incompleteCaseTrioVarUmin_Additive_ChrX_FemaleNB,incompleteCaseTrioVarUmin_Dominant_ChrX_FemaleNB,incompleteCaseTrioVarUmin_Recessive_ChrX_FemaleNB,
+	incompleteControlTrioUmin_Additive,incompleteControlTrioUmin_Dominant,incompleteControlTrioUmin_Recessive,incompleteControlTrioUmin_AllModels_ChrX_MaleNB,incompleteControlTrioUmin_Additive_ChrX_FemaleNB,incompleteControlTrioUmin_Dominant_ChrX_FemaleNB,incompleteControlTrioUmin_Recessive_ChrX_FemaleNB,
+	incompleteControlTrioVarUmin_Additive,incompleteControlTrioVarUmin_Dominant,incompleteControlTrioVarUmin_Recessive,incompleteControlTrioVarUmin_AllModels_ChrX_MaleNB,incompleteControlTrioVarUmin_Additive_ChrX_FemaleNB,incompleteControlTrioVarUmin_Dominant_ChrX_FemaleNB,incompleteControlTrioVarUmin_Recessive_ChrX_FemaleNB,
+	incompleteCaseTrioUmax_Additive,incompleteCaseTrioUmax_Dominant,incompleteCaseTrioUmax_Recessive,incompleteCaseTrioUmax_AllModels_ChrX_MaleNB,incompleteCaseTrioUmax_Additive_ChrX_FemaleNB,incompleteCaseTrioUmax_Dominant_ChrX_FemaleNB,incompleteCaseTrioUmax_Recessive_ChrX_FemaleNB,
+	incompleteCaseTrioVarUmax_Additive,incompleteCaseTrioVarUmax_Dominant,incompleteCaseTrioVarUmax_Recessive,incompleteCaseTrioVarUmax_AllModels_ChrX_MaleNB,incompleteCaseTrioVarUmax_Additive_ChrX_FemaleNB,incompleteCaseTrioVarUmax_Dominant_ChrX_FemaleNB,incompleteCaseTrioVarUmax_Recessive_ChrX_FemaleNB,
+	incompleteControlTrioUmax_Additive,incompleteControlTrioUmax_Dominant,incompleteControlTrioUmax_Recessive,incompleteControlTrioUmax_AllModels_ChrX_MaleNB,incompleteControlTrioUmax_Additive_ChrX_FemaleNB,incompleteControlTrioUmax_Dominant_ChrX_FemaleNB,incompleteControlTrioUmax_Recessive_ChrX_FemaleNB,
+	incompleteControlTrioVarUmax_Additive,incompleteControlTrioVarUmax_Dominant,incompleteControlTrioVarUmax_Recessive,incompleteControlTrioVarUmax_AllModels_ChrX_MaleNB,incompleteControlTrioVarUmax_Additive_ChrX_FemaleNB,incompleteControlTrioVarUmax_Dominant_ChrX_FemaleNB,incompleteControlTrioVarUmax_Recessive_ChrX_FemaleNB)
+
+#Matrix formulation of the TDT, rTDT, FBAT and extended FBAT statistics for a block of markers.
+#The per trio type look-up tables of classMarker.py are stacked once at import into one weight matrix per chromosome class.
+#Multiplying a block's count matrix (markers x trio types) by it gives b, c and the rTDT increments of every model at once.
+#U and Var(U) are sums of floating point weights (multiples of 1/6 and 1/36): for the FBAT statistics they are summed over the block with
+#vector operations in the order of the marker classes (see getOrderedSum), so that the Z statistics are those of classMarker.py to the last bit.
+
+##GENETIC MODELS: option, output column suffix, and look-up tables for autosomal and chrX markers as (male NB, female NB) pairs.
+#Adding a model means adding a row here.
+#bMinIndices/cMinIndices are the incomplete trio types that always increase only b (or only c) in the rTDT minimum.
+def bothGenders(table):
+	return (table,table)
+
+geneticModels = [
+	('a','Additive',
+		{'Binc':bothGenders(informativeTrioBinc_Additive),'Cinc':bothGenders(informativeTrioCinc_Additive),'incBinc':bothGenders(incompleteTrioBinc_Additive),'incCinc':bothGenders(incompleteTrioCinc_Additive),'bMinIndices':bothGenders([8]),'cMinIndices':bothGenders([10]),
+		'U':bothGenders(informativeTrioU_Additive),'VarU':bothGenders(informativeTrioVarU_Additive),
+		'caseUmin':bothGenders(incompleteCaseTrioUmin_Additive),'caseVarUmin':bothGenders(incompleteCaseTrioVarUmin_Additive),'controlUmin':bothGenders(incompleteControlTrioUmin_Additive),'controlVarUmin':bothGenders(incompleteControlTrioVarUmin_Additive),
+		'caseUmax':bothGenders(incompleteCaseTrioUmax_Additive),'caseVarUmax':bothGenders(incompleteCaseTrioVarUmax_Additive),'controlUmax':bothGenders(incompleteControlTrioUmax_Additive),'controlVarUmax':bothGenders(incompleteControlTrioVarUmax_Additive)},
+		{'Binc':(informativeTrioBinc_AllModels_ChrX_MaleNB,informativeTrioBinc_Additive_ChrX_FemaleNB),'Cinc':(informativeTrioCinc_AllModels_ChrX_MaleNB,informativeTrioCinc_Additive_ChrX_FemaleNB),'incBinc':(incompleteTrioBinc_AllModels_ChrX_MaleNB,incompleteTrioBinc_Additive_ChrX_FemaleNB),'incCinc':(incompleteTrioCinc_AllModels_ChrX_MaleNB,incompleteTrioCinc_Additive_ChrX_FemaleNB),'bMinIndices':([4],[5]),'cMinIndices':([5],[7]),
+		'U':(informativeTrioU_AllModels_ChrX_MaleNB,informativeTrioU_Additive_ChrX_FemaleNB),'VarU':(informativeTrioVarU_AllModels_ChrX_MaleNB,informativeTrioVarU_Additive_ChrX_FemaleNB),
+		'caseUmin':(incompleteCaseTrioUmin_AllModels_ChrX_MaleNB,incompleteCaseTrioUmin_Additive_ChrX_FemaleNB),'caseVarUmin':(incompleteCaseTrioVarUmin_AllModels_ChrX_MaleNB,incompleteCaseTrioVarUmin_Additive_ChrX_FemaleNB),'controlUmin':(incompleteControlTrioUmin_AllModels_ChrX_MaleNB,incompleteControlTrioUmin_Additive_ChrX_FemaleNB),'controlVarUmin':(incompleteControlTrioVarUmin_AllModels_ChrX_MaleNB,incompleteControlTrioVarUmin_Additive_ChrX_FemaleNB),
+		'caseUmax':(incompleteCaseTrioUmax_AllModels_ChrX_MaleNB,incompleteCaseTrioUmax_Additive_ChrX_FemaleNB),'caseVarUmax':(incompleteCaseTrioVarUmax_AllModels_ChrX_MaleNB,incompleteCaseTrioVarUmax_Additive_ChrX_FemaleNB),'controlUmax':(incompleteControlTrioUmax_AllModels_ChrX_MaleNB,incompleteControlTrioUmax_Additive_ChrX_FemaleNB),'controlVarUmax':(incompleteControlTrioVarUmax_AllModels_ChrX_MaleNB,incompleteControlTrioVarUmax_Additive_ChrX_FemaleNB)}),
+	('d','Dominant',
+		{'Binc':bothGenders(informativeTrioBinc_Dominant),'Cinc':bothGenders(informativeTrioCinc_Dominant),'incBinc':bothGenders(incompleteTrioBinc_Dominant),'incCinc':bothGenders(incompleteTrioCinc_Dominant),'bMinIndices':bothGenders([8]),'cMinIndices':bothGenders([]),
+		'U':bothGenders(informativeTrioU_Dominant),'VarU':bothGenders(informativeTrioVarU_Dominant),
+		'caseUmin':bothGenders(incompleteCaseTrioUmin_Dominant),'caseVarUmin':bothGenders(incompleteCaseTrioVarUmin_Dominant),'controlUmin':bothGenders(incompleteControlTrioUmin_Dominant),'controlVarUmin':bothGenders(incompleteControlTrioVarUmin_Dominant),
+		'caseUmax':bothGenders(incompleteCaseTrioUmax_Dominant),'caseVarUmax':bothGenders(incompleteCaseTrioVarUmax_Dominant),'controlUmax':bothGenders(incompleteControlTrioUmax_Dominant),'controlVarUmax':bothGenders(incompleteControlTrioVarUmax_Dominant)},
+		{'Binc':(informativeTrioBinc_AllModels_ChrX_MaleNB,informativeTrioBinc_Dominant_ChrX_FemaleNB),'Cinc':(informativeTrioCinc_AllModels_ChrX_MaleNB,informativeTrioCinc_Dominant_ChrX_FemaleNB),'incBinc':(incompleteTrioBinc_AllModels_ChrX_MaleNB,incompleteTrioBinc_Dominant_ChrX_FemaleNB),'incCinc':(incompleteTrioCinc_AllModels_ChrX_MaleNB,incompleteTrioCinc_Dominant_ChrX_FemaleNB),'bMinIndices':([4],[5]),'cMinIndices':([5],[]),
+		'U':(informativeTrioU_AllModels_ChrX_MaleNB,informativeTrioU_Dominant_ChrX_FemaleNB),'VarU':(informativeTrioVarU_AllModels_ChrX_MaleNB,informativeTrioVarU_Dominant_ChrX_FemaleNB),
+		'caseUmin':(incompleteCaseTrioUmin_AllModels_ChrX_MaleNB,incompleteCaseTrioUmin_Dominant_ChrX_FemaleNB),'caseVarUmin':(incompleteCaseTrioVarUmin_AllModels_ChrX_MaleNB,incompleteCaseTrioVarUmin_Dominant_ChrX_FemaleNB),'controlUmin':(incompleteControlTrioUmin_AllModels_ChrX_MaleNB,incompleteControlTrioUmin_Dominant_ChrX_FemaleNB),'controlVarUmin':(incompleteControlTrioVarUmin_AllModels_ChrX_MaleNB,incompleteControlTrioVarUmin_Dominant_ChrX_FemaleNB),
+		'caseUmax':(incompleteCaseTrioUmax_AllModels_ChrX_MaleNB,incompleteCaseTrioUmax_Dominant_ChrX_FemaleNB),'caseVarUmax':(incompleteCaseTrioVarUmax_AllModels_ChrX_MaleNB,incompleteCaseTrioVarUmax_Dominant_ChrX_FemaleNB),'controlUmax':(incompleteControlTrioUmax_AllModels_ChrX_MaleNB,incompleteControlTrioUmax_Dominant_ChrX_FemaleNB),'controlVarUmax':(incompleteControlTrioVarUmax_AllModels_ChrX_MaleNB,incompleteControlTrioVarUmax_Dominant_ChrX_FemaleNB)}),
+	('r','Recessive',
+		{'Binc':bothGenders(informativeTrioBinc_Recessive),'Cinc':bothGenders(informativeTrioCinc_Recessive),'incBinc':bothGenders(incompleteTrioBinc_Recessive),'incCinc':bothGenders(incompleteTrioCinc_Recessive),'bMinIndices':bothGenders([]),'cMinIndices':bothGenders([10]),
+		'U':bothGenders(informativeTrioU_Recessive),'VarU':bothGenders(informativeTrioVarU_Recessive),
+		'caseUmin':bothGenders(incompleteCaseTrioUmin_Recessive),'caseVarUmin':bothGenders(incompleteCaseTrioVarUmin_Recessive),'controlUmin':bothGenders(incompleteControlTrioUmin_Recessive),'controlVarUmin':bothGenders(incompleteControlTrioVarUmin_Recessive),
+		'caseUmax':bothGenders(incompleteCaseTrioUmax_Recessive),'caseVarUmax':bothGenders(incompleteCaseTrioVarUmax_Recessive),'controlUmax':bothGenders(incompleteControlTrioUmax_Recessive),'controlVarUmax':bothGenders(incompleteControlTrioVarUmax_Recessive)},
+		{'Binc':(informativeTrioBinc_AllModels_ChrX_MaleNB,informativeTrioBinc_Recessive_ChrX_FemaleNB),'Cinc':(informativeTrioCinc_AllModels_ChrX_MaleNB,informativeTrioCinc_Recessive_ChrX_FemaleNB),'incBinc':(incompleteTrioBinc_AllModels_ChrX_MaleNB,incompleteTrioBinc_Recessive_ChrX_FemaleNB),'incCinc':(incompleteTrioCinc_AllModels_ChrX_MaleNB,incompleteTrioCinc_Recessive_ChrX_FemaleNB),'bMinIndices':([4],[]),'cMinIndices':([5],[7]),
+		'U':(informativeTrioU_AllModels_ChrX_MaleNB,informativeTrioU_Recessive_ChrX_FemaleNB),'VarU':(informativeTrioVarU_AllModels_ChrX_MaleNB,informativeTrioVarU_Recessive_ChrX_FemaleNB),
+		'caseUmin':(incompleteCaseTrioUmin_AllModels_ChrX_MaleNB,incompleteCaseTrioUmin_Recessive_ChrX_FemaleNB),'caseVarUmin':(incompleteCaseTrioVarUmin_AllModels_ChrX_MaleNB,incompleteCaseTrioVarUmin_Recessive_ChrX_FemaleNB),'controlUmin':(incompleteControlTrioUmin_AllModels_ChrX_MaleNB,incompleteControlTrioUmin_Recessive_ChrX_FemaleNB),'controlVarUmin':(incompleteControlTrioVarUmin_AllModels_ChrX_MaleNB,incompleteControlTrioVarUmin_Recessive_ChrX_FemaleNB),
+		'caseUmax':(incompleteCaseTrioUmax_AllModels_ChrX_MaleNB,incompleteCaseTrioUmax_Recessive_ChrX_FemaleNB),'caseVarUmax':(incompleteCaseTrioVarUmax_AllModels_ChrX_MaleNB,incompleteCaseTrioVarUmax_Recessive_ChrX_FemaleNB),'controlUmax':(incompleteControlTrioUmax_AllModels_ChrX_MaleNB,incompleteControlTrioUmax_Recessive_ChrX_FemaleNB),'controlVarUmax':(incompleteControlTrioVarUmax_AllModels_ChrX_MaleNB,incompleteControlTrioVarUmax_Recessive_ChrX_FemaleNB)}),
+]
+
+##QUANTITIES computed for each model: (name, table key, case or control trios, complete or incomplete trios, scale)
+#U weights are multiples of 1/6 and Var(U) weights multiples of 1/36, so all weights are scaled to integers and the matrix product is exact.
+quantities = [
+	('b','Binc','Case','Complete',1),
+	('c','Cinc','Case','Complete',1),
+	('bMaxIncrement','incBinc','Case','Incomplete',1),
+	('cMaxIncrement','incCinc','Case','Incomplete',1),
+	('bMinIncrement','bMinIndices','Case','Incomplete',1),
+	('cMinIncrement','cMinIndices','Case','Incomplete',1),
+	('caseU','U','Case','Complete',6),
+	('caseVarU','VarU','Case','Complete',36),
+	('controlU','U','Control','Complete',6),
+	('controlVarU','VarU','Control','Complete',36),
+	('caseUminIncrement','caseUmin','Case','Incomplete',6),
+	('caseVarUminIncrement','caseVarUmin','Case','Incomplete',36),
+	('controlUminIncrement','controlUmin','Control','Incomplete',6),
+	('controlVarUminIncrement','controlVarUmin','Control','Incomplete',36),
+	('caseUmaxIncrement','caseUmax','Case','Incomplete',6),
+	('caseVarUmaxIncrement','caseVarUmax','Case','Incomplete',36),
+	('controlUmaxIncrement','controlUmax','Control','Incomplete',6),
+	('controlVarUmaxIncrement','controlVarUmax','Control','Incomplete',36),
+]
+quantityIndex = dict([(quantities[x][0],x) for x in range(len(quantities))])
+
+#count vectors that make up the columns of a block's count matrix, in this order
+countMatrixVectors = ['nCompleteInformativeCaseTrio_MaleNB','nCompleteInformativeCaseTrio_FemaleNB','nCompleteInformativeControlTrio_MaleNB','nCompleteInformativeControlTrio_FemaleNB','nIncompleteInformativeCaseTrio_MaleNB','nIncompleteInformativeCaseTrio_FemaleNB','nIncompleteInformativeControlTrio_MaleNB','nIncompleteInformativeControlTrio_FemaleNB']
+
+def getCountVectorLengths(isChrX):
+	if isChrX:
+		marker = ChrXMarker()
+	else:
+		marker = AutosomalMarker()
+	return [len(getattr(marker,name)) for name in countMatrixVectors]
+
+##Stack the look-up tables of all models into a (count matrix columns x (models*quantities)) integer weight matrix
+def stackWeightMatrix(isChrX):
+	vectorLengths = getCountVectorLengths(isChrX)
+	vectorOffsets = np.cumsum([0]+vectorLengths)
+	weights = np.zeros((vectorOffsets[-1],len(geneticModels)*len(quantities)),dtype=np.int64)
+	for modelIndex in range(len(geneticModels)):
+		tables = geneticModels[modelIndex][3] if isChrX else geneticModels[modelIndex][2]
+		for quantity in range(len(quantities)):
+			name,tableKey,pheno,completeness,scale = quantities[quantity]
+			column = modelIndex*len(quantities)+quantity
+			for genderIndex,genderLabel in [(0,'MaleNB'),(1,'FemaleNB')]:
+				vector = countMatrixVectors.index('n'+completeness+'Informative'+pheno+'Trio_'+genderLabel)
+				table = tables[tableKey][genderIndex]
+				if tableKey.endswith('Indices'):
+					table = [int(x in table) for x in range(vectorLengths[vector])]
+				assert(len(table) == vectorLengths[vector])
+				for x in range(len(table)):
+					weight = int(round(table[x]*scale))
+					assert(abs(weight-table[x]*scale) < 1e-9)
+					weights[vectorOffsets[vector]+x,column] = weight
+	return weights
+
+#weight matrices, stacked once at import
+weightMatrices = {False:stackWeightMatrix(False),True:stackWeightMatrix(True)}
+
+
+##Output columns of the statistics, in the order used by scanTDT.py
+def getStatisticColumns(TEST,VERSION,MODELS):
+	columns = []
+	if TEST == "" or TEST == "tdt":
+		for model,modelName,autosomalTables,chrXTables in getSelectedModels(MODELS):
+			columns.extend(['ChiSq_TDT_'+modelName,'P-value_TDT_'+modelName])
+			if VERSION == "scan" or VERSION == "":
+				columns.extend(['min_ChiSq_rTDT_'+modelName,'min_P-value_rTDT_'+modelName,'max_ChiSq_rTDT_'+modelName,'max_P-value_rTDT_'+modelName])
+	if TEST == "" or TEST == "fbat":
+		for model,modelName,autosomalTables,chrXTables in getSelectedModels(MODELS):
+			columns.extend(['Z_FBAT_'+modelName,'P-value_FBAT_'+modelName])
+			if VERSION == "scan" or VERSION == "":
+				columns.extend(['min_Z_scanFBAT_'+modelName,'min_P-value_scanFBAT_'+modelName,'max_Z_scanFBAT_'+modelName,'max_P-value_scanFBAT_'+modelName])
+	return columns
+
+#models selected with -model, in table order. Additive only if none selected.
+def getSelectedModels(MODELS):
+	if not MODELS:
+		return [geneticModels[0]]
+	return [geneticModel for geneticModel in geneticModels if geneticModel[0] in MODELS]
+
+
+##Compute the statistics of a block of markers of the same chromosome class
+#counts is the dictionary of count matrices from TrioClassifier.countTrioTypes.
+#Returns one list of values per marker, in the column order of getStatisticColumns. p-values are left as None, to be evaluated
+#in batch (see pValues.py), except the p-value of 1 reported with the 0 minimum rTDT statistic when the b and c ranges overlap.
+def computeBlockStatistics(counts,isChrX,TEST,VERSION,MODELS,OFFSET):
+	countMatrix = np.hstack([np.asarray(counts[name],dtype=np.int64) for name in countMatrixVectors])
+	nMarkers = countMatrix.shape[0]
+	selectedModels = getSelectedModels(MODELS)
+	selectedColumns = []
+	for geneticModel in selectedModels:
+		modelIndex = geneticModels.index(geneticModel)
+		selectedColumns.extend(range(modelIndex*len(quantities),(modelIndex+1)*len(quantities)))
+
+	rows = [[] for x in range(nMarkers)]
+	if TEST == "" or TEST == "tdt":
+		#b, c and rTDT increments of every selected model in one matrix product
+		sums = countMatrix.dot(weightMatrices[isChrX][:,selectedColumns])
+		for modelNumber in range(len(selectedModels)):
+			getSum = lambda name: sums[:,modelNumber*len(quantities)+quantityIndex[name]]
+			b = getSum('b')
+			c = getSum('c')
+			addColumns(rows,[getChiSq(b,c),None])
+			if VERSION == "scan" or VERSION == "":
+				addColumns(rows,getMinMaxChiSq(b+getSum('bMinIncrement'),c+getSum('cMinIncrement'),b+getSum('bMaxIncrement'),c+getSum('cMaxIncrement')))
+	if TEST == "" or TEST == "fbat":
+		for geneticModel in selectedModels:
+			tables = geneticModel[3] if isChrX else geneticModel[2]
+			getSum = lambda name: getOrderedSum(counts,tables,name)
+			caseU = (1-OFFSET) * getSum('caseU')
+			controlU = (0-OFFSET) * getSum('controlU')
+			caseVarU = ((1-OFFSET)**2) * getSum('caseVarU')
+			controlVarU = ((0-OFFSET)**2) * getSum('controlVarU')
+			addColumns(rows,[getZ(caseU+controlU,caseVarU+controlVarU),None])
+			if VERSION == "scan" or VERSION == "":
+				Umin = (caseU + (1-OFFSET) * getSum('caseUminIncrement')) + (controlU + (0-OFFSET) * getSum('controlUminIncrement'))
+				varUmin = (caseVarU + ((1-OFFSET)**2) * getSum('caseVarUminIncrement')) + (controlVarU + ((0-OFFSET)**2) * getSum('controlVarUminIncrement'))
+				Umax = (caseU + (1-OFFSET) * getSum('caseUmaxIncrement')) + (controlU + (0-OFFSET) * getSum('controlUmaxIncrement'))
+				varUmax = (caseVarU + ((1-OFFSET)**2) * getSum('caseVarUmaxIncrement')) + (controlVarU + ((0-OFFSET)**2) * getSum('controlVarUmaxIncrement'))
+				addColumns(rows,[getZ(Umin,varUmin),None,getZ(Umax,varUmax),None])
+	return rows
+
+##Sum of the look-up table of a quantity times the counts of a block, male plus female NB, as the marker classes compute it for one marker
+#(sum([a*b for a,b in zip(table,counts)]) for each NB gender): the products are added one by one from 0, in table order, so the floating
+#point result is the same. Zero weights add nothing and are skipped.
+def getOrderedSum(counts,tables,name):
+	tableKey,pheno,completeness = quantities[quantityIndex[name]][1:4]
+	genderSums = []
+	for genderIndex,genderLabel in [(0,'MaleNB'),(1,'FemaleNB')]:
+		table = tables[tableKey][genderIndex]
+		vectorCounts = np.asarray(counts['n'+completeness+'Informative'+pheno+'Trio_'+genderLabel])
+		genderSum = np.zeros(vectorCounts.shape[0])
+		for x in np.flatnonzero(table):
+			genderSum = genderSum + table[x]*vectorCounts[:,x]
+		genderSums.append(genderSum)
+	return genderSums[0] + genderSums[1]
+
+#append columns (lists of per-marker values, or a single value for all markers) to the rows
+def addColumns(rows,columns):
+	for column in columns:
+		if isinstance(column,list):
+			for x in range(len(rows)):
+				rows[x].append(column[x])
+		else:
+			for row in rows:
+				row.append(column)
+
+#values as python floats (so that they print as before), 'NA' where the denominator is zero
+def withNA(values,isNA):
+	values = values.tolist()
+	for x in np.flatnonzero(isNA):
+		values[x] = 'NA'
+	return values
+
+##TDT chi-square statistic from b and c
+def getChiSq(b,c):
+	denominator = (b+c).astype(np.float64)
+	isNA = denominator == 0
+	return withNA((b-c)**2/np.where(isNA,1.0,denominator),isNA)
+
+##rTDT min and max statistics from bMin, cMin, bMax and cMax (see AutosomalMarker.getMinMaxStatistic)
+#returns the columns [min chiSq, min p-value, max chiSq, max p-value]
+def getMinMaxChiSq(bMin,cMin,bMax,cMax):
+	extTDT1 = getChiSq(bMin,cMax)
+	extTDT2 = getChiSq(bMax,cMin)
+	minChiSq = []
+	minPValue = []
+	maxChiSq = []
+	for x in range(len(extTDT1)):
+		if bMin[x] >= cMax[x]:
+			minChiSq.append(extTDT1[x])
+			maxChiSq.append(extTDT2[x])
+			minPValue.append(None)
+		elif bMax[x] <= cMin[x]:
+			minChiSq.append(extTDT2[x])
+			maxChiSq.append(extTDT1[x])
+			minPValue.append(None)
+		else:  #overlapping ranges of b and c
+			minChiSq.append(0)
+			maxChiSq.append(max(extTDT1[x],extTDT2[x]))
+			minPValue.append(1)
+	return [minChiSq,minPValue,maxChiSq,[None]*len(extTDT1)]
+
+##FBAT Z statistic from U and Var(U)
+def getZ(U,varU):
+	standardDeviation = np.sqrt(varU)
+	isNA = standardDeviation == 0
+	return withNA(U/np.where(isNA,1.0,standardDeviation),isNA)
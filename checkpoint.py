@@ -0,0 +1,60 @@
+import os
+import json
+import hashlib
+
+#Checkpoints of scanTDT.py runs (-checkpoint-interval) and their validation for -resume.
+#A checkpoint is written after the output of whole chunks of markers has been flushed: the gzip output is closed as a complete gzip member
+#(the file stays one valid gzip stream of several members) and the checkpoint records the compressed size of the output file, the rows
+#written, and the input position of the next unprocessed marker: the byte offset of its line in a text feature matrix (uncompressed offset
+#for .gz input), or the number of markers processed for PLINK input and -region/-chr queries.
+#-resume checks that the options that change the output and the fingerprints of the input files are those of the checkpointed run, truncates
+#the output to the checkpoint and continues from the recorded input position.
+
+CHECKPOINT_SUFFIX = ".checkpoint"
+CHECKPOINT_VERSION = 1
+FINGERPRINT_BYTES = 1<<20         #bytes of the start and of the end of a file hashed in its fingerprint
+
+##Fingerprint of an input file: size and MD5 of its first and last FINGERPRINT_BYTES bytes.
+#The modification time is left out, so that input files copied to another node still match
+def getFileFingerprint(filename):
+	size = os.path.getsize(filename)
+	inputFile = open(filename,"rb")
+	digest = hashlib.md5(inputFile.read(FINGERPRINT_BYTES))
+	inputFile.seek(max(0,size-FINGERPRINT_BYTES))
+	digest.update(inputFile.read(FINGERPRINT_BYTES))
+	inputFile.close()
+	return {'file':filename,'size':size,'md5':digest.hexdigest()}
+
+##Values as they read back from JSON (tuples become lists), so that checkpointed and current values compare equal
+def normalize(value):
+	return json.loads(json.dumps(value))
+
+##Write a checkpoint. The file is replaced in one rename, so a run preempted while writing keeps the previous checkpoint
+def writeCheckpoint(filename,checkpoint):
+	temporaryFilename = filename+".tmp"
+	checkpointFile = open(temporaryFilename,"w")
+	json.dump(checkpoint,checkpointFile,indent=1,sort_keys=True)
+	checkpointFile.write("\n")
+	checkpointFile.flush()
+	os.fsync(checkpointFile.fileno())
+	checkpointFile.close()
+	os.rename(temporaryFilename,filename)
+
+def readCheckpoint(filename):
+	return json.load(open(filename,"r"))
+
+##Differences between a checkpoint and the options and input fingerprints of the current run, as messages (empty when the run can be resumed)
+def validateCheckpoint(checkpoint,options,fingerprints):
+	messages = []
+	if checkpoint.get('version') <> CHECKPOINT_VERSION:
+		messages.append("checkpoint version "+str(checkpoint.get('version'))+" is not supported")
+		return messages
+	options = normalize(options)
+	for name in sorted(set(options) | set(checkpoint['options'])):
+		if options.get(name) <> checkpoint['options'].get(name):
+			messages.append("option "+name+" was "+json.dumps(checkpoint['options'].get(name))+", now "+json.dumps(options.get(name)))
+	fingerprints = normalize(fingerprints)
+	for name in sorted(set(fingerprints) | set(checkpoint['fingerprints'])):
+		if fingerprints.get(name) <> checkpoint['fingerprints'].get(name):
+			messages.append(name+" file has changed: "+json.dumps(checkpoint['fingerprints'].get(name))+", now "+json.dumps(fingerprints.get(name)))
+	return messages
@@ -1,7 +1,7 @@
 import sys
 import string
 import math
-from scipy import stats
+from pValues import chiSqPValue,normPValue
 
 ##LOOK-UP TABLES
 #Informative mating types
@@ -160,6 +160,7 @@ class AutosomalMarker:
 	        self.sampleGenotypes = {}
 	        self.maf = 0.0
 	        self.nVariantType = [0]*4   #[refHomozygous, heterozygous, nonRefHomozygous, missing]
+	        self.nAlleles = [0,0]       #[ref, alt] alleles counted for the MAF
 	        self.nCompleteInformativeCaseTrio_MaleNB = [0]*7
 		self.nCompleteInformativeCaseTrio_FemaleNB = [0]*7
 		self.nCompleteInformativeControlTrio_MaleNB = [0]*7
@@ -226,7 +227,7 @@ class AutosomalMarker:
 
         	try:
 	                self.chiSq_StdTDT = (self.bComplete-self.cComplete)**2/float(self.bComplete+self.cComplete)
-        	        self.pValue_StdTDT = 1 - stats.chi2.cdf(self.chiSq_StdTDT, 1)   #multiply by 2 for two-sided test??? No, since TDT statistic is always positive, we want to compute the probability of observing a score higher than this
+        	        self.pValue_StdTDT = self.getChiSqPValue(self.chiSq_StdTDT)   #multiply by 2 for two-sided test??? No, since TDT statistic is always positive, we want to compute the probability of observing a score higher than this
 	        except ZeroDivisionError:
         	        self.chiSq_StdTDT = 'NA'
 	                self.pValue_StdTDT = 'NA'
@@ -266,13 +267,13 @@ class AutosomalMarker:
 	def getMinMaxStatistic(self):
 		try:
                         extTDT1 = (self.bMin-self.cMax)**2/float(self.bMin+self.cMax)
-                        pValue1 = 1 - stats.chi2.cdf(extTDT1, 1)
+                        pValue1 = self.getChiSqPValue(extTDT1)
                 except ZeroDivisionError:
                         extTDT1 = 'NA'
                         pValue1 = 'NA'
                 try:
                         extTDT2 = (self.bMax-self.cMin)**2/float(self.bMax+self.cMin)
-                        pValue2 = 1 - stats.chi2.cdf(extTDT2, 1)
+                        pValue2 = self.getChiSqPValue(extTDT2)
                 except ZeroDivisionError:
                         extTDT2 = 'NA'
                         pValue2 = 'NA'
@@ -283,6 +284,13 @@ class AutosomalMarker:
                 else:  #overlapping ranges of b and c
                         return [0,1,max(extTDT1,extTDT2),min(pValue1,pValue2)]
 
+	###P-values of the TDT (chi-square) and FBAT (Z) statistics
+	def getChiSqPValue(self,chiSq):
+		return chiSqPValue(chiSq)
+
+	def getNormPValue(self,Z):
+		return normPValue(Z)
+
 	###Get sample genotypes, only for pedigrees that the user wants to analyze
 	def getSampleGenotypes(self,vcfValues,pedMemberIndices):
 		for ped in pedMemberIndices.keys():
@@ -390,6 +398,21 @@ class AutosomalMarker:
 	                        	        print 'Unmatched trio type at ',self.markerID,': ',thisPed,' [',genoF,genoM,genoNB,']. Counting as MIE'
 		                                self.nMIE += 1
 
+	###Set Trio Type vectors from the counts of a TrioClassifier (see trioClassifier.py); same result as populateTrioTypeCountVectors
+	#counts is a dictionary of count matrices for a block of markers; row selects this marker. Also used by ChrXMarker.
+	def setTrioTypeCounts(self,counts,row=0):
+		for name in counts.keys():
+			setattr(self,name,counts[name][row].tolist())
+
+	###Set MAF and variant distribution from the allele and genotype counts of a TrioClassifier; same result as computeMAF and getVariantDistribution. Also used by ChrXMarker.
+	def setGenotypeSummary(self,refCount,altCount,nVariantType):
+		if refCount < altCount:
+			self.maf = refCount/float(refCount+altCount)
+		else:
+			self.maf = altCount/float(refCount+altCount)
+		self.nVariantType = nVariantType
+		self.nAlleles = [refCount,altCount]
+
 	def stdFBAT(self,MODEL,OFFSET):
 		#Default offset is 0.5 
 		#FBAT statistic has equal magnitude but opposite signs for the two alleles. 
@@ -419,7 +442,7 @@ class AutosomalMarker:
                 varU = self.caseVarU + self.controlVarU
                 try:
                 	self.Z_stdFBAT = U / float(math.sqrt(varU))
-                        self.pValue_stdFBAT = (1 - stats.norm.cdf(abs(self.Z_stdFBAT)))*2.0
+                        self.pValue_stdFBAT = self.getNormPValue(self.Z_stdFBAT)
                 except ZeroDivisionError:
                 	self.Z_stdFBAT = 'NA'
                         self.pValue_stdFBAT = 'NA'
@@ -470,7 +493,7 @@ class AutosomalMarker:
                 varUmin = caseVarUmin + controlVarUmin
                 try:
                 	self.minZ_extFBAT = Umin/float(math.sqrt(varUmin))
-                        self.minPValue_extFBAT = (1 - stats.norm.cdf(abs(self.minZ_extFBAT)))*2.0
+                        self.minPValue_extFBAT = self.getNormPValue(self.minZ_extFBAT)
                 except:
                 	self.minZ_extFBAT = 'NA'
                         self.minPValue_extFBAT = 'NA'
@@ -479,7 +502,7 @@ class AutosomalMarker:
                 varUmax = caseVarUmax + controlVarUmax
                 try:
                 	self.maxZ_extFBAT = Umax/float(math.sqrt(varUmax))
-                        self.maxPValue_extFBAT = (1 - stats.norm.cdf(abs(self.maxZ_extFBAT)))*2.0
+                        self.maxPValue_extFBAT = self.getNormPValue(self.maxZ_extFBAT)
                 except:
                 	self.maxZ_extFBAT = 'NA'
                         self.maxPValue_extFBAT = 'NA'
@@ -645,7 +668,7 @@ class ChrXMarker(AutosomalMarker):
 
                 try:
                         self.chiSq_StdTDT = (self.bComplete-self.cComplete)**2/float(self.bComplete+self.cComplete)
-                        self.pValue_StdTDT = 1 - stats.chi2.cdf(self.chiSq_StdTDT, 1)   #TODO: multiply by 2 for two-sided test??? (TODO for all tdt tests below)
+                        self.pValue_StdTDT = self.getChiSqPValue(self.chiSq_StdTDT)   #TODO: multiply by 2 for two-sided test??? (TODO for all tdt tests below)
                 except ZeroDivisionError:
                         self.chiSq_StdTDT = 'NA'
                         self.pValue_StdTDT = 'NA'
@@ -709,7 +732,7 @@ class ChrXMarker(AutosomalMarker):
                 varU = self.caseVarU + self.controlVarU
                 try:
                         self.Z_stdFBAT = U / float(math.sqrt(varU))
-                        self.pValue_stdFBAT = (1 - stats.norm.cdf(abs(self.Z_stdFBAT)))*2.0
+                        self.pValue_stdFBAT = self.getNormPValue(self.Z_stdFBAT)
                 except ZeroDivisionError:
                         self.Z_stdFBAT = 'NA'
                         self.pValue_stdFBAT = 'NA'
@@ -761,7 +784,7 @@ class ChrXMarker(AutosomalMarker):
                 varUmin = caseVarUmin + controlVarUmin
                 try:
                         self.minZ_extFBAT = Umin/float(math.sqrt(varUmin))
-                        self.minPValue_extFBAT = (1 - stats.norm.cdf(abs(self.minZ_extFBAT)))*2.0
+                        self.minPValue_extFBAT = self.getNormPValue(self.minZ_extFBAT)
                 except:
                         self.minZ_extFBAT = 'NA'
                         self.minPValue_extFBAT = 'NA'
@@ -770,7 +793,16 @@ class ChrXMarker(AutosomalMarker):
                 varUmax = caseVarUmax + controlVarUmax
                 try:
                         self.maxZ_extFBAT = Umax/float(math.sqrt(varUmax))
-                        self.maxPValue_extFBAT = (1 - stats.norm.cdf(abs(self.maxZ_extFBAT)))*2.0
+                        self.maxPValue_extFBAT = self.getNormPValue(self.maxZ_extFBAT)
                 except:
                         self.maxZ_extFBAT = 'NA'
                         self.maxPValue_extFBAT = 'NA'
+
+
+##Marker class of a marker id: ChrXMarker, AutosomalMarker, or None for markers that are not tested (chrM and chrY)
+def getMarkerClass(markerID):
+	if markerID.startswith('chrM') or markerID.startswith('chr25') or markerID.startswith('chrY') or markerID.startswith('chr24'):
+		return None
+	elif markerID.startswith('chrX') or markerID.startswith('chr23'):
+		return ChrXMarker
+	return AutosomalMarker
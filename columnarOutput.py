@@ -0,0 +1,152 @@
+import os
+import re
+import json
+import numpy as np
+
+#Columnar output (-out-format=npy): one .npy file per output column in a directory next to the text output, plus schema.json.
+#Columns are appended one block of markers at a time and the .npy headers are rewritten with the final number of rows when the run ends,
+#so every column can be loaded on its own with np.load(<file>,mmap_mode='r') (see readColumns).
+#Types: marker ids are fixed width byte strings, counts int32 (missing values -1), MAF, statistics and p-values float64 ('NA' is NaN).
+#Count vectors are (markers x length) matrices; chrX vectors are shorter than autosomal ones and padded with -1 (column isChrX tells them apart).
+
+SCHEMA_FILENAME = "schema.json"
+FORMAT_VERSION = 1
+MARKER_ID_WIDTH = 64
+NPY_HEADER_SIZE = 128             #fixed, so the header can be rewritten in place with the final shape
+
+##Column specifications (name, numpy dtype, width or None for scalars, missing value) of the output columns of scanTDT.py.
+#countVectorWidths gives the longest (autosomal) length of the count vector columns, keyed by output column name.
+def getColumnSpecs(outputColumns,countVectorWidths):
+	specs = [('isChrX','int8',None,-1)]
+	for name in outputColumns:
+		if name == 'MarkerID':
+			specs.append((name,'S%d' % MARKER_ID_WIDTH,None,''))
+		elif name == 'n[0/0,0/1,1/1,./.]':
+			specs.append((name,'int32',4,-1))
+		elif name in countVectorWidths:
+			specs.append((name,'int32',countVectorWidths[name],-1))
+		elif name == 'nMIE' or name.startswith('nPermutations'):
+			specs.append((name,'int32',None,-1))
+		else:
+			specs.append((name,'float64',None,np.nan))
+	return specs
+
+##File name of a column: its position and its name with characters other than letters, digits, '-' and '_' replaced
+def getColumnFilename(position,name):
+	return "%03d_%s.npy" % (position,re.sub(r'[^A-Za-z0-9_\-]+','_',name).strip('_'))
+
+##Typed column arrays of a block of output rows (lists in output column order, 'NA' for missing values)
+def toColumnArrays(rows,isChrX,specs):
+	arrays = [np.array(isChrX,dtype=np.int8)]
+	for column in range(len(specs)-1):
+		name,dtype,width,missing = specs[column+1]
+		values = [row[column] for row in rows]
+		if dtype.startswith('S'):
+			if values and max([len(value) for value in values]) > MARKER_ID_WIDTH:
+				raise ValueError("Marker ids longer than %d characters cannot be written with -out-format=npy" % MARKER_ID_WIDTH)
+			arrays.append(np.array(values,dtype=dtype))
+		elif width is not None:
+			array = np.empty((len(values),width),dtype=dtype)
+			array.fill(missing)
+			for x in range(len(values)):
+				array[x,:len(values[x])] = values[x]
+			arrays.append(array)
+		else:
+			arrays.append(np.array([missing if isinstance(value,str) else value for value in values],dtype=dtype))
+	return arrays
+
+##----------------------------------------------------------------------------------------------------------------------------------------------------
+class NpyColumnFile:
+
+	###METHODS
+	#nRows > 0 reopens a file written up to a checkpoint (-resume): rows after the first nRows are discarded
+	def __init__(self,filename,dtype,width,nRows=0):
+		self.dtype = np.dtype(dtype)
+		self.width = width
+		self.nRows = nRows
+		if nRows > 0:
+			self.file = open(filename,"r+b")
+			self.file.truncate(NPY_HEADER_SIZE+nRows*self.dtype.itemsize*(width or 1))
+		else:
+			self.file = open(filename,"wb")
+		self.writeHeader()
+
+	def getShape(self):
+		if self.width is None:
+			return (self.nRows,)
+		return (self.nRows,self.width)
+
+	def writeHeader(self):
+		header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (np.lib.format.dtype_to_descr(self.dtype),self.getShape())
+		prefix = np.lib.format.magic(1,0)+np.array([NPY_HEADER_SIZE-10],dtype='<u2').tostring()
+		self.file.seek(0)
+		self.file.write(prefix+header.ljust(NPY_HEADER_SIZE-len(prefix)-1)+"\n")
+
+	def append(self,array):
+		self.file.seek(0,os.SEEK_END)
+		self.file.write(np.ascontiguousarray(array,dtype=self.dtype).tostring())
+		self.nRows += len(array)
+
+	###Write the header with the rows appended so far and flush the file to disk
+	def flush(self):
+		self.writeHeader()
+		self.file.flush()
+		os.fsync(self.file.fileno())
+
+	def close(self):
+		self.writeHeader()
+		self.file.close()
+
+##----------------------------------------------------------------------------------------------------------------------------------------------------
+class ColumnarWriter:
+
+	###METHODS
+	#specs from getColumnSpecs; countVectorLengths: {'autosomal':{name:length},'chrX':{name:length}} is recorded in the schema.
+	#chunkRows are the rows per chunk already written when a run is resumed from a checkpoint (see checkpoint.py)
+	def __init__(self,directory,specs,countVectorLengths,chunkRows=[]):
+		self.directory = directory
+		self.specs = specs
+		self.countVectorLengths = countVectorLengths
+		self.chunkRows = list(chunkRows)
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+		self.files = [NpyColumnFile(os.path.join(directory,getColumnFilename(x,specs[x][0])),specs[x][1],specs[x][2],sum(self.chunkRows)) for x in range(len(specs))]
+
+	###Append a block of column arrays from toColumnArrays
+	def writeChunk(self,arrays):
+		for x in range(len(arrays)):
+			self.files[x].append(arrays[x])
+		self.chunkRows.append(len(arrays[0]))
+
+	###Flush all columns at a checkpoint
+	def flush(self):
+		for columnFile in self.files:
+			columnFile.flush()
+
+	###Write the final .npy headers and the schema
+	def close(self):
+		for columnFile in self.files:
+			columnFile.close()
+		columns = []
+		for x in range(len(self.specs)):
+			name,dtype,width,missing = self.specs[x]
+			column = {'name':name,'file':getColumnFilename(x,name),'dtype':np.lib.format.dtype_to_descr(np.dtype(dtype)),'shape':list(self.files[x].getShape()),
+				'missing':None if isinstance(missing,float) and np.isnan(missing) else missing}
+			if name in self.countVectorLengths['autosomal']:
+				column['lengths'] = {'autosomal':self.countVectorLengths['autosomal'][name],'chrX':self.countVectorLengths['chrX'][name]}
+			columns.append(column)
+		schema = {'formatVersion':FORMAT_VERSION,'nMarkers':sum(self.chunkRows),'chunkRows':self.chunkRows,'columns':columns,
+			'notes':"float64 columns use NaN for NA; missing int32 values are -1; chrX count vectors use the first 'chrX' entries of each row"}
+		schemaFile = open(os.path.join(self.directory,SCHEMA_FILENAME),"w")
+		json.dump(schema,schemaFile,indent=1)
+		schemaFile.write("\n")
+		schemaFile.close()
+
+##Memory-mapped arrays of the named columns (all columns if names is None) of a columnar output directory, keyed by column name
+def readColumns(directory,names=None):
+	schema = json.load(open(os.path.join(directory,SCHEMA_FILENAME),"r"))
+	columns = {}
+	for column in schema['columns']:
+		if names is None or column['name'] in names:
+			columns[column['name']] = np.load(os.path.join(directory,column['file']),mmap_mode='r')
+	return columns
@@ -0,0 +1,372 @@
+import os
+import sys
+import gzip
+import json
+import numpy as np
+from trioClassifier import countVectorNames
+from blockStatistics import computeBlockStatistics,getStatisticColumns,getSelectedModels
+from pValues import setPValueColumns,setBackend,BACKENDS
+from permutations import AdaptivePermutations,getPermutationColumns
+from columnarOutput import ColumnarWriter,getColumnSpecs,readColumns,SCHEMA_FILENAME
+from featureMatrixIndex import parseMarkerID
+
+"""
+Store of the trio type counts of each marker (scanTDT.py -save-counts), and re-analysis from the store alone.
+
+All the statistics of scanTDT.py (TDT, rTDT, FBAT, scanFBAT and the empirical p-values, for every model and offset) depend only on the
+trio type count vectors of a marker, so the store keeps the first output columns of scanTDT.py (marker id, MAF, genotype counts, the 12 count
+vectors and nMIE) as typed column arrays (see columnarOutput.py) and no genotypes. The re-analysis writes the output file scanTDT.py would
+write with the same input files and the given -test, -version, -model, -offset, -pvalue-backend and -permutations options, without reading
+the feature matrix again. Mendelian inconsistent trios are not listed (the store has no genotypes), nMIE is.
+
+Counts are additive over disjoint sets of trios, so the count stores of runs over different trios (cohort sites, sequencing batches) merge into
+the count store of one run over all of them. The store also keeps the allele counts behind the MAF and lists its trios (trios.txt). Merging
+is a streaming merge-join of the stores on marker id, in (chromosome, position, marker id) order: stores written from a sorted feature
+matrix are read in their stored order, others through a sorted index. Count vectors, nMIE, genotype and allele counts are summed and the MAF
+is recomputed from the allele counts. The merge stops when the stores share trios, when a marker is autosomal in one store and chrX in another,
+or when the trios counted at a marker (all count vectors and nMIE) differ from the other markers of its chromosome class in the same store.
+Markers missing from some of the stores are left out and reported.
+
+USAGE: python countStore.py -counts=<count store directory>[,<count store directory>...] [-merged=<merged count store directory>]
+	[-out=<output file> DEFAULT tdt.out.gz] [-test=tdt OR fbat] [-version=scan OR std] [-model=a,d,r] [-offset=<number in [0,1]> DEFAULT 0.5]
+	[-pvalue-backend=scipy OR gsl OR fast] [-block-size=<markers> DEFAULT 5000]
+	[-permutations=<number> [-permutation-hits=<number> DEFAULT 20] [-permutation-seed=<integer> DEFAULT 1]]
+Several count stores are first merged into the -merged directory (required), which can itself be merged with later batches.
+"""
+
+#stored columns, in the output column order of scanTDT.py: marker id, MAF, genotype counts, then the count vectors in the order of countVectorNames,
+#then the allele counts
+COUNT_VECTORS_START = 3
+ALLELE_COUNTS_COLUMN = 'nAlleles[ref,alt]'
+TRIOS_FILENAME = "trios.txt"
+#chromosome order of the merge: 1-22, X (23), Y (24), M (25), then other names
+CHROMOSOME_RANKS = dict([(str(x),x) for x in range(1,26)]+[('X',23),('Y',24),('M',25),('MT',25)])
+
+##Count store writer for the first len(countColumns) output columns of scanTDT.py and the allele counts; countVectorLengths as for ColumnarWriter.
+#pedIDs are the trios counted. chunkRows are the rows per chunk already written when a run is resumed from a checkpoint
+def createCountStore(directory,countColumns,countVectorLengths,pedIDs,chunkRows=[]):
+	specs = getCountStoreSpecs(countColumns,countVectorLengths)
+	countStore = ColumnarWriter(directory,specs,countVectorLengths,chunkRows)
+	writeTrios(directory,pedIDs)
+	return countStore
+
+def getCountStoreSpecs(countColumns,countVectorLengths):
+	assert(len(countColumns) == COUNT_VECTORS_START+len(countVectorNames))
+	return getColumnSpecs(countColumns,countVectorLengths['autosomal'])+[(ALLELE_COUNTS_COLUMN,'int32',2,-1)]
+
+def writeTrios(directory,pedIDs):
+	triosFile = open(os.path.join(directory,TRIOS_FILENAME),"w")
+	triosFile.write(''.join([pedID+'\n' for pedID in pedIDs]))
+	triosFile.close()
+
+##Trios of a count store, None when the store does not list them
+def readTrios(directory):
+	filename = os.path.join(directory,TRIOS_FILENAME)
+	if not os.path.exists(filename):
+		return None
+	return open(filename,"r").read().split()
+
+def readSchema(directory):
+	return json.load(open(os.path.join(directory,SCHEMA_FILENAME),"r"))
+
+##Count vector lengths of the autosomal and chrX markers of a store, keyed by column name
+def getStoredLengths(schema):
+	lengths = {'autosomal':{},'chrX':{}}
+	for column in schema['columns']:
+		if 'lengths' in column:
+			lengths['autosomal'][column['name']] = column['lengths']['autosomal']
+			lengths['chrX'][column['name']] = column['lengths']['chrX']
+	return lengths
+
+##Column specifications (as getColumnSpecs) of a stored schema
+def getStoredSpecs(schema):
+	specs = []
+	for column in schema['columns']:
+		missing = column['missing']
+		if missing is None:
+			missing = np.nan
+		specs.append((column['name'],column['dtype'],column['shape'][1] if len(column['shape']) > 1 else None,missing))
+	return specs
+
+##Merge order of a marker id: (chromosome rank, chromosome, position, marker id)
+def getMarkerSortKey(markerID):
+	chromosome,position = parseMarkerID(markerID)
+	if chromosome.startswith('chr'):
+		chromosome = chromosome[3:]
+	return (CHROMOSOME_RANKS.get(chromosome,len(CHROMOSOME_RANKS)+1),chromosome,position,markerID)
+
+##Output rows of the markers start:end of a count store (columns from readColumns, stored column names in schema order), with their statistics
+def getBlockRows(columns,names,lengths,start,end,TEST,VERSION,MODELS,OFFSET,permutationEngine):
+	isChrXBlock = np.asarray(columns['isChrX'][start:end]) == 1
+	markerIDs = [str(markerID) for markerID in columns[names[0]][start:end]]
+	rows = [None]*(end-start)
+	for isChrX in [False,True]:
+		indices = np.flatnonzero(isChrXBlock == isChrX)
+		if not len(indices):
+			continue
+		genderKey = 'chrX' if isChrX else 'autosomal'
+		counts = {}
+		for x in range(len(countVectorNames)):
+			name = names[COUNT_VECTORS_START+x]
+			values = np.asarray(columns[name][start:end])[indices]
+			if name in lengths[genderKey]:
+				values = values[:,:lengths[genderKey][name]]
+			counts[countVectorNames[x]] = values
+		statistics = computeBlockStatistics(counts,isChrX,TEST,VERSION,MODELS,OFFSET)
+		if permutationEngine:
+			empiricalPValues,nPermutations = permutationEngine.getEmpiricalPValues([markerIDs[x] for x in indices],counts,isChrX)
+			statistics = [statistics[row]+empiricalPValues[row] for row in range(len(indices))]
+		maf = np.asarray(columns[names[1]][start:end])[indices]
+		variantTypes = np.asarray(columns[names[2]][start:end])[indices]
+		for row in range(len(indices)):
+			rows[indices[row]] = [markerIDs[indices[row]],float(maf[row]),variantTypes[row].tolist()]+[counts[name][row].tolist() for name in countVectorNames]+statistics[row]
+	return rows
+
+##Write the output of scanTDT.py for the given options from a count store
+def reanalyzeCounts(directory,outputFilename,TEST,VERSION,MODELS,OFFSET,blockSize,permutationEngine):
+	schema = readSchema(directory)
+	names = [column['name'] for column in schema['columns'] if column['name'] <> 'isChrX'][:COUNT_VECTORS_START+len(countVectorNames)]
+	lengths = getStoredLengths(schema)
+	columns = readColumns(directory)
+
+	outputColumns = names+getStatisticColumns(TEST,VERSION,MODELS)
+	pValueColumns = [x for x in range(len(outputColumns)) if outputColumns[x].find("P-value") <> -1]
+	if permutationEngine:
+		outputColumns.extend(getPermutationColumns(TEST,MODELS))
+
+	outputFile = gzip.open(outputFilename,"w")
+	outputFile.write('\t'.join(outputColumns)+'\n')
+	for start in range(0,schema['nMarkers'],blockSize):
+		rows = getBlockRows(columns,names,lengths,start,min(start+blockSize,schema['nMarkers']),TEST,VERSION,MODELS,OFFSET,permutationEngine)
+		setPValueColumns(rows,outputColumns,pValueColumns)
+		outputFile.write(''.join(['\t'.join([str(value) for value in row])+'\n' for row in rows]))
+	outputFile.close()
+	return schema['nMarkers']
+
+##----------------------------------------------------------------------------------------------------------------------------------------------------
+#Markers of a count store in merge order, read one block of marker ids at a time
+class CountStoreCursor:
+
+	###METHODS
+	def __init__(self,directory,blockSize):
+		self.directory = directory
+		self.schema = readSchema(directory)
+		self.columns = readColumns(directory)
+		self.markerIDs = self.columns[self.schema['columns'][1]['name']]
+		self.nMarkers = self.schema['nMarkers']
+		self.blockSize = blockSize
+		self.order = self.getSortedOrder()
+		self.position = 0
+		self.loadBlock()
+
+	###None when the markers are stored in merge order, otherwise the sorted index of the markers (stable for repeated marker ids)
+	def getSortedOrder(self):
+		lastKey = None
+		for start in range(0,self.nMarkers,self.blockSize):
+			keys = [getMarkerSortKey(str(markerID)) for markerID in self.markerIDs[start:start+self.blockSize]]
+			if lastKey is not None and keys and keys[0] < lastKey:
+				break
+			if [x for x in range(len(keys)-1) if keys[x+1] < keys[x]]:
+				break
+			if keys:
+				lastKey = keys[-1]
+		else:
+			return None
+		keys = [getMarkerSortKey(str(markerID)) for markerID in self.markerIDs]
+		return np.array(sorted(range(self.nMarkers),key=keys.__getitem__),dtype=np.intp)
+
+	def loadBlock(self):
+		self.blockStart = self.position
+		if self.order is None:
+			self.blockIndices = np.arange(self.position,min(self.position+self.blockSize,self.nMarkers))
+		else:
+			self.blockIndices = self.order[self.position:self.position+self.blockSize]
+		self.blockKeys = [getMarkerSortKey(str(markerID)) for markerID in np.asarray(self.markerIDs)[self.blockIndices]]
+
+	###Merge key of the current marker, None after the last one
+	def peek(self):
+		if self.position >= self.nMarkers:
+			return None
+		return self.blockKeys[self.position-self.blockStart]
+
+	###Stored row of the current marker
+	def getIndex(self):
+		return self.blockIndices[self.position-self.blockStart]
+
+	def advance(self):
+		self.position += 1
+		if self.position-self.blockStart >= len(self.blockKeys) and self.position < self.nMarkers:
+			self.loadBlock()
+
+##Merge count stores of disjoint sets of trios into one count store (see the notes at the top). Raises ValueError when the stores cannot be merged.
+#Returns the number of markers merged and the number of markers of each store left out because they are missing from another store
+def mergeCountStores(directories,outputDirectory,blockSize):
+	cursors = [CountStoreCursor(directory,blockSize) for directory in directories]
+	schema = cursors[0].schema
+	layout = [(column['name'],column['dtype'],column['shape'][1:]) for column in schema['columns']]
+	for cursor in cursors:
+		if [(column['name'],column['dtype'],column['shape'][1:]) for column in cursor.schema['columns']] <> layout:
+			raise ValueError("The columns of count store "+cursor.directory+" differ from those of "+cursors[0].directory)
+		if ALLELE_COUNTS_COLUMN not in cursor.columns:
+			raise ValueError("Count store "+cursor.directory+" has no allele counts and cannot be merged; write it again with scanTDT.py -save-counts")
+
+	#the trio sets must be disjoint
+	pedIDs = set()
+	for cursor in cursors:
+		trios = readTrios(cursor.directory)
+		if trios is None:
+			raise ValueError("Count store "+cursor.directory+" does not list its trios ("+TRIOS_FILENAME+")")
+		sharedTrios = pedIDs & set(trios)
+		if sharedTrios:
+			raise ValueError(str(len(sharedTrios))+" trios of count store "+cursor.directory+" are also in another count store: "+",".join(sorted(sharedTrios)[:10]))
+		pedIDs |= set(trios)
+
+	specs = getStoredSpecs(schema)
+	lengths = getStoredLengths(schema)
+	writer = ColumnarWriter(outputDirectory,specs,lengths)
+	writeTrios(outputDirectory,sorted(pedIDs))
+	trioTotals = [{} for cursor in cursors]
+	blockIndices = [[] for cursor in cursors]
+	nMerged = 0
+	while True:
+		keys = [cursor.peek() for cursor in cursors]
+		presentKeys = [key for key in keys if key is not None]
+		if not presentKeys:
+			break
+		smallestKey = min(presentKeys)
+		if len(presentKeys) == len(cursors) and max(presentKeys) == smallestKey:
+			for x in range(len(cursors)):
+				blockIndices[x].append(cursors[x].getIndex())
+		for x in range(len(cursors)):
+			if keys[x] == smallestKey:
+				cursors[x].advance()
+		if len(blockIndices[0]) >= blockSize:
+			nMerged += writeMergedBlock(writer,cursors,blockIndices,specs,lengths,trioTotals)
+			blockIndices = [[] for cursor in cursors]
+	nMerged += writeMergedBlock(writer,cursors,blockIndices,specs,lengths,trioTotals)
+	writer.close()
+	#markers of each store that are missing from another store
+	nLeftOut = [cursors[x].nMarkers-nMerged for x in range(len(cursors))]
+	return nMerged,nLeftOut
+
+##Sum the stored rows blockIndices[store] of each store into one block of the merged count store
+def writeMergedBlock(writer,cursors,blockIndices,specs,lengths,trioTotals):
+	if not blockIndices[0]:
+		return 0
+	getColumn = lambda x,name: np.asarray(cursors[x].columns[name])[blockIndices[x]]
+	isChrX = getColumn(0,'isChrX')
+	for x in range(1,len(cursors)):
+		if (getColumn(x,'isChrX') <> isChrX).any():
+			raise ValueError("Markers of count store "+cursors[x].directory+" are not of the same chromosome class as in "+cursors[0].directory)
+	countNames = [spec[0] for spec in specs[1+COUNT_VECTORS_START:1+COUNT_VECTORS_START+len(countVectorNames)]]
+	sums = {}
+	for x in range(len(cursors)):
+		#trios counted at each marker of this store: all count vectors (without the -1 padding of chrX markers) and nMIE
+		totals = np.zeros(len(isChrX),dtype=np.int64)
+		for name in countNames:
+			values = getColumn(x,name).astype(np.int64)
+			values = np.maximum(values,0)
+			totals += values.sum(axis=1) if values.ndim > 1 else values
+			sums[name] = sums.get(name,0)+values
+		for chromosomeClass in [0,1]:
+			classTotals = totals[isChrX == chromosomeClass]
+			if not len(classTotals):
+				continue
+			expected = trioTotals[x].setdefault(chromosomeClass,classTotals[0])
+			inconsistent = np.flatnonzero(classTotals <> expected)
+			if len(inconsistent):
+				markerID = str(getColumn(x,specs[1][0])[isChrX == chromosomeClass][inconsistent[0]])
+				raise ValueError("Count store "+cursors[x].directory+": "+str(classTotals[inconsistent[0]])+" trios are counted at "+markerID+", "+str(expected)+" at other markers")
+		for name in [specs[3][0],ALLELE_COUNTS_COLUMN]:
+			sums[name] = sums.get(name,0)+getColumn(x,name).astype(np.int64)
+
+	#count vectors of chrX markers keep their padding
+	for name in lengths['chrX']:
+		sums[name][isChrX == 1,lengths['chrX'][name]:] = -1
+	refCounts = sums[ALLELE_COUNTS_COLUMN][:,0]
+	altCounts = sums[ALLELE_COUNTS_COLUMN][:,1]
+	sums[specs[2][0]] = np.where(refCounts < altCounts,refCounts,altCounts)/(refCounts+altCounts).astype(np.float64)
+	arrays = []
+	for name,dtype,width,missing in specs:
+		if name in sums:
+			arrays.append(sums[name].astype(dtype))
+		else:
+			arrays.append(getColumn(0,name))
+	writer.writeChunk(arrays)
+	return len(isChrX)
+
+if __name__ == "__main__":
+	COUNTS_DIRECTORIES = []
+	MERGED_DIRECTORY = ""
+	OUTPUT_FILENAME = "tdt.out.gz"
+	TEST = ""
+	VERSION = ""
+	MODELS = []
+	OFFSET = 0.5
+	PVALUE_BACKEND = "scipy"
+	BLOCK_SIZE = 5000
+	PERMUTATIONS = 0
+	PERMUTATION_HITS = 20
+	PERMUTATION_SEED = 1
+	while len(sys.argv) > 1:
+		thisArg = sys.argv.pop(1)
+		if thisArg.find("=") == -1:
+			print 'Unrecognised argument: '+thisArg
+			sys.exit(1)
+		name,value = thisArg.split("=")
+		name = name.lower().strip("- ")
+		if name == "counts":
+			COUNTS_DIRECTORIES = [x.strip(" ") for x in value.split(",") if x.strip(" ")]
+		elif name == "merged":
+			MERGED_DIRECTORY = value.strip(" ")
+		elif name == "out":
+			OUTPUT_FILENAME = value.strip(" ")
+		elif name == "test":
+			TEST = value.lower().strip(" ")
+		elif name == "version":
+			VERSION = value.lower().strip(" ")
+		elif name == "model":
+			MODELS = value.lower().strip(" ").split(",")
+		elif name == "offset":
+			OFFSET = float(value.strip(" "))
+		elif name == "pvalue-backend":
+			PVALUE_BACKEND = value.lower().strip(" ")
+		elif name == "block-size":
+			BLOCK_SIZE = int(value.strip(" "))
+		elif name == "permutations":
+			PERMUTATIONS = int(float(value.strip(" ")))
+		elif name == "permutation-hits":
+			PERMUTATION_HITS = int(value.strip(" "))
+		elif name == "permutation-seed":
+			PERMUTATION_SEED = int(value.strip(" "))
+		else:
+			print "unrecognized option:", name
+			sys.exit(1)
+	assert (COUNTS_DIRECTORIES), 'Count store directory was not provided'
+	assert (len(COUNTS_DIRECTORIES) == 1 or MERGED_DIRECTORY <> ""), 'Merged count store directory (-merged) was not provided'
+	if MODELS and not getSelectedModels(MODELS):
+		print "Unrecognised model: "+",".join(MODELS)
+		sys.exit(1)
+	if PVALUE_BACKEND not in BACKENDS:
+		print "Unrecognised p-value backend: "+PVALUE_BACKEND
+		sys.exit(1)
+	if not OUTPUT_FILENAME.endswith(".gz"):
+		OUTPUT_FILENAME = OUTPUT_FILENAME+".gz"
+	setBackend(PVALUE_BACKEND)
+	permutationEngine = None
+	if PERMUTATIONS > 0:
+		permutationEngine = AdaptivePermutations(PERMUTATIONS,PERMUTATION_HITS,PERMUTATION_SEED,TEST,MODELS,OFFSET)
+	countsDirectory = COUNTS_DIRECTORIES[0]
+	if len(COUNTS_DIRECTORIES) > 1:
+		try:
+			nMerged,nLeftOut = mergeCountStores(COUNTS_DIRECTORIES,MERGED_DIRECTORY,BLOCK_SIZE)
+		except ValueError as e:
+			print 'Cannot merge the count stores:',e
+			sys.exit(1)
+		for x in range(len(COUNTS_DIRECTORIES)):
+			if nLeftOut[x]:
+				print nLeftOut[x],'markers of',COUNTS_DIRECTORIES[x],'are missing from another count store and are left out'
+		print 'Merged',nMerged,'markers of',len(COUNTS_DIRECTORIES),'count stores into',MERGED_DIRECTORY
+		countsDirectory = MERGED_DIRECTORY
+	nMarkers = reanalyzeCounts(countsDirectory,OUTPUT_FILENAME,TEST,VERSION,MODELS,OFFSET,BLOCK_SIZE,permutationEngine)
+	print 'Wrote',nMarkers,'markers to',OUTPUT_FILENAME
@@ -0,0 +1,240 @@
+import sys
+import gzip
+import zlib
+import struct
+
+"""
+Indexed random access to the feature matrix.
+
+The feature matrix is rewritten in BGZF format: a series of gzip members of at most 64 KB of uncompressed data each,
+so that the file is still a valid gzip file (gzip.open, zcat) but can also be read from any block.
+The index (<feature matrix>.fmi) lists runs of consecutive marker lines of the same chromosome with their smallest and largest
+position and the virtual offset of their first line (compressed offset of the block << 16 | offset within the block),
+so a chromosome or region can be read without decompressing the rest of the genome. Marker lines do not need to be sorted.
+
+USAGE: python featureMatrixIndex.py -fm=<featurematrix.txt[.gz]> -out=<featurematrix.bgz> [-index-interval=<lines per index record> DEFAULT 256]
+"""
+
+INDEX_SUFFIX = ".fmi"
+INDEX_INTERVAL = 256                  #maximum number of marker lines per index record
+
+#BGZF blocks hold at most 0xff00 bytes of uncompressed data (as in samtools)
+BGZF_BLOCK_SIZE = 0xff00
+BGZF_HEADER = struct.Struct("<4BI2BH2BHH")
+BGZF_EOF = "1f8b08040000000000ff0600424302001b0003000000000000000000".decode("hex")
+
+##----------------------------------------------------------------------------------------------------------------------------------------------------
+class BgzfWriter:
+
+	###METHODS
+	def __init__(self,filename):
+		self.file = open(filename,"wb")
+		self.buffer = ""
+		self.compressedOffset = 0
+
+	def write(self,data):
+		self.buffer += data
+		while len(self.buffer) >= BGZF_BLOCK_SIZE:
+			self.writeBlock(self.buffer[:BGZF_BLOCK_SIZE])
+			self.buffer = self.buffer[BGZF_BLOCK_SIZE:]
+
+	###Virtual offset of the next byte written
+	def tell(self):
+		return (self.compressedOffset << 16) | len(self.buffer)
+
+	def writeBlock(self,data):
+		compressor = zlib.compressobj(6,zlib.DEFLATED,-15)
+		compressedData = compressor.compress(data) + compressor.flush()
+		#BSIZE is stored in 16 bits: split blocks that do not compress
+		if len(compressedData) + 25 > 0xffff:
+			self.writeBlock(data[:len(data)/2])
+			self.writeBlock(data[len(data)/2:])
+			return
+		blockSize = len(compressedData) + 26
+		self.file.write(BGZF_HEADER.pack(31,139,8,4,0,0,255,6,66,67,2,blockSize-1))
+		self.file.write(compressedData)
+		self.file.write(struct.pack("<II",zlib.crc32(data) & 0xffffffff,len(data)))
+		self.compressedOffset += blockSize
+
+	def close(self):
+		if self.buffer:
+			self.writeBlock(self.buffer)
+			self.buffer = ""
+		self.file.write(BGZF_EOF)
+		self.file.close()
+
+
+##----------------------------------------------------------------------------------------------------------------------------------------------------
+class BgzfReader:
+
+	###METHODS
+	def __init__(self,filename):
+		self.file = open(filename,"rb")
+		self.loadBlock(0)
+
+	###Decompress the block starting at the given compressed offset
+	def loadBlock(self,blockOffset):
+		self.file.seek(blockOffset)
+		header = self.file.read(BGZF_HEADER.size)
+		if len(header) < BGZF_HEADER.size:
+			self.block = ""
+			self.blockOffset = self.nextBlockOffset = blockOffset
+			self.withinBlockOffset = 0
+			return
+		id1,id2,cm,flg,mtime,xfl,os,xlen,si1,si2,slen,bsize = BGZF_HEADER.unpack(header)
+		if id1 <> 31 or id2 <> 139 or si1 <> 66 or si2 <> 67:
+			raise IOError("Not a BGZF file (rewrite it with featureMatrixIndex.py)")
+		compressedData = self.file.read(bsize+1-BGZF_HEADER.size-8)
+		self.file.read(8)
+		self.block = zlib.decompress(compressedData,-15)
+		self.blockOffset = blockOffset
+		self.nextBlockOffset = blockOffset+bsize+1
+		self.withinBlockOffset = 0
+
+	def seek(self,virtualOffset):
+		self.loadBlock(virtualOffset >> 16)
+		self.withinBlockOffset = virtualOffset & 0xffff
+
+	def tell(self):
+		return (self.blockOffset << 16) | self.withinBlockOffset
+
+	def readline(self):
+		pieces = []
+		while True:
+			if self.withinBlockOffset >= len(self.block):
+				if self.nextBlockOffset == self.blockOffset:
+					break
+				self.loadBlock(self.nextBlockOffset)
+				if not self.block and self.nextBlockOffset == self.blockOffset:
+					break
+				continue
+			end = self.block.find("\n",self.withinBlockOffset)
+			if end == -1:
+				pieces.append(self.block[self.withinBlockOffset:])
+				self.withinBlockOffset = len(self.block)
+			else:
+				pieces.append(self.block[self.withinBlockOffset:end+1])
+				self.withinBlockOffset = end+1
+				break
+		return "".join(pieces)
+
+	def __iter__(self):
+		while True:
+			line = self.readline()
+			if not line:
+				break
+			yield line
+
+	def close(self):
+		self.file.close()
+
+
+##Chromosome and position of a marker id <chr:position>
+def parseMarkerID(markerID):
+	chromosome,separator,position = markerID.partition(":")
+	#split multi-allelic VCF markers are <chr:position:ALT>
+	position = position.partition(":")[0]
+	if position.isdigit():
+		return chromosome,int(position)
+	return chromosome,0
+
+##Region option <chr> or <chr:start-end> as (chromosome,start,end); start and end are inclusive, None when not given
+def parseRegion(region):
+	chromosome,separator,positions = region.strip().partition(":")
+	if not positions:
+		return chromosome,None,None
+	start,separator,end = positions.replace(",","").partition("-")
+	return chromosome,int(start),int(end) if end else None
+
+##Rewrite a feature matrix as BGZF and write its index
+def indexFeatureMatrix(inputFilename,outputFilename,indexInterval=INDEX_INTERVAL):
+	if inputFilename.endswith("gz"):
+		inputFile = gzip.open(inputFilename,"r")
+	else:
+		inputFile = open(inputFilename,"r")
+	outputFile = BgzfWriter(outputFilename)
+	indexFile = open(outputFilename+INDEX_SUFFIX,"w")
+	indexFile.write("#chromosome\tminPosition\tmaxPosition\tvirtualOffset\tnLines\n")
+
+	#header rows: trio ids and member types
+	outputFile.write(inputFile.readline())
+	outputFile.write(inputFile.readline())
+
+	record = None
+	for line in inputFile:
+		chromosome,position = parseMarkerID(line[:line.find("\t")])
+		if record is None or record[0] <> chromosome or record[4] >= indexInterval:
+			if record:
+				indexFile.write("\t".join([str(x) for x in record])+"\n")
+			record = [chromosome,position,position,outputFile.tell(),0]
+		record[1] = min(record[1],position)
+		record[2] = max(record[2],position)
+		record[4] += 1
+		outputFile.write(line)
+	if record:
+		indexFile.write("\t".join([str(x) for x in record])+"\n")
+
+	inputFile.close()
+	outputFile.close()
+	indexFile.close()
+
+##Read the index of a feature matrix as a list of [chromosome,minPosition,maxPosition,virtualOffset,nLines], in file order
+def readIndex(filename):
+	records = []
+	for line in open(filename+INDEX_SUFFIX,"r"):
+		if line.startswith("#"):
+			continue
+		columns = line.rstrip("\n").split("\t")
+		records.append([columns[0],int(columns[1]),int(columns[2]),int(columns[3]),int(columns[4])])
+	return records
+
+##Check whether a marker id <chr:position> falls in any of the regions
+def isInRegions(markerID,regions):
+	chromosome,position = parseMarkerID(markerID)
+	return any(chromosome in [regionChromosome,"chr"+regionChromosome] and (start is None or position >= start) and (end is None or position <= end) for regionChromosome,start,end in regions)
+
+##Marker lines of an indexed feature matrix that fall in any of the regions, in file order
+#regions is a list of (chromosome,start,end) as returned by parseRegion. A chromosome given without the 'chr' prefix also matches.
+def readRegionLines(reader,records,regions):
+	for chromosome,minPosition,maxPosition,virtualOffset,nLines in records:
+		recordRegions = [(start,end) for regionChromosome,start,end in regions if chromosome in [regionChromosome,"chr"+regionChromosome] and (start is None or maxPosition >= start) and (end is None or minPosition <= end)]
+		if not recordRegions:
+			continue
+		reader.seek(virtualOffset)
+		for lineNumber in range(nLines):
+			line = reader.readline()
+			position = parseMarkerID(line[:line.find("\t")])[1]
+			if any((start is None or position >= start) and (end is None or position <= end) for start,end in recordRegions):
+				yield line
+
+##All marker lines of the given index records, in record order
+def readRecordLines(reader,records):
+	for chromosome,minPosition,maxPosition,virtualOffset,nLines in records:
+		reader.seek(virtualOffset)
+		for lineNumber in range(nLines):
+			yield reader.readline()
+
+
+if __name__ == "__main__":
+	FM_FILENAME = ""
+	OUTPUT_FILENAME = ""
+	while len(sys.argv) > 1:
+		thisArg = sys.argv.pop(1)
+		if thisArg.find("=") == -1:
+			print 'Unrecognised argument: '+thisArg
+			sys.exit(1)
+		name,value = thisArg.split("=")
+		name = name.lower().strip("- ")
+		if name == "fm":
+			FM_FILENAME = value.strip(" ")
+		elif name == "out":
+			OUTPUT_FILENAME = value.strip(" ")
+		elif name == "index-interval":
+			INDEX_INTERVAL = int(value.strip(" "))
+		else:
+			print "unrecognized option:", name
+			sys.exit(1)
+	assert (FM_FILENAME <> ""), 'Feature matrix path was not provided'
+	assert (OUTPUT_FILENAME <> ""), 'Output path was not provided'
+	indexFeatureMatrix(FM_FILENAME,OUTPUT_FILENAME,INDEX_INTERVAL)
+	print 'Wrote',OUTPUT_FILENAME,'and',OUTPUT_FILENAME+INDEX_SUFFIX
@@ -0,0 +1,59 @@
+import sys
+import numpy as np
+from trioClassifier import genotypeCodes,GENOTYPE_NA,GENOTYPE_INVALID
+
+#Block reader for the text feature matrix.
+#A chunk of marker lines is converted into an array of marker ids and a preallocated (nMarkers x nSamples) int8 genotype matrix
+#(0, 1, 2, GENOTYPE_NA, GENOTYPE_INVALID for anything else). When every genotype of a line is a single character once 'NA' is replaced,
+#the line is a string of alternating genotype and tab bytes, so the genotypes of all such lines are decoded in bulk with np.frombuffer
+#and a byte look-up table. Other lines (longer tokens, missing or extra columns) are split field by field.
+
+NA_BYTE = '#'
+TAB_BYTE = ord('\t')
+
+#genotype of each byte value
+byteGenotypes = np.repeat(np.int8(GENOTYPE_INVALID),256)
+for genotype,code in genotypeCodes.items():
+	if len(genotype) == 1:
+		byteGenotypes[ord(genotype)] = code
+byteGenotypes[ord(NA_BYTE)] = GENOTYPE_NA
+
+##Parse marker lines into (markerIDs, genotypes). nSamples is the number of sample columns of the feature matrix header.
+def parseMarkerLines(lines,nSamples):
+	markerIDs = []
+	genotypes = np.empty((len(lines),nSamples),dtype=np.int8)
+	bulkRows = []
+	bulkValues = []
+	otherRows = []
+	for row in range(len(lines)):
+		line = lines[row]
+		tab = line.find('\t')
+		if tab == -1:
+			markerIDs.append(line.strip())
+			otherRows.append(row)
+			continue
+		markerIDs.append(line[:tab].strip())
+		values = line[tab+1:].rstrip()
+		if NA_BYTE not in values:
+			values = values.replace('NA',NA_BYTE)
+			if len(values) == 2*nSamples-1:
+				bulkRows.append(row)
+				bulkValues.append(values+'\t')
+				continue
+		otherRows.append(row)
+
+	if bulkRows:
+		bulkBytes = np.frombuffer(''.join(bulkValues),dtype=np.uint8).reshape(len(bulkRows),2*nSamples)
+		#every other byte must be a tab, otherwise a token was not a single character
+		isBulk = (bulkBytes[:,1::2] == TAB_BYTE).all(axis=1)
+		rows = np.array(bulkRows,dtype=np.intp)
+		genotypes[rows[isBulk]] = byteGenotypes[bulkBytes[isBulk,::2]]
+		otherRows.extend(rows[~isBulk].tolist())
+
+	for row in otherRows:
+		values = lines[row].strip().split('\t')[1:]
+		if len(values) < nSamples:
+			print 'Marker ',markerIDs[row],' has ',len(values),' genotypes, ',nSamples,' expected.'
+			sys.exit(1)
+		genotypes[row] = [genotypeCodes.get(v,GENOTYPE_INVALID) for v in values[:nSamples]]
+	return markerIDs,genotypes
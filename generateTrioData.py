@@ -0,0 +1,134 @@
+import sys
+import gzip
+import numpy as np
+
+"""
+Synthetic trio data for benchmarks: a feature matrix, a phenotype file and a gender file.
+
+Parent genotypes are drawn under Hardy-Weinberg equilibrium from each marker's minor allele frequency, and offspring genotypes by
+transmitting one random allele of each parent (on chrX, fathers and male offspring are hemizygous and coded 0/1, male offspring
+receive a maternal allele and female offspring the paternal X). A fraction of the offspring genotypes are then replaced by a
+genotype that cannot be inherited from the parents (Mendelian inheritance errors) and genotypes are set to NA at random.
+
+USAGE: python generateTrioData.py -out=<prefix> [-trios=<number of trios> DEFAULT 1000] [-markers=<number of markers> DEFAULT 10000]
+	[-maf-spectrum=neutral OR uniform OR <maf>:<weight>,... DEFAULT neutral] [-min-maf=<smallest MAF> DEFAULT 0.001]
+	[-missing=<NA rate per genotype> DEFAULT 0.01] [-mie-rate=<Mendelian error rate per trio> DEFAULT 0.001]
+	[-case-control-ratio=<cases per control> DEFAULT 1] [-chrx-fraction=<fraction of chrX markers> DEFAULT 0.05] [-seed=<random seed> DEFAULT 1]
+Writes <prefix>.fm (or <prefix>.fm.gz with -gzip=1), <prefix>.pheno and <prefix>.gender.
+"""
+
+MARKER_BATCH_SIZE = 1000          #markers generated at a time
+AUTOSOMES = ["chr"+str(x) for x in range(1,23)]
+genotypeStrings = np.array(['0','1','2','NA'])
+
+##Minor allele frequencies of nMarkers markers.
+#neutral: density proportional to 1/maf between minMAF and 0.5 (most markers rare, as in sequencing data); uniform: uniform between minMAF and 0.5;
+#otherwise a list <maf>:<weight>,... of MAF values drawn with the given weights.
+def drawMAFs(random,nMarkers,mafSpectrum,minMAF):
+	if mafSpectrum == "neutral":
+		return minMAF*(0.5/minMAF)**random.random_sample(nMarkers)
+	if mafSpectrum == "uniform":
+		return random.uniform(minMAF,0.5,nMarkers)
+	mafs,weights = zip(*[[float(x) for x in value.split(":")] for value in mafSpectrum.split(",")])
+	weights = np.array(weights)/sum(weights)
+	return np.array(mafs)[random.choice(len(mafs),nMarkers,p=weights)]
+
+##Genotypes (nMarkers x nTrios allele counts) of the fathers, mothers and offspring of a batch of markers of the same chromosome class.
+#isMale is the offspring gender of each trio (used on chrX).
+def drawTrioGenotypes(random,mafs,nTrios,isChrX,isMale,mieRate):
+	shape = (len(mafs),nTrios)
+	maf = mafs.reshape(-1,1)
+	fatherAlleles = (random.random_sample((2,)+shape) < maf).astype(np.int8)
+	motherAlleles = (random.random_sample((2,)+shape) < maf).astype(np.int8)
+	#one allele of each parent is transmitted
+	fatherTransmitted = np.where(random.random_sample(shape) < 0.5,fatherAlleles[0],fatherAlleles[1])
+	motherTransmitted = np.where(random.random_sample(shape) < 0.5,motherAlleles[0],motherAlleles[1])
+	mothers = motherAlleles.sum(axis=0)
+	if isChrX:
+		fathers = fatherAlleles[0]
+		#male offspring receive their X from the mother, female offspring also receive the father's X
+		offspring = np.where(isMale,motherTransmitted,fatherAlleles[0]+motherTransmitted)
+		lowest = np.where(isMale,0,fathers) + (mothers == 2)
+		highest = np.where(isMale,0,fathers) + (mothers >= 1)
+		largestGenotype = np.where(isMale,1,2)
+	else:
+		fathers = fatherAlleles.sum(axis=0)
+		offspring = fatherTransmitted + motherTransmitted
+		lowest = (fathers == 2) + (mothers == 2)
+		highest = (fathers >= 1) + (mothers >= 1)
+		largestGenotype = 2
+	#Mendelian errors: an offspring genotype above the largest or below the smallest one the parents can transmit (not possible when every genotype can be inherited)
+	isMIE = random.random_sample(shape) < mieRate
+	mieGenotypes = np.where(highest < largestGenotype,largestGenotype,np.where(lowest > 0,0,offspring))
+	offspring = np.where(isMIE,mieGenotypes,offspring)
+	return fathers,mothers,offspring
+
+##Write the feature matrix, phenotype and gender files of a synthetic data set
+def generateTrioData(prefix,nTrios,nMarkers,mafSpectrum="neutral",minMAF=0.001,missingRate=0.01,mieRate=0.001,caseControlRatio=1.0,chrXFraction=0.05,seed=1,compress=False):
+	random = np.random.RandomState(seed)
+	pedIDs = ["T"+str(x) for x in range(nTrios)]
+	isMale = random.random_sample(nTrios) < 0.5
+	isCase = random.random_sample(nTrios) < caseControlRatio/(1.0+caseControlRatio)
+
+	phenoFile = open(prefix+".pheno","w")
+	genderFile = open(prefix+".gender","w")
+	for x in range(nTrios):
+		phenoFile.write(pedIDs[x]+"\t"+("2" if isCase[x] else "1")+"\n")
+		genderFile.write(pedIDs[x]+"\t"+("1" if isMale[x] else "2")+"\n")
+	phenoFile.close()
+	genderFile.close()
+
+	fmFilename = prefix+".fm.gz" if compress else prefix+".fm"
+	fmFile = gzip.open(fmFilename,"w") if compress else open(fmFilename,"w")
+	fmFile.write("\t".join(["PED_ID"]+[x for pedID in pedIDs for x in [pedID]*3])+"\n")
+	fmFile.write("\t".join(["MEMBER_TYPE"]+['1','2','3']*nTrios)+"\n")
+
+	#chrX markers are spread at random over the file, autosomal markers are numbered along chr1..chr22
+	isChrXMarker = random.random_sample(nMarkers) < chrXFraction
+	autosomalMarkers = np.cumsum(~isChrXMarker)-1
+	markerIDs = []
+	for x in range(nMarkers):
+		if isChrXMarker[x]:
+			markerIDs.append("chrX:"+str(100*(x+1)))
+		else:
+			chromosome = AUTOSOMES[autosomalMarkers[x]*len(AUTOSOMES)/max(1,nMarkers)]
+			markerIDs.append(chromosome+":"+str(100*(x+1)))
+
+	for start in range(0,nMarkers,MARKER_BATCH_SIZE):
+		end = min(start+MARKER_BATCH_SIZE,nMarkers)
+		mafs = drawMAFs(random,end-start,mafSpectrum,minMAF)
+		genotypes = np.empty((end-start,3*nTrios),dtype=np.int8)
+		for isChrX in [False,True]:
+			rows = np.nonzero(isChrXMarker[start:end] == isChrX)[0]
+			if len(rows):
+				fathers,mothers,offspring = drawTrioGenotypes(random,mafs[rows],nTrios,isChrX,isMale,mieRate)
+				genotypes[rows,0::3] = fathers
+				genotypes[rows,1::3] = mothers
+				genotypes[rows,2::3] = offspring
+		genotypes[random.random_sample(genotypes.shape) < missingRate] = 3
+		cells = genotypeStrings[genotypes]
+		fmFile.write("".join([markerIDs[start+row]+"\t"+"\t".join(cells[row])+"\n" for row in range(end-start)]))
+	fmFile.close()
+	return fmFilename,prefix+".pheno",prefix+".gender"
+
+
+if __name__ == "__main__":
+	OUTPUT_PREFIX = ""
+	options = {"trios":1000,"markers":10000,"maf-spectrum":"neutral","min-maf":0.001,"missing":0.01,"mie-rate":0.001,"case-control-ratio":1.0,"chrx-fraction":0.05,"seed":1,"gzip":0}
+	while len(sys.argv) > 1:
+		thisArg = sys.argv.pop(1)
+		if thisArg.find("=") == -1:
+			print 'Unrecognised argument: '+thisArg
+			sys.exit(1)
+		name,value = thisArg.split("=")
+		name = name.lower().strip("- ")
+		if name == "out":
+			OUTPUT_PREFIX = value.strip(" ")
+		elif name in options:
+			options[name] = type(options[name])(value.strip(" "))
+		else:
+			print "unrecognized option:", name
+			sys.exit(1)
+	assert (OUTPUT_PREFIX <> ""), 'Output prefix was not provided'
+	filenames = generateTrioData(OUTPUT_PREFIX,options["trios"],options["markers"],options["maf-spectrum"],options["min-maf"],options["missing"],options["mie-rate"],options["case-control-ratio"],options["chrx-fraction"],options["seed"],options["gzip"] == 1)
+	print 'Wrote',", ".join(filenames)
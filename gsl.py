@@ -14,22 +14,40 @@ GSL_LIBNAME   = find_library('gsl')
 
 # Load the BLAS implementation on which GSL depends (but we do not).
 # On Windohs the RTLD_GLOBAL flag will be ignored.
-c.CDLL(CBLAS_LIBNAME,mode=c.RTLD_GLOBAL)
-libgsl = c.CDLL(GSL_LIBNAME)
+# When libgsl is not installed, available is False and the functions below are None,
+# so that importers can fall back to another implementation.
+available = False
+libgsl = None
+norm_cdf = chi2_cdf = norm_sf = chi2_sf = None
+if GSL_LIBNAME is not None:
+	try:
+		if CBLAS_LIBNAME is not None:
+			c.CDLL(CBLAS_LIBNAME,mode=c.RTLD_GLOBAL)
+		libgsl = c.CDLL(GSL_LIBNAME)
 
-# Get "pointers" to the desired functions from libgsl
-norm_cdf = libgsl.gsl_cdf_ugaussian_P
-chi2_cdf = libgsl.gsl_cdf_chisq_P
+		# Get "pointers" to the desired functions from libgsl
+		# (lower tail P and upper tail Q versions)
+		norm_cdf = libgsl.gsl_cdf_ugaussian_P
+		chi2_cdf = libgsl.gsl_cdf_chisq_P
+		norm_sf  = libgsl.gsl_cdf_ugaussian_Q
+		chi2_sf  = libgsl.gsl_cdf_chisq_Q
+		available = True
+	except (OSError,AttributeError):
+		libgsl = None
+		norm_cdf = chi2_cdf = norm_sf = chi2_sf = None
 
-# Inform Python that both functions take and return doubles
-# (ctypes defaults everything to int's unless otherwise informed.)
-norm_cdf.argtypes = [ c.c_double, ]
-norm_cdf.restype  =   c.c_double
-chi2_cdf.argtypes = [ c.c_double, c.c_double ]
-chi2_cdf.restype  =   c.c_double
+if available:
+	# Inform Python that the functions take and return doubles
+	# (ctypes defaults everything to int's unless otherwise informed.)
+	for function in [norm_cdf,norm_sf]:
+		function.argtypes = [ c.c_double, ]
+		function.restype  =   c.c_double
+	for function in [chi2_cdf,chi2_sf]:
+		function.argtypes = [ c.c_double, c.c_double ]
+		function.restype  =   c.c_double
 
 # The C functions are now available to importers of this module as
-# gsl.norm_cdf and gsl.chi2_cdf.
+# gsl.norm_cdf, gsl.chi2_cdf, gsl.norm_sf and gsl.chi2_sf.
 
 """
 Historical record.
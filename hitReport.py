@@ -0,0 +1,70 @@
+import heapq
+
+#Hit report of scanTDT.py (-report-pvalue, -top-k): the markers whose p-value in one output column (-report-column, DEFAULT the first p-value
+#column) is at most a threshold, and/or the K markers with the smallest such p-values, written to a small hits file with the header and columns
+#of the text output, sorted by that p-value (equal p-values in input order). 'NA' p-values are never hits.
+#Each block of output rows is reduced where it is computed (in the worker processes with -workers): rows above the threshold are dropped, and
+#only the K smallest p-values of a block can be among the K smallest of the run, so only those rows are formatted and sent to the main process.
+#The main process keeps the K smallest seen so far in a bounded heap. Rows that pass the threshold and enter the heap are also appended to the
+#hits file as they arrive, in input order, so that checkpoints cover them like the skip file; -resume reads them back into the heap. At the end
+#of the run, the hits file is rewritten with the hits only.
+#p-values are compared as written in the output (their str), so that a resumed run, which reads them back from the hits file, selects the same rows.
+
+##----------------------------------------------------------------------------------------------------------------------------------------------------
+class HitReport:
+
+	###METHODS
+	#column is the index of the p-value column in the output rows; threshold None for no threshold, topK 0 for all the markers under it
+	def __init__(self,column,threshold=None,topK=0):
+		self.column = column
+		self.threshold = threshold
+		self.topK = topK
+		self.heap = []                #(-pValue,-rank,row text) of the rows kept; a list of (pValue,rank,row text) without -top-k
+		self.nCandidates = 0          #rank of the next candidate row, in input order
+
+	def getDescription(self):
+		description = []
+		if self.threshold is not None:
+			description.append('P <= '+str(self.threshold))
+		if self.topK > 0:
+			description.append('top '+str(self.topK))
+		return ', '.join(description)
+
+	###Candidate rows of a block of output rows (lists with their p-values set), in input order, as (pValue,row index).
+	def selectBlockRows(self,rows):
+		candidates = []
+		for x in range(len(rows)):
+			value = rows[x][self.column]
+			if value == 'NA' or (self.threshold is not None and value > self.threshold):
+				continue
+			candidates.append((float(str(value)),x))
+		if self.topK > 0 and len(candidates) > self.topK:
+			candidates = sorted(heapq.nsmallest(self.topK,candidates),key=lambda candidate: candidate[1])
+		return candidates
+
+	###Add the candidate rows of a block, (pValue,row text) in input order. Returns the text of the rows kept, for the hits file
+	def add(self,candidates):
+		keptText = []
+		for pValue,text in candidates:
+			rank = self.nCandidates
+			self.nCandidates += 1
+			if self.topK == 0:
+				self.heap.append((pValue,rank,text))
+			elif len(self.heap) < self.topK:
+				heapq.heappush(self.heap,(-pValue,-rank,text))
+			elif pValue < -self.heap[0][0]:
+				heapq.heapreplace(self.heap,(-pValue,-rank,text))
+			else:
+				continue
+			keptText.append(text)
+		return ''.join(keptText)
+
+	###Add rows of the hits file written before a checkpoint
+	def addLines(self,lines):
+		self.add([(float(line.split('\t')[self.column]),line) for line in lines])
+
+	###Row text of the hits, sorted by p-value
+	def getHits(self):
+		if self.topK == 0:
+			return [text for pValue,rank,text in sorted(self.heap)]
+		return [text for pValue,rank,text in sorted(self.heap,reverse=True)]
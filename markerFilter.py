@@ -0,0 +1,53 @@
+import numpy as np
+
+#Marker pre-filter of scanTDT.py (-min-maf, -min-informative, -max-missing, -max-mie-rate): markers that cannot be tested usefully are
+#dropped after the genotype checks, before marker objects are created, trio types counted and tests run.
+#MAF and missingness come from the allele and genotype counts already computed for a block; complete informative and MIE trios from one
+#trio code table look-up per trio (TrioClassifier.getInformativeAndMIECounts), only for the markers still kept. The values are those of the
+#output columns (MAF, ./. of n[0/0,0/1,1/1,./.], the sum of the nCompleteInformative vectors, nMIE), so a marker is dropped exactly when
+#its output row would fail the same cut. Markers monomorphic in the parents have no complete informative trios (-min-informative=1).
+#Dropped markers may be listed in a skip file (-skip-file): marker id, filter and the value that failed, one line per marker.
+
+#filters are checked in the order maf, missing, informative, mie-rate; a dropped marker is listed with the first filter it fails
+SKIP_FILE_HEADER = "MarkerID\tFilter\tValue\n"
+
+##----------------------------------------------------------------------------------------------------------------------------------------------------
+class MarkerFilter:
+
+	###METHODS
+	#Defaults keep all markers. maxMissing is the fraction of ./. genotypes, maxMieRate the fraction of counted trios with a Mendelian error
+	def __init__(self,minMaf=0.0,minInformative=0,maxMissing=1.0,maxMieRate=1.0):
+		self.minMaf = minMaf
+		self.minInformative = minInformative
+		self.maxMissing = maxMissing
+		self.maxMieRate = maxMieRate
+
+	def isEnabled(self):
+		return self.minMaf > 0 or self.minInformative > 0 or self.maxMissing < 1 or self.maxMieRate < 1
+
+	###Filter and failed value of each marker of a block of the same chromosome class, None for the markers kept.
+	#refCounts, altCounts and nVariantTypes are those of TrioClassifier.getAlleleCounts and getVariantDistribution for the same rows
+	def getSkipReasons(self,trioClassifier,genotypes,isChrX,refCounts,altCounts,nVariantTypes):
+		reasons = [None]*genotypes.shape[0]
+		#same division as setGenotypeSummary of the marker classes, so that the cut matches the MAF column
+		maf = np.minimum(refCounts,altCounts)/np.maximum(refCounts+altCounts,1).astype(float)
+		missing = nVariantTypes[:,3]/np.maximum(nVariantTypes.sum(axis=1),1).astype(float)
+		for row in np.nonzero(maf < self.minMaf)[0]:
+			reasons[row] = ('maf',maf[row])
+		for row in np.nonzero(missing > self.maxMissing)[0]:
+			if reasons[row] is None:
+				reasons[row] = ('missing',missing[row])
+		if self.minInformative > 0 or self.maxMieRate < 1:
+			rows = np.array([x for x in range(len(reasons)) if reasons[x] is None],dtype=np.intp)
+			nInformative,nMIE = trioClassifier.getInformativeAndMIECounts(genotypes[rows],isChrX)
+			mieRate = nMIE/float(max(trioClassifier.strataSizes.sum(),1))
+			for x in range(len(rows)):
+				if nInformative[x] < self.minInformative:
+					reasons[rows[x]] = ('informative',nInformative[x])
+				elif mieRate[x] > self.maxMieRate:
+					reasons[rows[x]] = ('mie-rate',mieRate[x])
+		return reasons
+
+##Skip file lines of the dropped markers of a block, in marker order
+def formatSkipLines(markerIDs,reasons):
+	return ''.join([markerIDs[x]+'\t'+reasons[x][0]+'\t'+str(reasons[x][1])+'\n' for x in range(len(markerIDs)) if reasons[x] is not None])
@@ -0,0 +1,117 @@
+import os
+import re
+import sys
+import time
+import numpy as np
+import pValues
+import gsl
+
+"""
+Accuracy check and micro-benchmark of the p-value backends (-pvalue-backend of scanTDT.py).
+
+Accuracy: each backend is checked against the reference values recorded in the docstring of gsl.py (scipy cdf values printed with
+6 decimals; only the 1 df chi-square lines apply to the TDT). The relative difference of each backend to scipy is also reported on
+a grid of statistics reaching p-values far below genome-wide significance.
+Speed: time of chiSqPValues and normPValues for a block of statistics (the calls made by scanTDT.py for each block of markers).
+Backends that cannot be loaded (gsl without libgsl) are reported and skipped.
+
+USAGE: python pValueBenchmark.py [-n=<statistics per block> DEFAULT 5000] [-repeats=<timed calls per backend> DEFAULT 20]
+"""
+
+N_STATISTICS = 5000
+REPEATS = 20
+REFERENCE_TOLERANCE = 1e-6            #statistics and reference values are both printed with 6 decimals
+#the last record of the gsl.py docstring reads tats.norm.cdf
+REFERENCE_PATTERN = re.compile(r"s?tats\.(chi2|norm)\.cdf\(\s*([-\d.]+)(?:,\s*(\d+))?\)\s*==\s*([\d.]+)")
+
+##Reference (distribution,statistic,cdf) values listed in gsl.py; chi-square values with more than 1 df are left out
+def readReferenceValues():
+	text = open(os.path.join(os.path.dirname(os.path.abspath(__file__)),"gsl.py"),"r").read()
+	references = []
+	for distribution,statistic,df,cdf in REFERENCE_PATTERN.findall(text):
+		if distribution == "chi2" and df <> "1":
+			continue
+		references.append((distribution,float(statistic),float(cdf)))
+	return references
+
+##Backends that can be selected in this environment
+def getAvailableBackends():
+	return [backend for backend in pValues.BACKENDS if backend <> "gsl" or gsl.available]
+
+##Largest absolute difference of a backend's cdf values to the references
+def checkReferences(references):
+	worst = 0.0
+	for distribution,statistic,cdf in references:
+		if distribution == "chi2":
+			value = 1.0-pValues.chiSqPValue(statistic)
+		else:
+			#two-sided p-value/2 is the tail beyond |statistic|
+			tail = pValues.normPValue(statistic)/2.0
+			value = tail if statistic < 0 else 1.0-tail
+		worst = max(worst,abs(value-cdf))
+	return worst
+
+##Largest relative difference of a backend's p-values to the given scipy p-values
+def getRelativeDifference(chiSqGrid,zGrid,scipyChiSq,scipyNorm):
+	chiSqDifference = np.max(np.abs(pValues.chiSqSF(chiSqGrid)-scipyChiSq)/scipyChiSq)
+	normDifference = np.max(np.abs(pValues.twoSidedNormSF(zGrid)-scipyNorm)/scipyNorm)
+	return chiSqDifference,normDifference
+
+##Seconds per block of statistics, best of the repeats
+def timeBlock(function,statistics,repeats):
+	best = float("inf")
+	for repeat in range(repeats):
+		start = time.time()
+		function(statistics)
+		best = min(best,time.time()-start)
+	return best
+
+def runBenchmark(nStatistics,repeats):
+	references = readReferenceValues()
+	print "Reference values from gsl.py:",len(references),"(chi-square 1 df and normal)"
+	if not gsl.available:
+		print "libgsl could not be loaded: the gsl backend is skipped."
+
+	#grid of statistics up to z = 26 (p-values down to 1e-150), where all backends are still above underflow
+	zGrid = np.concatenate([-np.linspace(0.0,26.0,2601),np.linspace(0.0,26.0,2601)])
+	chiSqGrid = np.linspace(0.0,26.0,2601)**2
+	pValues.setBackend("scipy")
+	scipyChiSq = pValues.chiSqSF(chiSqGrid)
+	scipyNorm = pValues.twoSidedNormSF(zGrid)
+
+	#a block of statistics as passed by scanTDT.py: Python floats, with a few 'NA'
+	random = np.random.RandomState(0)
+	chiSqStatistics = (random.standard_normal(nStatistics)**2).tolist()
+	zStatistics = random.standard_normal(nStatistics).tolist()
+	for i in range(0,nStatistics,100):
+		chiSqStatistics[i] = 'NA'
+		zStatistics[i] = 'NA'
+
+	print "\t".join(["backend","maxReferenceError","maxRelDiffChiSq","maxRelDiffNorm","chiSqPValues(ms)","normPValues(ms)"])
+	for backend in getAvailableBackends():
+		pValues.setBackend(backend)
+		referenceError = checkReferences(references)
+		chiSqDifference,normDifference = getRelativeDifference(chiSqGrid,zGrid,scipyChiSq,scipyNorm)
+		chiSqTime = timeBlock(pValues.chiSqPValues,chiSqStatistics,repeats)
+		normTime = timeBlock(pValues.normPValues,zStatistics,repeats)
+		status = "" if referenceError <= REFERENCE_TOLERANCE else "\tREFERENCE CHECK FAILED"
+		print "%s\t%.2e\t%.2e\t%.2e\t%.3f\t%.3f%s" % (backend,referenceError,chiSqDifference,normDifference,chiSqTime*1000,normTime*1000,status)
+	pValues.setBackend("scipy")
+
+
+if __name__ == "__main__":
+	while len(sys.argv) > 1:
+		thisArg = sys.argv.pop(1)
+		if thisArg.find("=") == -1:
+			print 'Unrecognised argument: '+thisArg
+			sys.exit(1)
+		name,value = thisArg.split("=")
+		name = name.lower().strip("- ")
+		if name == "n":
+			N_STATISTICS = int(value.strip(" "))
+		elif name == "repeats":
+			REPEATS = int(value.strip(" "))
+		else:
+			print "unrecognized option:", name
+			sys.exit(1)
+	runBenchmark(N_STATISTICS,REPEATS)
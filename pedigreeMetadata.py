@@ -0,0 +1,103 @@
+import numpy as np
+
+#Trio metadata: pedigree ids, trio member columns, phenotypes and NB genders.
+#The feature matrix header, the pedigree list and the phenotype and gender files are each read in one pass with hashed look-ups
+#(dictionaries and sets), so setup time is linear in the number of trios. The result is held as arrays in sorted pedigree id order:
+#one sample column index array per trio member, phenotype and gender codes and case/control and male/female masks.
+#Pedigrees that cannot be analysed are reported in bulk, one message per kind of mismatch.
+
+MEMBER_TYPES = ['1','2','3']      #father, mother, offspring
+
+##Comma separated list of pedigree ids for the mismatch messages
+def formatPedIDs(pedIDs):
+	return ",".join(sorted(pedIDs))
+
+##----------------------------------------------------------------------------------------------------------------------------------------------------
+class PedigreeMetadata:
+
+	###METHODS
+	#idColumns and memberTypeColumns are the first two rows of the feature matrix (without the marker id column).
+	#selectedPedIDs are the pedigree ids of the pedigree file, or None for all pedigrees of the feature matrix.
+	#phenoLines and genderLines are the lines of the phenotype and gender files (pedigree id, then 1/2 or NA).
+	def __init__(self,idColumns,memberTypeColumns,selectedPedIDs,phenoLines,genderLines):
+		self.readHeader(idColumns,memberTypeColumns)
+		if selectedPedIDs is None:
+			pedIDs = set(self.pedMemberColumns)
+		else:
+			pedIDs = set(selectedPedIDs)
+		self.readPhenotypes(phenoLines,pedIDs)
+		#pedigrees with a missing phenotype are not analysed
+		pedIDs -= self.missingPhenotype
+		self.readGenders(genderLines,pedIDs)
+		#pedigrees with an unknown NB gender, or without a line in the gender file, are not analysed: their trios belong to no male or female NB stratum
+		self.noGender = set(x for x in pedIDs if x in self.pedMemberColumns and x not in self.pedNBGender and x not in self.missingGender)
+		pedIDs -= self.missingGender | self.noGender
+
+		#pedigrees of the pedigree file that are not in the feature matrix, or without all three trio members
+		self.notInHeader = set(x for x in pedIDs if x not in self.pedMemberColumns)
+		self.incompleteTrios = set(x for x in pedIDs if x in self.pedMemberColumns and -1 in self.pedMemberColumns[x])
+		self.pedIDs = sorted(pedIDs - self.notInHeader - self.incompleteTrios)
+
+		#sample column of each trio member, phenotype (0 when not given) and NB gender, in the order of self.pedIDs
+		memberColumns = np.array([self.pedMemberColumns[x] for x in self.pedIDs],dtype=np.intp).reshape(-1,len(MEMBER_TYPES))
+		self.fatherColumns = memberColumns[:,0].copy()
+		self.motherColumns = memberColumns[:,1].copy()
+		self.offspringColumns = memberColumns[:,2].copy()
+		self.phenotypes = np.array([self.pedPhenoDict.get(x,0) for x in self.pedIDs],dtype=np.intp)
+		self.genders = np.array([self.pedNBGender.get(x,0) for x in self.pedIDs],dtype=np.intp)
+		self.isCase = self.phenotypes == 2
+		self.isControl = self.phenotypes == 1
+		self.isMale = self.genders == 1
+		self.isFemale = self.genders == 2
+		self.noPhenotype = set(x for x in self.pedIDs if x not in self.pedPhenoDict)
+
+	###One pass over the header: the first sample column of each member type of each pedigree (-1 when the member is missing)
+	def readHeader(self,idColumns,memberTypeColumns):
+		memberPositions = dict((memberType,x) for x,memberType in enumerate(MEMBER_TYPES))
+		self.pedMemberColumns = {}
+		for column in range(len(idColumns)):
+			members = self.pedMemberColumns.setdefault(idColumns[column],[-1]*len(MEMBER_TYPES))
+			position = memberPositions.get(memberTypeColumns[column])
+			if position is not None and members[position] == -1:
+				members[position] = column
+
+	###Phenotypes of the pedigrees in pedIDs. Pedigrees with a non-numeric phenotype (NA) are collected in self.missingPhenotype
+	def readPhenotypes(self,phenoLines,pedIDs):
+		self.pedPhenoDict = {}
+		self.missingPhenotype = set()
+		for line in phenoLines:
+			columns = line.split()
+			if len(columns) < 2 or columns[0] not in pedIDs or columns[0] in self.missingPhenotype:
+				continue
+			if columns[1].isdigit():
+				self.pedPhenoDict[columns[0]] = int(columns[1])
+			else:
+				self.missingPhenotype.add(columns[0])
+
+	###NB genders of the pedigrees in pedIDs. Pedigrees with an unknown gender (NA, or any code but 1 and 2) are collected in self.missingGender
+	def readGenders(self,genderLines,pedIDs):
+		self.pedNBGender = {}
+		self.missingGender = set()
+		for line in genderLines:
+			columns = line.split()
+			if len(columns) < 2 or columns[0] not in pedIDs:
+				continue
+			if columns[1] in ['1','2']:
+				self.pedNBGender[columns[0]] = int(columns[1])
+			else:
+				self.missingGender.add(columns[0])
+
+	###Print one message per kind of mismatch between the feature matrix, the pedigree list and the phenotype and gender files
+	def reportMismatches(self):
+		if self.missingPhenotype:
+			print "Missing phenotype for",len(self.missingPhenotype),"pedigrees. These pedigrees will not be analysed:",formatPedIDs(self.missingPhenotype)
+		if self.missingGender:
+			print "Missing gender for",len(self.missingGender),"pedigrees. These pedigrees will not be analysed:",formatPedIDs(self.missingGender)
+		if self.noGender:
+			print "No gender line for",len(self.noGender),"pedigrees. These pedigrees will not be analysed:",formatPedIDs(self.noGender)
+		if self.notInHeader:
+			print len(self.notInHeader),"pedigrees are not in the feature matrix and will not be analysed:",formatPedIDs(self.notInHeader)
+		if self.incompleteTrios:
+			print len(self.incompleteTrios),"pedigrees do not have a father, mother and offspring column in the feature matrix and will not be analysed:",formatPedIDs(self.incompleteTrios)
+		if self.noPhenotype:
+			print "No phenotype line for",len(self.noPhenotype),"pedigrees. These pedigrees are not tested but their genotypes are counted for MAF:",formatPedIDs(self.noPhenotype)
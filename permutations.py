@@ -0,0 +1,163 @@
+import zlib
+import numpy as np
+from blockStatistics import weightMatrices,quantities,quantityIndex,geneticModels,getSelectedModels,countMatrixVectors,getCountVectorLengths
+
+#Adaptive permutation p-values of the standard TDT and FBAT statistics (-permutations).
+#Under the null hypothesis the offspring of a complete informative trio receives a random allele of each parent, so permuting transmitted and
+#untransmitted alleles redistributes the trios of each mating type over its trio types with Mendelian probabilities. A permutation of a marker
+#is therefore drawn from its trio type count vectors alone: one multinomial draw per mating type and case/control x gender stratum.
+#b-c and U are linear in the counts (the weights of blockStatistics.py), while b+c and Var(U) do not change within a mating type, so a
+#permuted statistic is at least as extreme as the observed one when b-c (or U) is at least as far from its expectation under Mendelian
+#transmission. The expectation is 0 for the additive model, but not for the dominant and recessive look-up tables in (1,1) matings.
+#Permutations run in batches of doubling size. A test stops once HITS permuted statistics reach the observed one (p = HITS/permutations,
+#sequential Monte Carlo p-value of Besag and Clifford), so markers that are clearly not significant stop after a few hundred permutations
+#and only markers with small p-values run up to the maximum (then p = (hits+1)/(permutations+1)).
+#Each marker has its own random stream, seeded from the seed and the marker id, so results do not depend on -block-size or -workers.
+#Incomplete trios are not permuted: the rTDT and scanFBAT ranges have no empirical p-values.
+
+#mating types of the complete informative trio types: (trio type indices in the count vector, Mendelian probabilities of the offspring genotypes)
+#autosomal trio types [X_50, X_51, X_40, X_41, X_42, X_21, X_22]; chrX [X_50, X_51, X_40, X_41] (male NB) and [X_50, X_51, X_41, X_42] (female NB)
+matingTypes = {
+	False:[([0,1],[0.5,0.5]),([2,3,4],[0.25,0.5,0.25]),([5,6],[0.5,0.5])],
+	True:[([0,1],[0.5,0.5]),([2,3],[0.5,0.5])],
+}
+#complete informative count vectors, the first columns of the count matrix of blockStatistics.py
+completeVectors = countMatrixVectors[:4]
+
+FIRST_BATCH = 100                 #permutations of the first batch of a marker; each further batch doubles
+TOLERANCE = 1e-9                  #relative tolerance of the comparison with the observed statistic (FBAT weights are scaled by -offset)
+
+##Output columns of the empirical p-values, in the order of the values returned by AdaptivePermutations.getEmpiricalPValues
+def getPermutationColumns(TEST,MODELS):
+	columns = []
+	for test in getPermutedTests(TEST):
+		for model,modelName,autosomalTables,chrXTables in getSelectedModels(MODELS):
+			columns.extend(['empirical_P-value_'+test+'_'+modelName,'nPermutations_'+test+'_'+modelName])
+	return columns
+
+def getPermutedTests(TEST):
+	return [test for test in ['TDT','FBAT'] if TEST == "" or TEST == test.lower()]
+
+##----------------------------------------------------------------------------------------------------------------------------------------------------
+class AdaptivePermutations:
+
+	###METHODS
+	#maxPermutations: largest number of permutations of a marker; hits: permuted statistics at least as extreme as the observed one after which a test stops
+	def __init__(self,maxPermutations,hits,seed,TEST,MODELS,OFFSET):
+		self.maxPermutations = maxPermutations
+		self.hits = hits
+		self.seed = seed
+		self.statisticWeights = {}
+		self.denominatorWeights = {}
+		self.matingTypeColumns = {}
+		for isChrX in [False,True]:
+			self.setWeights(isChrX,TEST,MODELS,OFFSET)
+
+	###Weights of the statistics (b-c for the TDT, U for FBAT) and of their denominators (b+c, Var(U)) on the complete columns of the count matrix,
+	#one column per test and model, and the count matrix columns of each mating type of each count vector
+	def setWeights(self,isChrX,TEST,MODELS,OFFSET):
+		vectorOffsets = np.cumsum([0]+getCountVectorLengths(isChrX))
+		nColumns = vectorOffsets[len(completeVectors)]
+		weights = weightMatrices[isChrX][:nColumns].astype(np.float64)
+		getWeights = lambda modelIndex,name: weights[:,modelIndex*len(quantities)+quantityIndex[name]]
+		statisticWeights = []
+		denominatorWeights = []
+		for test in getPermutedTests(TEST):
+			for geneticModel in getSelectedModels(MODELS):
+				modelIndex = geneticModels.index(geneticModel)
+				if test == 'TDT':
+					statisticWeights.append(getWeights(modelIndex,'b')-getWeights(modelIndex,'c'))
+					denominatorWeights.append(getWeights(modelIndex,'b')+getWeights(modelIndex,'c'))
+				else:
+					statisticWeights.append((1-OFFSET)*getWeights(modelIndex,'caseU')+(0-OFFSET)*getWeights(modelIndex,'controlU'))
+					denominatorWeights.append(((1-OFFSET)**2)*getWeights(modelIndex,'caseVarU')+((0-OFFSET)**2)*getWeights(modelIndex,'controlVarU'))
+		self.statisticWeights[isChrX] = np.array(statisticWeights).T
+		self.denominatorWeights[isChrX] = np.array(denominatorWeights).T
+
+		self.matingTypeColumns[isChrX] = []
+		for vector in range(len(completeVectors)):
+			for trioTypes,probabilities in matingTypes[isChrX]:
+				columns = vectorOffsets[vector]+np.array(trioTypes)
+				#the denominators must be the same for all trio types of a mating type
+				assert((self.denominatorWeights[isChrX][columns] == self.denominatorWeights[isChrX][columns[0]]).all())
+				self.matingTypeColumns[isChrX].append((columns,probabilities))
+
+	###Empirical p-values and numbers of permutations of a block of markers of the same chromosome class.
+	#counts is the dictionary of count matrices from TrioClassifier.countTrioTypes. Returns one list of values per marker, in the column
+	#order of getPermutationColumns; 'NA' where the statistic is not defined. Also returns the number of permutations drawn.
+	def getEmpiricalPValues(self,markerIDs,counts,isChrX):
+		countMatrix = np.hstack([np.asarray(counts[name],dtype=np.int64) for name in completeVectors])
+		rows = []
+		nDrawn = 0
+		for x in range(len(markerIDs)):
+			pValues,nPermutations,nMarkerDrawn = self.permuteMarker(markerIDs[x],countMatrix[x],isChrX)
+			row = []
+			for test in range(len(pValues)):
+				row.extend([pValues[test],nPermutations[test]])
+			rows.append(row)
+			nDrawn += nMarkerDrawn
+		return rows,nDrawn
+
+	###Adaptive permutations of one marker (a row of the complete count matrix).
+	#Returns the p-values and numbers of permutations of each test, and the number of permutations drawn
+	def permuteMarker(self,markerID,countRow,isChrX):
+		statisticWeights = self.statisticWeights[isChrX]
+		matingTypeCounts = [(columns,probabilities,countRow[columns].sum()) for columns,probabilities in self.matingTypeColumns[isChrX]]
+		matingTypeCounts = [matingType for matingType in matingTypeCounts if matingType[2] > 0]
+		expected = sum([n*np.dot(probabilities,statisticWeights[columns]) for columns,probabilities,n in matingTypeCounts],np.zeros(statisticWeights.shape[1]))
+		observed = np.abs(countRow.dot(statisticWeights)-expected)
+		threshold = observed-TOLERANCE*np.maximum(1.0,observed)
+		isActive = countRow.dot(self.denominatorWeights[isChrX]) > 0
+		isDefined = isActive.copy()
+
+		nTests = statisticWeights.shape[1]
+		hits = np.zeros(nTests,dtype=np.int64)
+		nPermutations = np.zeros(nTests,dtype=np.int64)
+		random = None
+		batchSize = FIRST_BATCH
+		while isActive.any() and nPermutations[isActive][0] < self.maxPermutations:
+			if random is None:
+				random = np.random.RandomState([self.seed,zlib.crc32(markerID) & 0xffffffff])
+			activeTests = np.flatnonzero(isActive)
+			size = min(batchSize,self.maxPermutations-nPermutations[activeTests[0]])
+			statistics = self.drawStatistics(random,matingTypeCounts,statisticWeights[:,activeTests],size)
+			cumulativeHits = hits[activeTests]+np.cumsum(np.abs(statistics-expected[activeTests]) >= threshold[activeTests],axis=0)
+			for y in range(len(activeTests)):
+				test = activeTests[y]
+				reached = np.flatnonzero(cumulativeHits[:,y] >= self.hits)
+				if len(reached):
+					#stop at the permutation that gave the last hit
+					hits[test] = self.hits
+					nPermutations[test] += reached[0]+1
+					isActive[test] = False
+				else:
+					hits[test] = cumulativeHits[-1,y]
+					nPermutations[test] += size
+			batchSize *= 2
+
+		pValues = []
+		for test in range(nTests):
+			if not isDefined[test]:
+				pValues.append('NA')
+			elif hits[test] >= self.hits:
+				pValues.append(float(hits[test])/nPermutations[test])
+			else:
+				pValues.append(float(hits[test]+1)/(nPermutations[test]+1))
+		return pValues,[int(n) if isDefined[test] else 'NA' for test,n in enumerate(nPermutations)],int(nPermutations.max())
+
+	###size permuted statistics of each test (a size x tests matrix): the trios of each mating type are redistributed over its trio types
+	def drawStatistics(self,random,matingTypeCounts,statisticWeights,size):
+		statistics = np.zeros((size,statisticWeights.shape[1]))
+		for columns,probabilities,n in matingTypeCounts:
+			#multinomial counts, one binomial draw per trio type given the trios left
+			remaining = np.empty(size,dtype=np.int64)
+			remaining.fill(n)
+			remainingProbability = 1.0
+			permutedCounts = np.empty((size,len(columns)),dtype=np.int64)
+			for x in range(len(columns)-1):
+				permutedCounts[:,x] = random.binomial(remaining,probabilities[x]/remainingProbability)
+				remaining -= permutedCounts[:,x]
+				remainingProbability -= probabilities[x]
+			permutedCounts[:,-1] = remaining
+			statistics += permutedCounts.dot(statisticWeights[columns])
+		return statistics
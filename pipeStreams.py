@@ -0,0 +1,85 @@
+import os
+import sys
+import zlib
+import errno
+
+#Standard input and output of scanTDT.py in Unix pipelines (-fm=- or -vcf=-, -out=-).
+#The input stream is read in large pieces and split into lines; gzip input (detected from its first bytes, any number of gzip members as
+#written by gzip, bgzip or featureMatrixIndex.py) is decompressed with zlib while it streams: gzip.GzipFile seeks in its input, which a pipe cannot do.
+#With -out=-, the output rows are written uncompressed to the standard output, which then holds nothing else: the file descriptor of the
+#standard output is kept for the output rows and the standard output of the process (print, worker processes) is redirected to the standard
+#error before the first log message. The next command of the pipe may exit before reading all the rows (e.g. | head): the write then fails
+#with EPIPE, and the run stops quietly instead of failing with a traceback.
+
+STREAM_FILENAME = "-"
+GZIP_MAGIC = "\x1f\x8b"
+READ_SIZE = 1<<20
+
+##----------------------------------------------------------------------------------------------------------------------------------------------------
+class StreamReader:
+
+	###METHODS
+	#stream is a file object that is only read forward (sys.stdin)
+	def __init__(self,stream):
+		self.stream = stream
+		self.pending = stream.read(len(GZIP_MAGIC))
+		self.decompressor = zlib.decompressobj(16+zlib.MAX_WBITS) if self.pending == GZIP_MAGIC else None
+		self.buffer = ""
+		self.position = 0
+
+	###Next piece of the (decompressed) stream, "" at the end of the stream
+	def readData(self):
+		while True:
+			data = self.pending or self.stream.read(READ_SIZE)
+			self.pending = ""
+			if not data or not self.decompressor:
+				return data
+			pieces = []
+			while data:
+				pieces.append(self.decompressor.decompress(data))
+				#bytes after the end of a gzip member start the next member
+				data = self.decompressor.unused_data
+				if data:
+					self.decompressor = zlib.decompressobj(16+zlib.MAX_WBITS)
+			if any(pieces):
+				return "".join(pieces)
+
+	def readline(self):
+		while True:
+			end = self.buffer.find("\n",self.position)
+			if end <> -1:
+				line = self.buffer[self.position:end+1]
+				self.position = end+1
+				return line
+			data = self.readData()
+			if not data:
+				line = self.buffer[self.position:]
+				self.buffer = ""
+				self.position = 0
+				return line
+			self.buffer = self.buffer[self.position:]+data
+			self.position = 0
+
+	def __iter__(self):
+		line = self.readline()
+		while line:
+			yield line
+			line = self.readline()
+
+	def close(self):
+		pass
+
+##Keep the standard output for the output rows and send everything else written to it to the standard error. Returns the output file object
+def redirectStdoutToStderr():
+	sys.stdout.flush()
+	outputStream = os.fdopen(os.dup(sys.stdout.fileno()),"wb")
+	os.dup2(sys.stderr.fileno(),sys.stdout.fileno())
+	return outputStream
+
+##True for the error of a write to a pipe whose reading end was closed
+def isBrokenPipe(error):
+	return error.errno == errno.EPIPE
+
+##Send the rest of the output of a broken pipe to /dev/null, so that flushing and closing the output file object do not fail again
+def discardOutput(outputStream):
+	os.dup2(os.open(os.devnull,os.O_WRONLY),outputStream.fileno())
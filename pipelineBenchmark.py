@@ -0,0 +1,353 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import gzip
+import resource
+import itertools
+import subprocess
+import StringIO
+import numpy as np
+from classMarker import AutosomalMarker,ChrXMarker,getMarkerClass
+from generateTrioData import generateTrioData
+from featureMatrixReader import parseMarkerLines
+from pedigreeMetadata import PedigreeMetadata
+from trioClassifier import TrioClassifier,countVectorNames
+from blockStatistics import computeBlockStatistics,getStatisticColumns
+from pValues import chiSqPValues,normPValues
+
+"""
+Throughput benchmark of the scanTDT.py pipeline on synthetic trio data (see generateTrioData.py).
+
+1. Stage timings: the blocks of the feature matrix are run in this process through the functions used by scanTDT.py, timing each stage:
+   parse (feature matrix lines to genotype matrix), validate (genotype checks), MAF (allele and genotype counts),
+   classification (trio type counts), tests (TDT/FBAT statistics) and output (p-values, MIE messages and output rows).
+2. End-to-end runs: scanTDT.py is run once per engine configuration; wall time, markers/sec and peak RSS are reported and each output
+   file is compared with the output of the first configuration, which must be identical (p-values within TOLERANCE for approximate engines).
+3. Reference check: the first markers are also processed one at a time with the per-marker methods of AutosomalMarker and ChrXMarker
+   (getSampleGenotypes, hasValidGenotypes, computeMAF, getVariantDistribution, populateTrioTypeCountVectors, stdTDT, extendedTDT,
+   stdFBAT, extendedFBAT) and their output rows are compared with the rows written by scanTDT.py, which must be identical.
+
+USAGE: python pipelineBenchmark.py [-workdir=<directory> DEFAULT a temporary directory] [-block-size=<markers per block> DEFAULT 5000]
+	[-engines=<configurations, from ENGINES> DEFAULT bincount,bitplane,workers] [-reference-markers=<markers> DEFAULT 200]
+	[-model=<a,d,r> DEFAULT a,d,r] [-test=tdt OR fbat] [-version=scan OR std] [-offset=<offset> DEFAULT 0.5]
+	[-fm=<feature matrix> -phenotype=<phenotype file> -gender=<gender file>] to benchmark existing data, or the options of generateTrioData.py
+	(-trios, -markers, -maf-spectrum, -min-maf, -missing, -mie-rate, -case-control-ratio, -chrx-fraction, -seed) to generate it.
+The generated data, outputs and logs are written to -workdir; without -workdir, to a temporary directory that is removed at the end
+(kept, with its path printed, when the outputs differ).
+"""
+
+STAGES = ['parse','validate','MAF','classification','tests','output']
+SCAN_TDT = os.path.join(os.path.dirname(os.path.abspath(__file__)),"scanTDT.py")
+
+#scanTDT.py options of each engine configuration, and whether its output must be identical to the first configuration
+#(otherwise p-values may differ by a relative TOLERANCE)
+ENGINES = {
+	'bincount':([],True),
+	'bitplane':(['-kernel=bitplane'],True),
+	'workers':(['-workers=2'],True),
+	'small-blocks':(['-block-size=97'],True),
+	'fast-pvalues':(['-pvalue-backend=fast'],False),
+}
+#relative difference allowed for the values of approximate engines
+TOLERANCE = 1e-9
+
+##Peak resident set size of this process, in MB
+def getPeakRSS():
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.0
+
+##Header rows (idColumns, memberTypeColumns) and trio metadata of a data set
+def readTrios(fmFile,phenoFilename,genderFilename):
+	idColumns = fmFile.readline().strip().split('\t')[1:]
+	memberTypeColumns = fmFile.readline().strip().split('\t')[1:]
+	pedigreeMetadata = PedigreeMetadata(idColumns,memberTypeColumns,None,open(phenoFilename,"r"),open(genderFilename,"r"))
+	return idColumns,memberTypeColumns,pedigreeMetadata
+
+def openFeatureMatrix(fmFilename):
+	return gzip.open(fmFilename,"r") if fmFilename.endswith("gz") else open(fmFilename,"r")
+
+##Time each stage of the pipeline on all markers of the feature matrix. Returns (seconds per stage, markers read, markers tested)
+def timeStages(fmFilename,phenoFilename,genderFilename,blockSize,TEST,VERSION,MODELS,OFFSET):
+	timings = dict((stage,0.0) for stage in STAGES)
+	fmFile = openFeatureMatrix(fmFilename)
+	idColumns,memberTypeColumns,pedigreeMetadata = readTrios(fmFile,phenoFilename,genderFilename)
+	trioClassifier = TrioClassifier(pedigreeMetadata)
+	statisticColumns = getStatisticColumns(TEST,VERSION,MODELS)
+	pValueColumns = [x for x in range(len(statisticColumns)) if statisticColumns[x].find("P-value") <> -1]
+	nMarkers = 0
+	nTested = 0
+	while True:
+		lines = list(itertools.islice(fmFile,blockSize))
+		if not lines:
+			break
+		nMarkers += len(lines)
+		start = time.time()
+		lines = [line for line in lines if getMarkerClass(line)]
+		markerIDs,genotypes = parseMarkerLines(lines,len(idColumns))
+		timings['parse'] += time.time()-start
+
+		for isChrX in [False,True]:
+			rows = [x for x in range(len(markerIDs)) if (getMarkerClass(markerIDs[x]) is ChrXMarker) == isChrX]
+			if not rows:
+				continue
+			start = time.time()
+			blockGenotypes = genotypes[rows]
+			isValid = trioClassifier.hasValidGenotypes(blockGenotypes,isChrX)
+			blockGenotypes = blockGenotypes[isValid]
+			blockMarkerIDs = [markerIDs[rows[x]] for x in np.flatnonzero(isValid)]
+			timings['validate'] += time.time()-start
+
+			start = time.time()
+			refCounts,altCounts = trioClassifier.getAlleleCounts(blockGenotypes,isChrX)
+			nVariantTypes = trioClassifier.getVariantDistribution(blockGenotypes,isChrX)
+			markers = []
+			for x in range(len(blockMarkerIDs)):
+				thisMarker = ChrXMarker() if isChrX else AutosomalMarker()
+				thisMarker.markerID = blockMarkerIDs[x]
+				thisMarker.setGenotypeSummary(int(refCounts[x]),int(altCounts[x]),nVariantTypes[x].tolist())
+				markers.append(thisMarker)
+			timings['MAF'] += time.time()-start
+
+			start = time.time()
+			counts = trioClassifier.countTrioTypes(blockGenotypes,isChrX)
+			timings['classification'] += time.time()-start
+
+			start = time.time()
+			statistics = computeBlockStatistics(counts,isChrX,TEST,VERSION,MODELS,OFFSET)
+			timings['tests'] += time.time()-start
+
+			#p-values, MIE messages and output rows, as in scanTDT.py (processMarkerBlock and formatResultBlock)
+			start = time.time()
+			for column in pValueColumns:
+				pendingRows = [row for row in statistics if row[column] is None]
+				if statisticColumns[column-1].find("ChiSq") <> -1:
+					pValues = chiSqPValues([row[column-1] for row in pendingRows])
+				else:
+					pValues = normPValues([row[column-1] for row in pendingRows])
+				for row,pValue in zip(pendingRows,pValues):
+					row[column] = pValue
+			logText = []
+			resultRows = []
+			for x in range(len(markers)):
+				markers[x].setTrioTypeCounts(counts,x)
+				if markers[x].nMIE > 0:
+					logText.extend([str([markers[x].markerID,trio]) for trio in trioClassifier.getMIETrios(blockGenotypes,isChrX,x)])
+				resultRows.append([markers[x].markerID,markers[x].maf,markers[x].nVariantType]+[getattr(markers[x],name) for name in countVectorNames]+statistics[x])
+			''.join(['\t'.join([str(value) for value in row])+'\n' for row in resultRows])
+			timings['output'] += time.time()-start
+			nTested += len(markers)
+	fmFile.close()
+	return timings,nMarkers,nTested
+
+##Run scanTDT.py with the options of an engine configuration. Returns (wall time, peak RSS in MB, exit status, output file name)
+def runScanTDT(engine,inputOptions,workdir):
+	outputFilename = os.path.join(workdir,engine+".out.gz")
+	logFile = open(os.path.join(workdir,engine+".log"),"w")
+	start = time.time()
+	process = subprocess.Popen([sys.executable,SCAN_TDT]+inputOptions+ENGINES[engine][0]+["-out="+outputFilename],stdout=logFile,stderr=subprocess.STDOUT)
+	#the resource usage of this child (and of its worker processes) only
+	pid,status,usage = os.wait4(process.pid,0)
+	wallTime = time.time()-start
+	logFile.close()
+	return wallTime,usage.ru_maxrss/1024.0,status,outputFilename
+
+def readOutputRows(outputFilename):
+	return gzip.open(outputFilename,"r").read().splitlines()
+
+##Compare two aligned lists of output rows (None for a missing row). Values of the tolerantColumns may differ by a relative TOLERANCE.
+#Returns (number of identical rows, number of rows equal within the tolerance, indices of the other rows)
+def compareRows(rows,referenceRows,tolerantColumns):
+	nIdentical = 0
+	nWithinTolerance = 0
+	different = []
+	for x in range(len(referenceRows)):
+		if rows[x] == referenceRows[x]:
+			nIdentical += 1
+		elif rows[x] is not None and isWithinTolerance(rows[x].split('\t'),referenceRows[x].split('\t'),tolerantColumns):
+			nWithinTolerance += 1
+		else:
+			different.append(x)
+	return nIdentical,nWithinTolerance,different
+
+def isWithinTolerance(values,referenceValues,tolerantColumns):
+	if len(values) <> len(referenceValues):
+		return False
+	for column in range(len(values)):
+		if values[column] == referenceValues[column]:
+			continue
+		if column not in tolerantColumns or 'NA' in [values[column],referenceValues[column]]:
+			return False
+		value,referenceValue = float(values[column]),float(referenceValues[column])
+		#statistics that are exactly 0 in one version may be round-off in the other
+		if abs(value-referenceValue) > TOLERANCE*max(abs(value),abs(referenceValue)) and max(abs(value),abs(referenceValue)) > TOLERANCE:
+			return False
+	return True
+
+##Output rows of the first nMarkers markers, computed one marker at a time with the methods of the marker classes
+def getReferenceRows(fmFilename,phenoFilename,genderFilename,nMarkers,TEST,VERSION,MODELS,OFFSET):
+	fmFile = openFeatureMatrix(fmFilename)
+	idColumns,memberTypeColumns,pedigreeMetadata = readTrios(fmFile,phenoFilename,genderFilename)
+	pedIDs = pedigreeMetadata.pedIDs
+	pedMemberIndices = dict((pedIDs[x],[pedigreeMetadata.fatherColumns[x],pedigreeMetadata.motherColumns[x],pedigreeMetadata.offspringColumns[x]]) for x in range(len(pedIDs)))
+	pedMemberType = dict((ped,['1','2','3']) for ped in pedIDs)
+	pedPhenoDict = dict(zip(pedIDs,pedigreeMetadata.phenotypes.tolist()))
+	pedNBGender = dict(zip(pedIDs,pedigreeMetadata.genders.tolist()))
+	models = MODELS if MODELS else ['a']
+
+	referenceRows = []
+	#MIE messages of populateTrioTypeCountVectors are not kept
+	sys.stdout = StringIO.StringIO()
+	try:
+		for line in itertools.islice(fmFile,nMarkers):
+			markerClass = getMarkerClass(line)
+			if not markerClass:
+				continue
+			values = line.strip().split('\t')
+			thisMarker = markerClass()
+			thisMarker.markerID = values[0]
+			thisMarker.getSampleGenotypes(values[1:],pedMemberIndices)
+			if markerClass is ChrXMarker:
+				if not thisMarker.hasValidGenotypes(pedNBGender,pedMemberType):
+					continue
+				thisMarker.computeMAF(pedNBGender,pedMemberType)
+				thisMarker.getVariantDistribution(pedNBGender,pedMemberType)
+			else:
+				if not thisMarker.hasValidGenotypes():
+					continue
+				thisMarker.computeMAF()
+				thisMarker.getVariantDistribution()
+			thisMarker.populateTrioTypeCountVectors(pedMemberType,pedPhenoDict,pedNBGender)
+			row = [thisMarker.markerID,thisMarker.maf,thisMarker.nVariantType]+[getattr(thisMarker,name) for name in countVectorNames]
+			if TEST == "" or TEST == "tdt":
+				for model in [x for x in ['a','d','r'] if x in models]:
+					thisMarker.stdTDT(model)
+					row.extend([thisMarker.chiSq_StdTDT,thisMarker.pValue_StdTDT])
+					if VERSION == "scan" or VERSION == "":
+						thisMarker.extendedTDT(model)
+						row.extend([thisMarker.minChiSq_rTDT,thisMarker.minPValue_rTDT,thisMarker.maxChiSq_rTDT,thisMarker.maxPValue_rTDT])
+			if TEST == "" or TEST == "fbat":
+				for model in [x for x in ['a','d','r'] if x in models]:
+					thisMarker.stdFBAT(model,OFFSET)
+					row.extend([thisMarker.Z_stdFBAT,thisMarker.pValue_stdFBAT])
+					if VERSION == "scan" or VERSION == "":
+						thisMarker.extendedFBAT(model,OFFSET)
+						row.extend([thisMarker.minZ_extFBAT,thisMarker.minPValue_extFBAT,thisMarker.maxZ_extFBAT,thisMarker.maxPValue_extFBAT])
+			referenceRows.append('\t'.join([str(value) for value in row]))
+	finally:
+		sys.stdout = sys.__stdout__
+	fmFile.close()
+	return referenceRows
+
+def runBenchmark(options):
+	workdir = options['workdir']
+	if not os.path.isdir(workdir):
+		os.makedirs(workdir)
+	TEST,VERSION,OFFSET = options['test'],options['version'],options['offset']
+	MODELS = [x for x in options['model'].lower().split(",") if x]
+
+	if options['fm']:
+		fmFilename,phenoFilename,genderFilename = options['fm'],options['phenotype'],options['gender']
+	else:
+		start = time.time()
+		fmFilename,phenoFilename,genderFilename = generateTrioData(os.path.join(workdir,"synthetic"),options['trios'],options['markers'],options['maf-spectrum'],options['min-maf'],options['missing'],options['mie-rate'],options['case-control-ratio'],options['chrx-fraction'],options['seed'])
+		print "Generated",options['trios'],"trios x",options['markers'],"markers in %.1f s (%s)" % (time.time()-start,fmFilename)
+
+	#1. stage timings
+	timings,nMarkers,nTested = timeStages(fmFilename,phenoFilename,genderFilename,options['block-size'],TEST,VERSION,MODELS,OFFSET)
+	total = sum(timings.values())
+	print
+	print "Stage timings (in process, block size %d): %d markers, %d tested" % (options['block-size'],nMarkers,nTested)
+	print "\t".join(["stage","seconds","percent","markers/sec"])
+	for stage in STAGES:
+		print "%s\t%.3f\t%.1f\t%.0f" % (stage,timings[stage],100*timings[stage]/max(total,1e-9),nMarkers/max(timings[stage],1e-9))
+	print "total\t%.3f\t100.0\t%.0f\tpeak RSS %.0f MB" % (total,nMarkers/max(total,1e-9),getPeakRSS())
+
+	#2. end-to-end runs, compared with the first engine configuration
+	inputOptions = ["-fm="+fmFilename,"-phenotype="+phenoFilename,"-gender="+genderFilename,"-offset="+str(OFFSET),"-block-size="+str(options['block-size'])]
+	if MODELS:
+		inputOptions.append("-model="+",".join(MODELS))
+	if TEST:
+		inputOptions.append("-test="+TEST)
+	if VERSION:
+		inputOptions.append("-version="+VERSION)
+	print
+	print "End-to-end scanTDT.py runs (logs and outputs in %s)" % workdir
+	print "\t".join(["engine","seconds","markers/sec","peakRSS(MB)","output"])
+	referenceOutput = None
+	allIdentical = True
+	for engine in options['engines'].split(","):
+		wallTime,peakRSS,status,outputFilename = runScanTDT(engine,inputOptions,workdir)
+		if status <> 0:
+			result = "FAILED (exit status %d, see %s.log)" % (status,engine)
+			allIdentical = False
+		elif referenceOutput is None:
+			referenceOutput = readOutputRows(outputFilename)
+			header = referenceOutput[0].split('\t')
+			result = "reference"
+		else:
+			output = readOutputRows(outputFilename)
+			if output == referenceOutput:
+				result = "identical"
+			elif not ENGINES[engine][1] and len(output) == len(referenceOutput):
+				pValueColumns = set(x for x in range(len(header)) if header[x].find("P-value") <> -1)
+				nIdentical,nWithinTolerance,different = compareRows(output,referenceOutput,pValueColumns)
+				result = "p-values of %d rows within %g" % (nWithinTolerance,TOLERANCE) if not different else "DIFFERENT (%d rows)" % len(different)
+				allIdentical = allIdentical and not different
+			else:
+				result = "DIFFERENT"
+				allIdentical = False
+		print "%s\t%.3f\t%.0f\t%.0f\t%s" % (engine,wallTime,nMarkers/wallTime,peakRSS,result)
+
+	#3. reference check against the per-marker methods of the marker classes
+	if referenceOutput is not None and options['reference-markers'] > 0:
+		referenceRows = getReferenceRows(fmFilename,phenoFilename,genderFilename,options['reference-markers'],TEST,VERSION,MODELS,OFFSET)
+		outputRows = dict((row.split('\t',1)[0],row) for row in referenceOutput[1:])
+		rows = [outputRows.get(row.split('\t',1)[0]) for row in referenceRows]
+		nIdentical,nWithinTolerance,different = compareRows(rows,referenceRows,set())
+		print
+		print "Reference check (marker classes, first %d markers): %d rows identical, %d different" % (options['reference-markers'],nIdentical,len(different))
+		for x in different[:5]:
+			print "  marker classes: "+referenceRows[x]+"\n  scanTDT.py:     "+str(rows[x])
+		allIdentical = allIdentical and not different
+	print
+	print "ALL OUTPUTS MATCH" if allIdentical else "OUTPUTS DIFFER"
+	return allIdentical
+
+
+if __name__ == "__main__":
+	options = {"workdir":"","block-size":5000,"engines":"bincount,bitplane,workers","reference-markers":200,"model":"a,d,r","test":"","version":"","offset":0.5,
+		"fm":"","phenotype":"","gender":"",
+		"trios":1000,"markers":10000,"maf-spectrum":"neutral","min-maf":0.001,"missing":0.01,"mie-rate":0.001,"case-control-ratio":1.0,"chrx-fraction":0.05,"seed":1}
+	while len(sys.argv) > 1:
+		thisArg = sys.argv.pop(1)
+		if thisArg.find("=") == -1:
+			print 'Unrecognised argument: '+thisArg
+			sys.exit(1)
+		name,value = thisArg.split("=")
+		name = name.lower().strip("- ")
+		if name in options:
+			options[name] = type(options[name])(value.strip(" "))
+		else:
+			print "unrecognized option:", name
+			sys.exit(1)
+	for engine in options['engines'].split(","):
+		if engine not in ENGINES:
+			print "Unrecognised engine: "+engine+" (options: "+",".join(sorted(ENGINES.keys()))+")"
+			sys.exit(1)
+	if options['fm'] and not (options['phenotype'] and options['gender']):
+		print "-phenotype and -gender are required with -fm"
+		sys.exit(1)
+	temporaryWorkdir = not options['workdir']
+	if temporaryWorkdir:
+		options['workdir'] = tempfile.mkdtemp(prefix="pipelineBenchmark.")
+	allIdentical = False
+	try:
+		allIdentical = runBenchmark(options)
+	finally:
+		if temporaryWorkdir and allIdentical:
+			shutil.rmtree(options['workdir'],ignore_errors=True)
+		elif temporaryWorkdir:
+			print "Generated data, outputs and logs kept in "+options['workdir']
+	if not allIdentical:
+		sys.exit(1)
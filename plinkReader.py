@@ -0,0 +1,90 @@
+import numpy as np
+from trioClassifier import GENOTYPE_NA,GENOTYPE_INVALID
+
+#PLINK binary genotypes (.bed/.bim/.fam) as a feature matrix source (-fm=<prefix>.bed).
+#Trios are taken from the family, paternal and maternal ids of the .fam file; the trio id is the family id.
+#The .bed file is memory-mapped and 2-bit genotypes of a range of markers are decoded with a look-up table into the
+#int8 genotype arrays used by TrioClassifier, without creating Python strings for the genotype cells.
+#Genotypes are coded as the count of the .bim A1 allele (as in PLINK --recode A): 0, 1, 2 or NA.
+#On chrX, males (fathers and offspring with gender 1 in the gender file) are converted to the hemizygous coding of the feature matrix: 0 or 1.
+
+BED_MAGIC = [0x6c,0x1b,0x01]      #.bed magic number and SNP-major mode
+
+#2-bit .bed codes: 00 homozygous A1, 01 missing, 10 heterozygous, 11 homozygous A2
+bedCodeGenotypes = np.array([2,GENOTYPE_NA,1,0],dtype=np.int8)
+#genotypes of the 4 samples packed in each byte value, indexed [byte value, sample within byte]
+byteGenotypes = bedCodeGenotypes[(np.arange(256).reshape(-1,1) >> (2*np.arange(4))) & 3]
+
+#hemizygous coding of male chrX genotypes: A1 count 2 is coded 1, heterozygous calls are invalid
+maleChrXGenotypes = np.array([0,GENOTYPE_INVALID,1,GENOTYPE_NA],dtype=np.int8)
+
+##Marker id <chr:position> from .bim chromosome and position. PLINK chromosome codes XY (25) and MT (26) are named so that they are skipped like chr25 and chrM
+def getMarkerID(chromosome,position):
+	if chromosome.lower().startswith("chr"):
+		chromosome = chromosome[3:]
+	chromosome = {"XY":"25","MT":"M","26":"M"}.get(chromosome.upper(),chromosome)
+	return "chr"+chromosome+":"+position
+
+##----------------------------------------------------------------------------------------------------------------------------------------------------
+class PlinkReader:
+
+	###METHODS
+	#bedFilename is <prefix>.bed; <prefix>.bim and <prefix>.fam are read from the same path
+	def __init__(self,bedFilename):
+		prefix = bedFilename[:-len(".bed")]
+		self.readFam(prefix+".fam")
+		self.readBim(prefix+".bim")
+		self.bytesPerMarker = (self.nSamples+3)/4
+		bed = np.memmap(bedFilename,dtype=np.uint8,mode="r")
+		if bed[:3].tolist() <> BED_MAGIC:
+			raise IOError(bedFilename+" is not a SNP-major PLINK .bed file")
+		if len(bed) <> 3+self.bytesPerMarker*len(self.markerIDs):
+			raise IOError(bedFilename+" does not match the number of samples in the .fam file and markers in the .bim file")
+		self.bed = bed[3:].reshape(len(self.markerIDs),self.bytesPerMarker)
+		#byte and position within the byte of each trio member, in the order of idColumns
+		self.sampleBytes = self.sampleIndices >> 2
+		self.sampleShifts = self.sampleIndices & 3
+		self.maleColumns = np.array([],dtype=np.intp)
+
+	###Trios of the .fam file: one header column per trio member, as the first two rows of a feature matrix (idColumns, memberTypeColumns)
+	def readFam(self,famFilename):
+		samples = [line.split()[:4] for line in open(famFilename,"r") if line.strip()]
+		self.nSamples = len(samples)
+		sampleIndex = dict(((fid,iid),x) for x,(fid,iid,pat,mat) in enumerate(samples))
+		self.idColumns = []
+		self.memberTypeColumns = []
+		sampleIndices = []
+		trioFamilies = set()
+		for fid,iid,pat,mat in samples:
+			if (fid,pat) not in sampleIndex or (fid,mat) not in sampleIndex:
+				continue
+			#only trios are handled: later offspring of the same family are not analysed
+			if fid in trioFamilies:
+				print "Family ",fid," has more than one offspring. Only the first trio will be analysed."
+				continue
+			trioFamilies.add(fid)
+			self.idColumns.extend([fid,fid,fid])
+			self.memberTypeColumns.extend(['1','2','3'])
+			sampleIndices.extend([sampleIndex[(fid,pat)],sampleIndex[(fid,mat)],sampleIndex[(fid,iid)]])
+		self.sampleIndices = np.array(sampleIndices,dtype=np.intp)
+
+	def readBim(self,bimFilename):
+		self.markerIDs = []
+		for line in open(bimFilename,"r"):
+			columns = line.split()
+			if columns:
+				self.markerIDs.append(getMarkerID(columns[0],columns[3]))
+		self.isChrX = np.array([x.startswith("chrX") or x.startswith("chr23") for x in self.markerIDs],dtype=bool)
+
+	###Columns (in idColumns order) of the male trio members, converted to hemizygous genotypes on chrX
+	def setMaleColumns(self,maleColumns):
+		self.maleColumns = np.array(maleColumns,dtype=np.intp)
+
+	###Genotypes of the markers (array of marker indices) as a (nMarkers x nTrioMembers) int8 array, columns in idColumns order
+	def readGenotypes(self,markers):
+		genotypes = byteGenotypes[self.bed[markers][:,self.sampleBytes],self.sampleShifts]
+		chrXRows = np.nonzero(self.isChrX[markers])[0]
+		if len(chrXRows) and len(self.maleColumns):
+			males = genotypes[chrXRows.reshape(-1,1),self.maleColumns]
+			genotypes[chrXRows.reshape(-1,1),self.maleColumns] = maleChrXGenotypes[males]
+		return genotypes
@@ -0,0 +1,78 @@
+import os
+import time
+import json
+import platform
+
+#Run metrics of scanTDT.py: cumulative seconds per pipeline stage and marker counters, and the JSON heartbeat file (-heartbeat).
+#With -workers, each worker process measures the chunks it processes and its values are added to the totals of the main process,
+#so stage seconds are summed over processes and can exceed the elapsed time.
+
+#read: feature matrix lines read and decompressed; parse: lines split into a genotype matrix (PLINK: .bed decoding);
+#validate: genotype checks; MAF: allele and genotype counts; prefilter: -min-maf/-min-informative/-max-missing/-max-mie-rate; classification: trio type counts and MIE messages;
+#tests: TDT/FBAT statistics (with -stats-cache, also the p-values of new count signatures); permutations: empirical p-values (-permutations); pvalues: p-value evaluation; output: output rows formatted and written
+STAGES = ['read','parse','validate','MAF','prefilter','classification','tests','permutations','pvalues','output']
+#markersRead: marker lines (or PLINK markers) read; markersTested: markers with output rows; skippedInvalid: invalid or no called genotypes;
+#skippedUntested: chrY/chrM markers; mie: Mendelian inconsistent trios (sum of nMIE); markersWithMIE: markers with nMIE > 0;
+#permutations: permutations drawn (-permutations); skippedMultiallelic: multi-allelic VCF markers left out (-vcf-multiallelic=skip);
+#skippedPrefilter: markers dropped by the pre-filter; statisticsCacheHits/statisticsCacheMisses: markers tested with cached statistics and
+#count signatures computed (-stats-cache)
+COUNTERS = ['markersRead','markersTested','skippedInvalid','skippedUntested','mie','markersWithMIE','permutations','skippedMultiallelic','skippedPrefilter','statisticsCacheHits','statisticsCacheMisses']
+
+##----------------------------------------------------------------------------------------------------------------------------------------------------
+class RunMetrics:
+
+	###METHODS
+	def __init__(self):
+		self.startTime = time.time()
+		self.reset()
+
+	def reset(self):
+		self.stageSeconds = dict((stage,0.0) for stage in STAGES)
+		self.counters = dict((counter,0) for counter in COUNTERS)
+
+	###Add the time since start (a time.time() value) to a stage
+	def addTime(self,stage,start):
+		self.stageSeconds[stage] += time.time()-start
+
+	def count(self,counter,n=1):
+		self.counters[counter] += n
+
+	###(stage seconds, counters) of a worker process, to be added to the main process with merge
+	def getValues(self):
+		return self.stageSeconds.copy(),self.counters.copy()
+
+	def merge(self,values):
+		stageSeconds,counters = values
+		for stage in STAGES:
+			self.stageSeconds[stage] += stageSeconds[stage]
+		for counter in COUNTERS:
+			self.counters[counter] += counters[counter]
+
+	###Heartbeat record. progress is the fraction of the input read (None when unknown); the ETA assumes a constant rate
+	def getReport(self,status,inputFilename,progress):
+		elapsed = time.time()-self.startTime
+		eta = None
+		if progress is not None and progress > 0:
+			eta = round(elapsed*(1.0-progress)/progress,1)
+		return {
+			'status':status,
+			'host':platform.node(),
+			'pid':os.getpid(),
+			'input':inputFilename,
+			'time':time.strftime("%Y-%m-%dT%H:%M:%S"),
+			'elapsedSeconds':round(elapsed,3),
+			'markersPerSecond':round(self.counters['markersRead']/max(elapsed,1e-9),1),
+			'progress':None if progress is None else round(progress,4),
+			'etaSeconds':eta,
+			'counters':self.counters,
+			'stageSeconds':dict((stage,round(seconds,3)) for stage,seconds in self.stageSeconds.items()),
+		}
+
+##Write a heartbeat record. The file is replaced in one rename, so readers never see a partial record
+def writeHeartbeat(filename,report):
+	temporaryFilename = filename+".tmp"
+	heartbeatFile = open(temporaryFilename,"w")
+	json.dump(report,heartbeatFile,indent=1,sort_keys=True)
+	heartbeatFile.write("\n")
+	heartbeatFile.close()
+	os.rename(temporaryFilename,filename)
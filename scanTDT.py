@@ -1,19 +1,65 @@
+import os
 import sys
+import time
 import string
 import gzip
+import itertools
+import collections
+import StringIO
 import numpy as np
-from classMarker import AutosomalMarker,ChrXMarker
+from classMarker import AutosomalMarker,ChrXMarker,getMarkerClass
+from trioClassifier import TrioClassifier,KERNELS
+from pedigreeMetadata import PedigreeMetadata
+from pValues import setPValueColumns,setBackend,BACKENDS
+from blockStatistics import computeBlockStatistics,getStatisticColumns,getSelectedModels
+from featureMatrixIndex import BgzfReader,readIndex,readRegionLines,readRecordLines,parseRegion,parseMarkerID,isInRegions,INDEX_SUFFIX
+from plinkReader import PlinkReader
+from vcfReader import VcfReader,MULTIALLELIC_OPTIONS
+from markerFilter import MarkerFilter,formatSkipLines,SKIP_FILE_HEADER
+from statisticsCache import StatisticsCache
+from shards import Shard,parseShard,writeShardFile,SHARD_MODES,SHARD_SUFFIX
+from pipeStreams import StreamReader,redirectStdoutToStderr,isBrokenPipe,discardOutput,STREAM_FILENAME
+from hitReport import HitReport
+from featureMatrixReader import parseMarkerLines
+from runMetrics import RunMetrics,writeHeartbeat
+from permutations import AdaptivePermutations,getPermutationColumns
+from columnarOutput import ColumnarWriter,getColumnSpecs,toColumnArrays
+from trioClassifier import countVectorNames
+from countStore import createCountStore
+from checkpoint import getFileFingerprint,writeCheckpoint,readCheckpoint,validateCheckpoint,CHECKPOINT_SUFFIX,CHECKPOINT_VERSION
 
 #USAGE:  python scanTDT.py 
-#-fm=<featurematrix.txt> <required>
+#-fm=<featurematrix.txt> OR <plink prefix>.bed OR - <required> (PLINK .bed/.bim/.fam: trios are taken from the .fam file; - reads a plain or gzip feature matrix from the standard input)
 #-phenotype=<phenotype.txt> <required>
 #-pedigrees=<pedID.txt> OR DEFAULT to all trios in the fm 
 #-offset=<a number between 0 and 1> DEFAULT is 0.5 to give equal and opposite weightage to cases and controls (used only for FBAT)
 #-test=tdt OR fbat OR omit to run both
 #-version=scan OR std OR omit to run both (NOTE: standard score is computed and reported even with scanFBAT)
 #-models=a(dditive) OR d(ominant) OR r(ecessive) OR DEFAULT to additive 
-#-out=<output file path> or DEFAULT to tdt.out.gz
+#-out=<output file path> OR - or DEFAULT to tdt.out.gz. - writes the uncompressed output rows to the standard output, flushed after each block; log messages then go to the standard error
+#-out-format=text OR npy (or columnar) OR text,npy OR none DEFAULT is text. npy writes typed column arrays and a schema to <out without .gz>.columns/ (see columnarOutput.py); none writes no per-marker output (with -report-pvalue, -top-k or -save-counts)
 #-gender=<NB gender file path> <required> (column 1 is pedID of the NB, column 2 is '1' for male, '2' for female)
+#-block-size=<number of lines> DEFAULT is 5000. The feature matrix is read, trio types are counted, tests run and p-values evaluated one block of markers at a time
+#-workers=<number of processes> (or -threads) DEFAULT is 1. Blocks of markers are processed in parallel; output is written in input order
+#-kernel=bincount OR bitplane DEFAULT is bincount. Trio code histograms are computed with np.bincount over trio codes or with ANDs and popcounts over packed bit-planes (see bitPlanes.py)
+#-pvalue-backend=scipy OR gsl OR fast DEFAULT is scipy. gsl uses the ctypes wrapper in gsl.py (scipy is used when libgsl is missing); fast is a vectorized numpy erfc, see pValues.py
+#-region=<chr:start-end> OR -chr=<chr1,chr2,...> DEFAULT is the whole feature matrix. Needs a feature matrix indexed with featureMatrixIndex.py; -region may be given more than once
+#-heartbeat=<file.json> DEFAULT none. Run metrics (stage seconds, marker counters, markers/sec, ETA) are written to this file every -heartbeat-interval seconds (DEFAULT 60) and at the end of the run, see runMetrics.py
+#-permutations=<maximum permutations per marker> DEFAULT 0 (none). Adds adaptive permutation p-values of the standard TDT and FBAT statistics, see permutations.py.
+#	-permutation-hits=<number> DEFAULT 20: a marker stops once this many permuted statistics are as extreme as the observed one. -permutation-seed=<integer> DEFAULT 1
+#-profile=<file.prof> DEFAULT none. cProfile statistics of the chunks overlapping -profile-markers=<first>-<last> (1-based, in input order; DEFAULT all markers) are written to this file. View them with python -m pstats
+#-save-counts=<directory> DEFAULT none. The trio type count vectors of each marker are also written to this count store, from which countStore.py recomputes any test, model or offset without reading the feature matrix
+#-vcf=<file.vcf OR file.vcf.gz OR -> instead of -fm, with -vcf-trios=<sidecar file> <required with -vcf>: one line per trio member with the VCF sample name, trio id and member type (1/2/3).
+#	-vcf-multiallelic=skip OR split DEFAULT is skip. Only GT is read; multi-allelic markers are skipped or split into one marker per ALT allele, see vcfReader.py
+#-min-maf=<MAF> -min-informative=<complete informative trios> -max-missing=<fraction of ./. genotypes> -max-mie-rate=<fraction of trios with MIE> DEFAULT none.
+#	Markers failing any of these are dropped before trio types are counted and tests run, see markerFilter.py. -skip-file=<file> DEFAULT none lists them
+#-stats-cache=<count signatures> DEFAULT is 0 (none). Statistics and p-values are cached for this many trio type count signatures per chromosome class and reused by markers with the same counts, see statisticsCache.py
+#-shard=<i>/<N> DEFAULT none. Only shard i of N deterministic slices of the markers is read, -shard-by=bytes (byte ranges realigned to lines) OR chromosome (groups of
+#	chromosomes of about the same length) DEFAULT is bytes. <out>.shard records the shard; merge the shard outputs with shards.py
+#-report-pvalue=<p-value threshold> AND/OR -top-k=<number of markers> DEFAULT none. The markers with a p-value at most the threshold in -report-column=<p-value column> (DEFAULT the first
+#	p-value column), and/or the K smallest, are written sorted by p-value to -hits-file=<file> DEFAULT <out without .gz>.hits.txt, see hitReport.py
+#-checkpoint-interval=<seconds> DEFAULT 0 (none). The output is flushed and the input position written to <out>.checkpoint every this many seconds, see checkpoint.py
+#-resume continues the run of <out>.checkpoint after the markers already written (a new run is started when there is no checkpoint). Input files and options that change the output must be those of the checkpointed run
 
 #INPUT FORMATS
 #feature matrix - first row contains trio ids, second row indicates member type: 1 (father), 2(mother), 3(offspring). 
@@ -29,13 +75,26 @@ from classMarker import AutosomalMarker,ChrXMarker
 #####################################
 ##GLOBAL VARIABLES and LOOK-UP TABLES
 headerColumns = []
-pedIDs = []
-pedMemberIndices = {}
-pedMemberType = {}
-pedPhenoDict = {}
-pedNBGender = {}
+pedigreeMetadata = None
 idColumns = []
 memberTypeColumns = []
+trioClassifier = None
+markerBlock = []
+genotypeBlock = []
+resultBlock = []
+countBlock = []
+pValueColumns = []
+columnSpecs = []
+countColumns = []
+runMetrics = RunMetrics()
+lastHeartbeat = 0.0
+inputSize = 0
+profiler = None
+permutationEngine = None
+checkpoint = None
+lastCheckpoint = 0.0
+inputPosition = None
+outputRows = 0
 
 FM_FILENAME=""                    #required
 PHENO_FILENAME=""                 #required
@@ -45,13 +104,58 @@ TEST=""                           #optional
 VERSION=""                        #optional
 MODELS=[]                         #optional
 OUTPUT_FILENAME = "tdt.out.gz"    #optional
+OUTPUT_FORMATS = ["text"]         #optional
 GENDER_FILENAME = ""
+BLOCK_SIZE = 5000                 #optional
+WORKERS = 1                       #optional
+REGIONS = []                      #optional
+KERNEL = "bincount"               #optional
+PVALUE_BACKEND = "scipy"          #optional
+HEARTBEAT_FILENAME = ""           #optional
+HEARTBEAT_INTERVAL = 60.0         #optional
+PROFILE_FILENAME = ""             #optional
+PROFILE_MARKERS = None            #optional
+PERMUTATIONS = 0                  #optional
+PERMUTATION_HITS = 20             #optional
+PERMUTATION_SEED = 1              #optional
+SAVE_COUNTS_DIRECTORY = ""        #optional
+CHECKPOINT_INTERVAL = 0.0         #optional
+RESUME = False                    #optional
+FM_FORMAT = ""                    #optional, "vcf" with -vcf
+VCF_TRIOS_FILENAME = ""           #required with -vcf
+VCF_MULTIALLELIC = "skip"         #optional
+MIN_MAF = 0.0                     #optional
+MIN_INFORMATIVE = 0               #optional
+MAX_MISSING = 1.0                 #optional
+MAX_MIE_RATE = 1.0                #optional
+SKIP_FILENAME = ""                #optional
+STATS_CACHE_ENTRIES = 0           #optional
+SHARD = None                      #optional, (i,N)
+SHARD_BY = "bytes"                #optional
+REPORT_PVALUE = None              #optional
+TOP_K = 0                         #optional
+REPORT_COLUMN = ""                #optional
+HITS_FILENAME = ""                #optional
 
 fmFile = None
+fmLines = None
+plinkReader = None
+vcfReader = None
 phenoFile = None
 pedIDFile = None
 outputFile = None
+outputRawFile = None
 genderFile = None
+columnarWriter = None
+countStore = None
+skipFile = None
+markerFilter = None
+statisticsCache = None
+shard = None
+headerBytes = None
+outputStream = None
+hitReport = None
+hitsFile = None
 
 ############################################
 #####FUNCTION DEFINITIONS
@@ -64,15 +168,53 @@ def readInputArguments():
 	global VERSION
 	global MODELS
 	global OUTPUT_FILENAME
+	global OUTPUT_FORMATS
 	global GENDER_FILENAME
+	global BLOCK_SIZE
+	global WORKERS
+	global REGIONS
+	global KERNEL
+	global PVALUE_BACKEND
+	global HEARTBEAT_FILENAME
+	global HEARTBEAT_INTERVAL
+	global PROFILE_FILENAME
+	global PROFILE_MARKERS
+	global PERMUTATIONS
+	global PERMUTATION_HITS
+	global PERMUTATION_SEED
+	global SAVE_COUNTS_DIRECTORY
+	global CHECKPOINT_INTERVAL
+	global RESUME
+	global FM_FORMAT
+	global VCF_TRIOS_FILENAME
+	global VCF_MULTIALLELIC
+	global MIN_MAF
+	global MIN_INFORMATIVE
+	global MAX_MISSING
+	global MAX_MIE_RATE
+	global SKIP_FILENAME
+	global STATS_CACHE_ENTRIES
+	global SHARD
+	global SHARD_BY
+	global outputStream
+	global REPORT_PVALUE
+	global TOP_K
+	global REPORT_COLUMN
+	global HITS_FILENAME
 
         #PARSE COMMAND LINE ARGS. (3 of the above arguments are required)
         assert (len(sys.argv) >=4 ), 'Insufficient number of arguments.'
+	#with -out=- the standard output holds only the output rows: log messages go to the standard error from the first one
+	if "out="+STREAM_FILENAME in [x.replace(" ","").lower().lstrip("-") for x in sys.argv[1:]]:
+		outputStream = redirectStdoutToStderr()
 
         while len(sys.argv) > 1:
                 # Command line arguments containing '=' are implicitly options.
                 thisArg = sys.argv.pop(1)
-                if thisArg.find("=")==-1:
+		#-resume is the only option without a value
+		if thisArg.lower().strip("- ") == "resume":
+			RESUME = True
+                elif thisArg.find("=")==-1:
                         print 'Unrecognised argument: '+thisArg
                         sys.exit(1)
                 else:
@@ -99,13 +241,139 @@ def readInputArguments():
                                 OUTPUT_FILENAME = value.strip(" ")
 			elif name == "gender":
 				GENDER_FILENAME = value.strip(" ")
+			elif name == "out-format":
+				OUTPUT_FORMATS = ["npy" if x == "columnar" else x for x in value.lower().strip(" ").split(",") if x]
+			elif name == "block-size":
+				BLOCK_SIZE = int(value.strip(" "))
+			elif name == "workers" or name == "threads":
+				WORKERS = int(value.strip(" "))
+			elif name == "kernel":
+				KERNEL = value.lower().strip(" ")
+			elif name == "pvalue-backend":
+				PVALUE_BACKEND = value.lower().strip(" ")
+			elif name == "region":
+				REGIONS.append(parseRegion(value))
+			elif name == "chr":
+				REGIONS.extend([parseRegion(x) for x in value.split(",") if x.strip()])
+			elif name == "heartbeat":
+				HEARTBEAT_FILENAME = value.strip(" ")
+			elif name == "heartbeat-interval":
+				HEARTBEAT_INTERVAL = float(value.strip(" "))
+			elif name == "profile":
+				PROFILE_FILENAME = value.strip(" ")
+			elif name == "profile-markers":
+				PROFILE_MARKERS = [int(x) for x in value.strip(" ").split("-")]
+			elif name == "permutations":
+				PERMUTATIONS = int(float(value.strip(" ")))
+			elif name == "permutation-hits":
+				PERMUTATION_HITS = int(value.strip(" "))
+			elif name == "permutation-seed":
+				PERMUTATION_SEED = int(value.strip(" "))
+			elif name == "save-counts":
+				SAVE_COUNTS_DIRECTORY = value.strip(" ")
+			elif name == "checkpoint-interval":
+				CHECKPOINT_INTERVAL = float(value.strip(" "))
+			elif name == "vcf":
+				FM_FILENAME = value.strip(" ")
+				FM_FORMAT = "vcf"
+			elif name == "vcf-trios":
+				VCF_TRIOS_FILENAME = value.strip(" ")
+			elif name == "vcf-multiallelic":
+				VCF_MULTIALLELIC = value.lower().strip(" ")
+			elif name == "min-maf":
+				MIN_MAF = float(value.strip(" "))
+			elif name == "min-informative":
+				MIN_INFORMATIVE = int(value.strip(" "))
+			elif name == "max-missing":
+				MAX_MISSING = float(value.strip(" "))
+			elif name == "max-mie-rate":
+				MAX_MIE_RATE = float(value.strip(" "))
+			elif name == "skip-file":
+				SKIP_FILENAME = value.strip(" ")
+			elif name == "stats-cache":
+				STATS_CACHE_ENTRIES = int(value.strip(" "))
+			elif name == "shard":
+				SHARD = value.strip(" ")
+			elif name == "shard-by":
+				SHARD_BY = value.lower().strip(" ")
+			elif name == "report-pvalue":
+				REPORT_PVALUE = float(value.strip(" "))
+			elif name == "top-k":
+				TOP_K = int(value.strip(" "))
+			elif name == "report-column":
+				REPORT_COLUMN = value.strip(" ")
+			elif name == "hits-file":
+				HITS_FILENAME = value.strip(" ")
+			elif name == "resume":
+				RESUME = value.lower().strip(" ") not in ["0","false","no"]
                         else:
                                 print "unrecognized option:", name
                                 sys.exit(1)
 
         assert (FM_FILENAME <> ""), 'Feature matrix path was not provided'
+	if FM_FORMAT == "vcf" and VCF_TRIOS_FILENAME == "":
+		print "-vcf needs the trio members of the VCF samples: -vcf-trios=<file>"
+		sys.exit(1)
+	if FM_FORMAT == "vcf" and REGIONS:
+		print "-region and -chr are not supported with -vcf"
+		sys.exit(1)
+	if not (0 <= MIN_MAF <= 0.5 and MIN_INFORMATIVE >= 0 and 0 <= MAX_MISSING <= 1 and 0 <= MAX_MIE_RATE <= 1):
+		print "-min-maf must be in [0,0.5], -min-informative >= 0, and -max-missing and -max-mie-rate in [0,1]"
+		sys.exit(1)
+	if SHARD is not None:
+		try:
+			SHARD = parseShard(SHARD)
+		except ValueError as e:
+			print str(e)
+			sys.exit(1)
+	if SHARD_BY not in SHARD_MODES:
+		print "Unrecognised -shard-by: "+SHARD_BY+" (options: "+", ".join(SHARD_MODES)+")"
+		sys.exit(1)
+	if SHARD and REGIONS:
+		print "-shard cannot be combined with -region or -chr"
+		sys.exit(1)
+	#streams are read and written once, from start to end
+	if FM_FILENAME == STREAM_FILENAME and (REGIONS or SHARD or RESUME or CHECKPOINT_INTERVAL > 0):
+		print "-region, -chr, -shard, -checkpoint-interval and -resume need an input file, not the standard input"
+		sys.exit(1)
+	if OUTPUT_FILENAME == STREAM_FILENAME and (SHARD or RESUME or CHECKPOINT_INTERVAL > 0 or "npy" in OUTPUT_FORMATS):
+		print "-shard, -checkpoint-interval, -resume and -out-format=npy need an output file, not the standard output"
+		sys.exit(1)
+	#byte ranges need a seekable input: gzip files are read through from the start, except indexed feature matrices
+	if SHARD and SHARD_BY == "bytes" and FM_FILENAME.endswith("gz") and (FM_FORMAT == "vcf" or not os.path.exists(FM_FILENAME+INDEX_SUFFIX)):
+		print "-shard-by=bytes needs an uncompressed feature matrix or VCF file, a feature matrix indexed with featureMatrixIndex.py or a PLINK .bed file. Use -shard-by=chromosome for "+FM_FILENAME
+		sys.exit(1)
+	if VCF_MULTIALLELIC not in MULTIALLELIC_OPTIONS:
+		print "Unrecognised -vcf-multiallelic: "+VCF_MULTIALLELIC+" (options: "+", ".join(MULTIALLELIC_OPTIONS)+")"
+		sys.exit(1)
         assert (PHENO_FILENAME <> ""), 'Phenotype file path was not provided'
 	assert (GENDER_FILENAME <> ""), 'Gender file path was not provided'
+	if KERNEL not in KERNELS:
+		print "Unrecognised kernel: "+KERNEL
+		sys.exit(1)
+	if PVALUE_BACKEND not in BACKENDS:
+		print "Unrecognised p-value backend: "+PVALUE_BACKEND
+		sys.exit(1)
+	if PROFILE_MARKERS is not None and (len(PROFILE_MARKERS) <> 2 or PROFILE_MARKERS[0] < 1 or PROFILE_MARKERS[1] < PROFILE_MARKERS[0]):
+		print "-profile-markers must be <first>-<last>, with 1 <= first <= last"
+		sys.exit(1)
+	if not OUTPUT_FORMATS or [x for x in OUTPUT_FORMATS if x not in ["text","npy","none"]] or ("none" in OUTPUT_FORMATS and len(OUTPUT_FORMATS) > 1):
+		print "Unrecognised output format: "+",".join(OUTPUT_FORMATS)+" (options: text, npy or columnar, or none)"
+		sys.exit(1)
+	if (REPORT_PVALUE is not None and not 0 < REPORT_PVALUE <= 1) or TOP_K < 0:
+		print "-report-pvalue must be in (0,1] and -top-k >= 0"
+		sys.exit(1)
+	if "none" in OUTPUT_FORMATS and REPORT_PVALUE is None and TOP_K == 0 and SAVE_COUNTS_DIRECTORY == "":
+		print "-out-format=none writes no per-marker output: use it with -report-pvalue, -top-k or -save-counts"
+		sys.exit(1)
+	if (REPORT_PVALUE is not None or TOP_K > 0) and HITS_FILENAME == "":
+		if OUTPUT_FILENAME == STREAM_FILENAME:
+			print "-report-pvalue and -top-k need -hits-file with -out=-"
+			sys.exit(1)
+		HITS_FILENAME = (OUTPUT_FILENAME[:-len(".gz")] if OUTPUT_FILENAME.endswith(".gz") else OUTPUT_FILENAME)+".hits.txt"
+	if PERMUTATIONS < 0 or PERMUTATION_HITS < 1:
+		print "-permutations must be >= 0 and -permutation-hits >= 1"
+		sys.exit(1)
 
 def createFileObjects():
 	global FM_FILENAME
@@ -116,17 +384,55 @@ def createFileObjects():
 	global GENDER_FILENAME
 
 	global fmFile
+	global fmLines
+	global plinkReader
+	global vcfReader
 	global phenoFile
 	global pedIDFile
 	global outputFile
+	global outputRawFile
 	global genderFile
+	global skipFile
+	global shard
 	
+	if SHARD:
+		shard = Shard(SHARD[0],SHARD[1],SHARD_BY)
 	#INPUT: feature matrix - first row contains pedigree ids, second row indicates member type: 1 (father), 2(mother), 3(newborn). (not assuming that pedIDs are part of sample IDs)
 	#Cell values set to 0 (ref homozygous), 1 (heterozygous), 2 (non ref homozygous), or NA (missing)
-	if FM_FILENAME.endswith("gz"):
+	#PLINK binary genotypes are memory-mapped; trios and member types come from the .fam file (see plinkReader.py)
+	if FM_FILENAME.endswith(".bed"):
+		plinkReader = PlinkReader(FM_FILENAME)
+	#VCF genotypes are read as a stream of marker lines after the VCF header; trios and member types come from the -vcf-trios file (see vcfReader.py)
+	elif FM_FORMAT == "vcf":
+		vcfReader = VcfReader(FM_FILENAME,VCF_TRIOS_FILENAME,VCF_MULTIALLELIC)
+		fmFile = vcfReader.file
+		fmLines = fmFile
+	#With -region/-chr, only the index records overlapping the regions are decompressed (see featureMatrixIndex.py); a shard of an indexed
+	#feature matrix reads the index records of its slice (see shards.py)
+	#-fm=- reads a plain or gzip feature matrix from the standard input (see pipeStreams.py)
+	elif FM_FILENAME == STREAM_FILENAME:
+		fmFile = StreamReader(sys.stdin)
+		fmLines = fmFile
+	elif REGIONS or (SHARD and os.path.exists(FM_FILENAME+INDEX_SUFFIX)):
+		try:
+			indexRecords = readIndex(FM_FILENAME)
+		except IOError:
+			print 'Feature matrix index '+FM_FILENAME+INDEX_SUFFIX+' not found. Index the feature matrix with featureMatrixIndex.py to use -region or -chr'
+			sys.exit(1)
+		fmFile = BgzfReader(FM_FILENAME)
+		if REGIONS:
+			fmLines = readRegionLines(fmFile,indexRecords,REGIONS)
+		else:
+			fmLines = readRecordLines(fmFile,shard.selectRecords(indexRecords,os.path.getsize(FM_FILENAME)))
+	elif FM_FILENAME.endswith("gz"):
 	        fmFile = gzip.open(FM_FILENAME,"r")
+	        fmLines = fmFile
 	else:
         	fmFile = open(FM_FILENAME,"r")
+        	fmLines = fmFile
+	#other inputs are read through for the lines of the shard chromosomes; byte ranges of uncompressed files are selected in readChunks
+	if shard and SHARD_BY == "chromosome" and not plinkReader and fmLines is fmFile:
+		fmLines = shard.readChromosomeLines(fmLines,lambda line: parseMarkerID(line[:line.find("\t")])[0])
 
 	#INPUT: phenotype file - 2 column file with pedigree ids in first column, affection status in second column (1 = control, 2 = case)
 	phenoFile = open(PHENO_FILENAME,"r")
@@ -140,79 +446,540 @@ def createFileObjects():
                 genderFile = open(GENDER_FILENAME,"r")
 
 	#OUTPUT: output file
-	if not OUTPUT_FILENAME.endswith(".gz"):
+	if not OUTPUT_FILENAME.endswith(".gz") and OUTPUT_FILENAME <> STREAM_FILENAME:
 	        OUTPUT_FILENAME = OUTPUT_FILENAME+".gz"
 
-	outputFile = gzip.open(OUTPUT_FILENAME,"w")
+	#a resumed run appends to the output written up to the checkpoint
+	readRunCheckpoint()
+	if "text" in OUTPUT_FORMATS:
+		#-out=- writes uncompressed rows to the standard output
+		if outputStream:
+			outputFile = outputStream
+		elif checkpoint:
+			outputRawFile = open(OUTPUT_FILENAME,"r+b")
+			outputRawFile.truncate(checkpoint['outputBytes'])
+			outputRawFile.seek(0,os.SEEK_END)
+		else:
+			outputRawFile = open(OUTPUT_FILENAME,"wb")
+		if outputRawFile:
+			outputFile = openOutputMember()
+
+	#the shard file of an earlier run of this shard is only valid once this run is complete
+	if shard and not checkpoint and os.path.exists(OUTPUT_FILENAME+SHARD_SUFFIX):
+		os.remove(OUTPUT_FILENAME+SHARD_SUFFIX)
+
+	#OUTPUT: markers dropped by the pre-filter
+	if SKIP_FILENAME <> "":
+		if checkpoint:
+			skipFile = open(SKIP_FILENAME,"r+")
+			skipFile.truncate(checkpoint['skipBytes'])
+			skipFile.seek(0,os.SEEK_END)
+		else:
+			skipFile = open(SKIP_FILENAME,"w")
+			skipFile.write(SKIP_FILE_HEADER)
 
 	
 
-def getPedIDs():
-        global pedIDFile
-	global pedIDs
-	global idColumns
+##Gzip member of the text output, written to the end of outputRawFile. Each checkpoint closes the member and starts a new one
+def openOutputMember():
+	return gzip.GzipFile(OUTPUT_FILENAME,"wb",9,outputRawFile)
+
+##Options that change the output, which must not change when a run is resumed (-block-size, -workers, -kernel, -heartbeat and -profile do not)
+def getCheckpointOptions():
+	return {'fm':FM_FILENAME,'phenotype':PHENO_FILENAME,'pedigrees':PED_FILENAME,'gender':GENDER_FILENAME,'offset':OFFSET,'test':TEST,'version':VERSION,
+		'models':MODELS,'out-format':OUTPUT_FORMATS,'region':REGIONS,'pvalue-backend':PVALUE_BACKEND,'permutations':PERMUTATIONS,
+		'permutation-hits':PERMUTATION_HITS,'permutation-seed':PERMUTATION_SEED,'save-counts':SAVE_COUNTS_DIRECTORY,
+		'vcf-trios':VCF_TRIOS_FILENAME,'vcf-multiallelic':VCF_MULTIALLELIC,'min-maf':MIN_MAF,'min-informative':MIN_INFORMATIVE,'max-missing':MAX_MISSING,
+		'max-mie-rate':MAX_MIE_RATE,'skip-file':SKIP_FILENAME,'shard':SHARD,'shard-by':SHARD_BY,'report-pvalue':REPORT_PVALUE,'top-k':TOP_K,
+		'report-column':REPORT_COLUMN,'hits-file':HITS_FILENAME}
 
-	#READ pedigree ids to analyze. If no pedIDFile has been provided, pedIDs vector contains all the pedigree ids from the header line of the feature matrix
-        if pedIDFile:
-                pedIDs = pedIDFile.read().split()
-        else:
-                pedIDs = list(set(idColumns))
-	#NOTE:pedIDs does not retain the order of predigrees in the input feature matrix
-        #DEBUG
-#       print pedIDs,len(pedIDs)
+##Fingerprints of the input files (see checkpoint.py); a PLINK input is its .bed, .bim and .fam files
+def getInputFingerprints():
+	fingerprints = {'phenotype':getFileFingerprint(PHENO_FILENAME),'gender':getFileFingerprint(GENDER_FILENAME)}
+	if FM_FILENAME.endswith(".bed"):
+		for suffix in [".bed",".bim",".fam"]:
+			fingerprints['fm'+suffix] = getFileFingerprint(FM_FILENAME[:-len(".bed")]+suffix)
+	else:
+		fingerprints['fm'] = getFileFingerprint(FM_FILENAME)
+	if VCF_TRIOS_FILENAME <> "":
+		fingerprints['vcf-trios'] = getFileFingerprint(VCF_TRIOS_FILENAME)
+	if PED_FILENAME <> "":
+		fingerprints['pedigrees'] = getFileFingerprint(PED_FILENAME)
+	return fingerprints
+
+##With -resume, read and validate the checkpoint of the output file. The run stops when the options or the input files have changed,
+#or when the checkpointed run is complete
+def readRunCheckpoint():
+	global checkpoint
+	global CHECKPOINT_INTERVAL
+
+	checkpointFilename = OUTPUT_FILENAME+CHECKPOINT_SUFFIX
+	if not RESUME:
+		return
+	if not os.path.exists(checkpointFilename):
+		print 'No checkpoint '+checkpointFilename+' found, starting a new run'
+		return
+	checkpoint = readCheckpoint(checkpointFilename)
+	messages = validateCheckpoint(checkpoint,getCheckpointOptions(),getInputFingerprints())
+	if messages:
+		print 'Cannot resume from '+checkpointFilename+':'
+		for message in messages:
+			print '  '+message
+		sys.exit(1)
+	if checkpoint['status'] == "complete":
+		print 'The run of '+checkpointFilename+' is complete'
+		sys.exit(0)
+	if CHECKPOINT_INTERVAL == 0:
+		CHECKPOINT_INTERVAL = checkpoint['interval']
+	print 'Resuming after '+str(checkpoint['markersDone'])+' markers ('+str(checkpoint['outputRows'])+' output rows) from '+checkpointFilename
+
+##Write the checkpoint of the output written so far (-checkpoint-interval): status is "running", or "complete" once all outputs are closed.
+#While running, the gzip member of the text output is closed and its bytes synced to disk, so the output up to outputBytes is a complete gzip file
+def writeRunCheckpoint(status="running"):
+	global outputFile
+	global lastCheckpoint
 
+	outputBytes = None
+	if status == "running":
+		if outputFile:
+			outputFile.close()
+			outputRawFile.flush()
+			os.fsync(outputRawFile.fileno())
+			outputBytes = outputRawFile.tell()
+			outputFile = openOutputMember()
+		if columnarWriter:
+			columnarWriter.flush()
+		if countStore:
+			countStore.flush()
+		if skipFile:
+			skipFile.flush()
+			os.fsync(skipFile.fileno())
+		if hitsFile:
+			hitsFile.flush()
+			os.fsync(hitsFile.fileno())
+	elif "text" in OUTPUT_FORMATS:
+		outputBytes = os.path.getsize(OUTPUT_FILENAME)
+	markersDone,inputOffset = inputPosition
+	writeCheckpoint(OUTPUT_FILENAME+CHECKPOINT_SUFFIX,{
+		'version':CHECKPOINT_VERSION,
+		'status':status,
+		'time':time.strftime("%Y-%m-%dT%H:%M:%S"),
+		'interval':CHECKPOINT_INTERVAL,
+		'options':getCheckpointOptions(),
+		'fingerprints':getInputFingerprints(),
+		'markersDone':markersDone,
+		'inputOffset':inputOffset,
+		'outputBytes':outputBytes,
+		'outputRows':outputRows,
+		'columnChunkRows':columnarWriter.chunkRows if columnarWriter else None,
+		'countChunkRows':countStore.chunkRows if countStore else None,
+		'skipBytes':os.path.getsize(SKIP_FILENAME) if SKIP_FILENAME else None,
+		'headerBytes':headerBytes,
+		'hitsBytes':os.path.getsize(HITS_FILENAME) if hitsFile and status == "running" else None,
+		'counters':runMetrics.counters,
+	})
+	lastCheckpoint = time.time()
 
-def createPedPhenoDict():
+##Trio metadata from the feature matrix header, the pedigree list, and the phenotype and gender files, read in one pass each (see pedigreeMetadata.py).
+#If no pedIDFile has been provided, all the pedigree ids of the header line of the feature matrix are analysed
+def createPedigreeMetadata():
+	global pedIDFile
 	global phenoFile
-	global pedIDs
-	global pedPhenoDict
-
-        #get these pedigrees from phenotype file into a dictionary
-        for line in phenoFile:
-                columns = line.strip().split()
-                if columns[0] in pedIDs: 
-                        if columns[1].isdigit():
-				pedPhenoDict[columns[0]] = int(columns[1])
+	global genderFile
+	global pedigreeMetadata
+
+	selectedPedIDs = pedIDFile.read().split() if pedIDFile else None
+	pedigreeMetadata = PedigreeMetadata(idColumns,memberTypeColumns,selectedPedIDs,phenoFile,genderFile)
+	pedigreeMetadata.reportMismatches()
+
+##Process a chunk of feature matrix lines: the lines are parsed into a genotype matrix (see featureMatrixReader.py) and processed as a block.
+#Returns the output rows (see formatResultBlock). Used by both the serial and the multi-process (-workers) runs.
+def processMarkerLines(lines):
+	start = time.time()
+	#chrM and chrY are not tested
+	nLines = len(lines)
+	lines = [line for line in lines if getMarkerClass(line)]
+	runMetrics.count('skippedUntested',nLines-len(lines))
+	markerIDs,genotypes = parseMarkerLines(lines,len(idColumns))
+	runMetrics.addTime('parse',start)
+	return processGenotypeMatrix(markerIDs,genotypes)
+
+##Process a chunk of markers of a PLINK .bed file, given as an array of marker indices
+def processGenotypeBlock(markers):
+	start = time.time()
+	markerIDs = [plinkReader.markerIDs[x] for x in markers]
+	genotypes = plinkReader.readGenotypes(markers)
+	runMetrics.addTime('parse',start)
+	return processGenotypeMatrix(markerIDs,genotypes)
+
+##Process a chunk of VCF marker lines: GT calls are decoded into a genotype matrix (see vcfReader.py) and processed as a block
+def processVcfLines(lines):
+	start = time.time()
+	#chrM and chrY lines are left out by parseLines, multi-allelic lines too with -vcf-multiallelic=skip
+	markerIDs,genotypes,nUntested,skippedIDs = vcfReader.parseLines(lines)
+	runMetrics.addTime('parse',start)
+	runMetrics.count('skippedUntested',nUntested)
+	for markerID in skippedIDs:
+		print 'Multi-allelic marker found at ',markerID,'. This marker will not be tested.'
+	runMetrics.count('skippedMultiallelic',len(skippedIDs))
+	return processGenotypeMatrix(markerIDs,genotypes)
+
+##Check genotypes, compute MAF and variant distribution, count trio types and run the tests for a (nMarkers x nSamples) genotype matrix.
+#Genotype checks, allele counts and genotype counts are computed for all markers of a chromosome class at once (see TrioClassifier).
+#Returns the output rows (see formatResultBlock), the skip file lines of the markers dropped by the pre-filter and the hit report candidates
+def processGenotypeMatrix(markerIDs,genotypes):
+	global markerBlock
+	global genotypeBlock
+
+	markerClasses = [getMarkerClass(x) for x in markerIDs]
+	runMetrics.count('skippedUntested',markerClasses.count(None))
+	summaries = [None]*len(markerIDs)
+	skipReasons = [None]*len(markerIDs)
+	for isChrX in [False,True]:
+		rows = [x for x in range(len(markerIDs)) if markerClasses[x] and (markerClasses[x] is ChrXMarker) == isChrX]
+		if not rows:
+			continue
+		start = time.time()
+		isValid = trioClassifier.hasValidGenotypes(genotypes[rows],isChrX)
+		runMetrics.addTime('validate',start)
+		start = time.time()
+		refCounts,altCounts = trioClassifier.getAlleleCounts(genotypes[rows],isChrX)
+		nVariantTypes = trioClassifier.getVariantDistribution(genotypes[rows],isChrX)
+		runMetrics.addTime('MAF',start)
+		for row in range(len(rows)):
+			summaries[rows[row]] = (isValid[row],refCounts[row],altCounts[row],nVariantTypes[row])
+		#pre-filter of the valid markers (-min-maf, -min-informative, -max-missing, -max-mie-rate)
+		if markerFilter.isEnabled() and isValid.any():
+			start = time.time()
+			validRows = np.array(rows,dtype=np.intp)[isValid]
+			reasons = markerFilter.getSkipReasons(trioClassifier,genotypes[validRows],isChrX,refCounts[isValid],altCounts[isValid],nVariantTypes[isValid])
+			for row in range(len(validRows)):
+				skipReasons[validRows[row]] = reasons[row]
+			runMetrics.addTime('prefilter',start)
+
+	results = []
+	for x in range(len(markerIDs)):
+		if summaries[x] is None:
+			continue
+		#Note: thought of checking if chrX marker has heterozygous males, but it's not possible since the feature matrix comes in with encoded genotypes. 
+		#So all you can check is whether autosomal chrs have any genotypes other than 0/1/2/NA and chrX has any genotypes other that 0/1/NA for males, 0/1/2/NA for females
+		isValid,refCount,altCount,nVariantType = summaries[x]
+		if not isValid:
+			print 'Invalid genotype found at ',markerIDs[x],'. This marker will not be tested.'
+			runMetrics.count('skippedInvalid')
+			continue
+		if skipReasons[x]:
+			runMetrics.count('skippedPrefilter')
+			continue
+		#all genotypes missing (e.g. a VCF site with only ./. calls): there is no allele to count, so no MAF and no test
+		if refCount+altCount == 0:
+			print 'No called genotype found at ',markerIDs[x],'. This marker will not be tested.'
+			runMetrics.count('skippedInvalid')
+			continue
+		start = time.time()
+		thisMarker = markerClasses[x]()
+		thisMarker.markerID = markerIDs[x]
+		#COMPUTE ALLELE FREQUENCY and variant distribution
+		thisMarker.setGenotypeSummary(int(refCount),int(altCount),nVariantType.tolist())
+		try:
+			#assert that MAF is always positive
+			assert(thisMarker.maf >= 0)
+		except(AssertionError):
+			print 'Marker ',thisMarker.markerID,', MAF=',thisMarker.maf
+			exit(1)
+		runMetrics.addTime('MAF',start)
+
+		#trio types are counted and tests run for a block of markers at a time
+		markerBlock.append(thisMarker)
+		genotypeBlock.append(genotypes[x:x+1])
+		if len(markerBlock) >= BLOCK_SIZE:
+			results.append(processMarkerBlock())
+
+	results.append(processMarkerBlock())
+	resultText,columnChunks,countChunks,hitRows = joinResults(results)
+	return resultText,columnChunks,countChunks,formatSkipLines(markerIDs,skipReasons) if skipFile else '',hitRows
+
+##Count trio types and run the tests selected by the user for a block of markers, and format their output rows
+def processMarkerBlock():
+	global markerBlock
+	global genotypeBlock
+	global resultBlock
+	global countBlock
+	global trioClassifier
+
+	resultBlock = [None]*len(markerBlock)
+	countBlock = [None]*len(markerBlock)
+	mieTrios = [[] for x in range(len(markerBlock))]
+	#autosomal and chrX markers are counted and tested separately, output rows and MIE messages keep the input order
+	for isChrX in [False,True]:
+		rows = [x for x in range(len(markerBlock)) if isinstance(markerBlock[x],ChrXMarker) == isChrX]
+		if not rows:
+			continue
+		start = time.time()
+		genotypes = np.vstack([genotypeBlock[x] for x in rows])
+		#count complete and incomplete case and control trio types and populate corresponding vectors
+		counts = trioClassifier.countTrioTypes(genotypes,isChrX)
+		runMetrics.addTime('classification',start)
+		start = time.time()
+		#with -stats-cache, the p-values of the statistics are set here, for the signatures that are not cached
+		if statisticsCache:
+			statistics,nHits,nMisses = statisticsCache.getStatistics(counts,isChrX)
+			runMetrics.count('statisticsCacheHits',nHits)
+			runMetrics.count('statisticsCacheMisses',nMisses)
+		else:
+			statistics = computeBlockStatistics(counts,isChrX,TEST,VERSION,MODELS,OFFSET)
+		runMetrics.addTime('tests',start)
+		#empirical p-values are appended to the statistic columns (see permutations.py)
+		if permutationEngine:
+			start = time.time()
+			empiricalPValues,nPermutations = permutationEngine.getEmpiricalPValues([markerBlock[x].markerID for x in rows],counts,isChrX)
+			statistics = [statistics[row]+empiricalPValues[row] for row in range(len(rows))]
+			runMetrics.addTime('permutations',start)
+			runMetrics.count('permutations',nPermutations)
+		start = time.time()
+		for row in range(len(rows)):
+			thisMarker = markerBlock[rows[row]]
+			thisMarker.setTrioTypeCounts(counts,row)
+			if thisMarker.nMIE > 0:
+				runMetrics.count('mie',thisMarker.nMIE)
+				runMetrics.count('markersWithMIE')
+				mieTrios[rows[row]] = trioClassifier.getMIETrios(genotypes,isChrX,row)
+			resultBlock[rows[row]] = [thisMarker.markerID,thisMarker.maf,thisMarker.nVariantType,thisMarker.nCompleteInformativeCaseTrio_MaleNB,thisMarker.nCompleteInformativeCaseTrio_FemaleNB,thisMarker.nCompleteInformativeControlTrio_MaleNB,thisMarker.nCompleteInformativeControlTrio_FemaleNB,thisMarker.nCompleteNonInformativeCaseTrio,thisMarker.nCompleteNonInformativeControlTrio,thisMarker.nIncompleteInformativeCaseTrio_MaleNB,thisMarker.nIncompleteInformativeCaseTrio_FemaleNB,thisMarker.nIncompleteInformativeControlTrio_MaleNB,thisMarker.nIncompleteInformativeControlTrio_FemaleNB,thisMarker.nIncompleteNonInformativeCaseTrio,thisMarker.nIncompleteNonInformativeControlTrio,thisMarker.nMIE] + statistics[row]
+			#count store rows: the count columns and the allele counts, so that count stores can be merged (see countStore.py)
+			if countStore:
+				countBlock[rows[row]] = resultBlock[rows[row]][:len(countColumns)]+[thisMarker.nAlleles]
+		runMetrics.addTime('classification',start)
+	for x in range(len(markerBlock)):
+		for thisPed,[genoF,genoM,genoNB] in mieTrios[x]:
+			print 'Unmatched trio type at ',markerBlock[x].markerID,': ',thisPed,' [',genoF,genoM,genoNB,']. Counting as MIE'
+	runMetrics.count('markersTested',len(markerBlock))
+	markerBlock = []
+	genotypeBlock = []
+	return formatResultBlock()
+
+##Evaluate the p-values of a block of output rows (one vectorized call per p-value column) and format the rows.
+#Returns (rows as text, list of column array chunks, list of count store chunks, hit report candidates): the text is empty without -out-format=text,
+#the column array chunks without -out-format=npy, the count store chunks without -save-counts and the candidates without -report-pvalue and -top-k
+def formatResultBlock():
+	global resultBlock
+	global countBlock
+	global pValueColumns
+	global outputColumns
+
+	start = time.time()
+	setPValueColumns(resultBlock,outputColumns,pValueColumns)
+	runMetrics.addTime('pvalues',start)
+
+	start = time.time()
+	resultText = ''
+	rowTexts = []
+	if "text" in OUTPUT_FORMATS:
+		rowTexts = ['\t'.join([str(value) for value in row])+'\n' for row in resultBlock]
+		resultText = ''.join(rowTexts)
+	#candidate rows of the hit report, formatted here when there is no text output (see hitReport.py)
+	hitRows = []
+	if hitReport:
+		for pValue,x in hitReport.selectBlockRows(resultBlock):
+			hitRows.append((pValue,rowTexts[x] if rowTexts else '\t'.join([str(value) for value in resultBlock[x]])+'\n'))
+	columnChunks = []
+	countChunks = []
+	if resultBlock and ("npy" in OUTPUT_FORMATS or countStore):
+		isChrX = [getMarkerClass(row[0]) is ChrXMarker for row in resultBlock]
+		if "npy" in OUTPUT_FORMATS:
+			columnChunks.append(toColumnArrays(resultBlock,isChrX,columnSpecs))
+		if countStore:
+			countChunks.append(toColumnArrays(countBlock,isChrX,countStore.specs))
+	resultBlock = []
+	countBlock = []
+	runMetrics.addTime('output',start)
+	return resultText,columnChunks,countChunks,hitRows
+
+##Join the results of formatResultBlock, in order
+def joinResults(results):
+	return ''.join([result[0] for result in results]),[chunk for result in results for chunk in result[1]],[chunk for result in results for chunk in result[2]],[row for result in results for row in result[3]]
+
+##Read the feature matrix in chunks of BLOCK_SIZE lines. For a PLINK .bed file, chunks are arrays of BLOCK_SIZE marker indices (in -region/-chr when given).
+#Markers read are counted here, in the main process. Yields each chunk with the input position after it: (markers read, byte offset of the
+#next line of a text feature matrix, None with -region/-chr and PLINK input). A resumed run starts at the position of its checkpoint.
+def readChunks():
+	global fmLines
+	global inputSize
+	global inputPosition
+
+	markersDone = checkpoint['markersDone'] if checkpoint else 0
+	if plinkReader:
+		markers = np.arange(len(plinkReader.markerIDs))
+		if REGIONS:
+			markers = np.array([x for x in markers if isInRegions(plinkReader.markerIDs[x],REGIONS)],dtype=np.intp)
+		if shard:
+			markers = shard.selectMarkers(markers,plinkReader.markerIDs)
+		inputSize = len(markers)
+		inputPosition = (markersDone,None)
+		for start in range(markersDone,len(markers),BLOCK_SIZE):
+			runMetrics.count('markersRead',len(markers[start:start+BLOCK_SIZE]))
+			yield markers[start:start+BLOCK_SIZE],(start+len(markers[start:start+BLOCK_SIZE]),None)
+		return
+	inputSize = os.path.getsize(FM_FILENAME) if FM_FILENAME <> STREAM_FILENAME else 0
+	inputOffset = None
+	#a shard of an uncompressed file reads the lines that begin in its byte range (see shards.py)
+	if shard and fmLines is fmFile:
+		shard.setByteRange(fmFile.tell(),inputSize)
+	if REGIONS or (shard and fmLines is not fmFile):
+		for line in itertools.islice(fmLines,markersDone):
+			pass
+	elif checkpoint:
+		inputOffset = checkpoint['inputOffset']
+		fmFile.seek(inputOffset)
+	elif shard:
+		inputOffset = shard.seekRangeStart(fmFile)
+	elif FM_FILENAME <> STREAM_FILENAME:
+		inputOffset = fmFile.tell()
+	if shard and fmLines is fmFile:
+		fmLines = shard.readRangeLines(fmFile,inputOffset)
+	inputPosition = (markersDone,inputOffset)
+	while True:
+		start = time.time()
+		lines = list(itertools.islice(fmLines,BLOCK_SIZE))
+		runMetrics.addTime('read',start)
+		if not lines:
+			break
+		runMetrics.count('markersRead',len(lines))
+		markersDone += len(lines)
+		if inputOffset is not None:
+			inputOffset += sum([len(line) for line in lines])
+		yield lines,(markersDone,inputOffset)
+
+##Fraction of the input read, for the heartbeat ETA: file offset of a text feature matrix (compressed offset of a gzip file, offset in the byte
+#range of a -shard), or markers read of a PLINK .bed file. None with -region/-chr and for shards of indexed or gzip feature matrices, where
+#only parts of the file are read.
+def getInputProgress():
+	if plinkReader:
+		return float(runMetrics.counters['markersRead'])/max(1,inputSize)
+	if REGIONS or not inputSize or isinstance(fmFile,BgzfReader) or (shard and SHARD_BY == "chromosome"):
+		return None
+	if isinstance(fmFile,gzip.GzipFile):
+		offset = fmFile.fileobj.tell()
+	else:
+		offset = os.lseek(fmFile.fileno(),0,os.SEEK_CUR)
+	#a shard of an uncompressed file reads its byte range
+	if shard:
+		return min(1.0,max(0.0,float(offset-shard.byteRange[0])/max(1,shard.byteRange[1]-shard.byteRange[0])))
+	return min(1.0,float(offset)/inputSize)
+
+##Write the heartbeat file (-heartbeat) when HEARTBEAT_INTERVAL seconds have passed since the last one, or when the run is done
+def writeRunHeartbeat(status="running"):
+	global lastHeartbeat
+	if not HEARTBEAT_FILENAME or (status == "running" and time.time()-lastHeartbeat < HEARTBEAT_INTERVAL):
+		return
+	writeHeartbeat(HEARTBEAT_FILENAME,runMetrics.getReport(status,FM_FILENAME,1.0 if status == "done" else getInputProgress()))
+	lastHeartbeat = time.time()
+
+##Write the output rows of a chunk to the text output, the columnar output and the count store, its skip file lines and its hit report candidates.
+#chunkEnd is the input position after the chunk (see readChunks)
+def writeResult(result,chunkEnd):
+	global outputFile
+	global outputRows
+	global inputPosition
+	resultText,columnChunks,countChunks,skipText,hitRows = result
+	start = time.time()
+	if outputFile:
+		outputFile.write(resultText)
+		outputRows += resultText.count('\n')
+		#rows written to the standard output reach the next command of the pipe block by block
+		if outputStream:
+			outputFile.flush()
+	for chunk in columnChunks:
+		columnarWriter.writeChunk(chunk)
+		if not outputFile:
+			outputRows += len(chunk[0])
+	for chunk in countChunks:
+		countStore.writeChunk(chunk)
+	if skipFile:
+		skipFile.write(skipText)
+	if hitReport:
+		hitsFile.write(hitReport.add(hitRows))
+	inputPosition = chunkEnd
+	runMetrics.addTime('output',start)
+	writeRunHeartbeat()
+	if CHECKPOINT_INTERVAL > 0 and time.time()-lastCheckpoint >= CHECKPOINT_INTERVAL:
+		writeRunCheckpoint()
+
+##True when a chunk of nMarkers markers, starting after firstMarker markers, overlaps the -profile-markers range
+def isProfiled(firstMarker,nMarkers):
+	if not profiler:
+		return False
+	return PROFILE_MARKERS is None or (firstMarker < PROFILE_MARKERS[1] and firstMarker+nMarkers >= PROFILE_MARKERS[0])
+
+##Process a chunk returned by readChunks
+def processChunk(chunk):
+	if plinkReader:
+		return processGenotypeBlock(chunk)
+	if vcfReader:
+		return processVcfLines(chunk)
+	return processMarkerLines(chunk)
+
+##Process a chunk in this process, under cProfile when it overlaps the -profile-markers range
+def processChunkProfiled(chunk,firstMarker):
+	if isProfiled(firstMarker,len(chunk)):
+		return profiler.runcall(processChunk,chunk)
+	return processChunk(chunk)
+
+##Run processChunk in a pool of WORKERS processes.
+#Workers are forked after the pedigree, phenotype and gender look-ups are built, so they share them without copying.
+#Chunks are handed out in input order and their output rows and log messages are written in the same order, so the output is identical to a serial run.
+#Chunks in the -profile-markers range are processed in the main process, where the profiler runs, after the pending chunks have been written.
+def runWorkers():
+	global outputFile
+
+	#imported here so that serial runs do not load it (see startupBenchmark.py)
+	import multiprocessing
+	pool = multiprocessing.Pool(WORKERS)
+	pendingChunks = collections.deque()
+	firstMarker = checkpoint['markersDone'] if checkpoint else 0
+	try:
+		for chunk,chunkEnd in readChunks():
+			if isProfiled(firstMarker,len(chunk)):
+				while pendingChunks:
+					writeWorkerResult(*pendingChunks.popleft())
+				writeResult(processChunkProfiled(chunk,firstMarker),chunkEnd)
 			else:
-				print "Missing phenotype for ",columns[0],". This pedigree will not be analysed."
-				pedIDs.remove(columns[0])
+				pendingChunks.append((pool.apply_async(processChunkInWorker,(chunk,)),chunkEnd))
+			firstMarker += len(chunk)
+			#bound the number of chunks held in memory
+			if len(pendingChunks) >= 2*WORKERS:
+				writeWorkerResult(*pendingChunks.popleft())
+		while pendingChunks:
+			writeWorkerResult(*pendingChunks.popleft())
+	except:
+		#the run stops (e.g. the output pipe was closed with -out=-): the workers are stopped with it
+		pool.terminate()
+		raise
+	pool.close()
+	pool.join()
+
+##Worker side of runWorkers: log messages printed while processing the chunk are captured and returned with the output rows and the run metrics of the chunk
+def processChunkInWorker(chunk):
+	runMetrics.reset()
+	logBuffer = StringIO.StringIO()
+	sys.stdout = logBuffer
+	try:
+		result = processChunk(chunk)
+		exitStatus = None
+	except SystemExit as e:
+		result = ('',[],[],'',[])
+		exitStatus = e.code
+	finally:
+		sys.stdout = sys.__stdout__
+	return result,logBuffer.getvalue(),exitStatus,runMetrics.getValues()
+
+def writeWorkerResult(asyncResult,chunkEnd):
+	result,logText,exitStatus,metricValues = asyncResult.get()
+	sys.stdout.write(logText)
+	if exitStatus is not None:
+		sys.exit(exitStatus)
+	runMetrics.merge(metricValues)
+	writeResult(result,chunkEnd)
 
-def getPedNBGender():
-	global genderFile
-        global pedIDs
-	global pedNBGender
-	
-        #get these pedigrees from phenotype file into a dictionary
-        for line in genderFile:
-                columns = line.strip().split()
-                if columns[0] in pedIDs:
-                        if columns[1].isdigit():
-                                pedNBGender[columns[0]] = int(columns[1])
-                        else:
-                                print "Missing gender for ",columns[0],". This pedigree will not be analysed for chrX."
-                                
-
-def getPedMemberIndicesAndType():
-	global pedIDs
-	global idColumns
-	global pedMemberIndices
-	global pedMemberType
-        for thisPed in pedIDs:
-		#DEBUG
-#		print thisPed
-#		print idColumns
-                memberIndices = [x for x in range(len(idColumns)) if idColumns[x]==thisPed]
-		pedMemberIndices[thisPed]=memberIndices
-                pedMemberType[thisPed]=[memberTypeColumns[x] for x in memberIndices]
-
-#	        #DEBUG
-#	        print pedMemberIndices
-#	        print (idColumns[x] for x in memberIndices)
-#	        print pedMemberType
-#	        raw_input('continue')
-
-#	print len(pedMemberIndices),len(pedMemberType)
-		
 ###################################################
 ######### PROCESSING STARTS HERE ##################
 
@@ -224,202 +991,168 @@ createFileObjects()
 
 #PRINT HEADER line according to options selected by user
 outputColumns = ['MarkerID','MAF','n[0/0,0/1,1/1,./.]','nCompleteInformativeCases_MaleNB','nCompleteInformativeCases_FemaleNB','nCompleteInformativeControls_MaleNB','nCompleteInformativeControls_FemaleNB','nCompleteNonInformativeCases','nCompleteNonInformativeControls','nIncompleteInformativeCases_MaleNB','nIncompleteInformativeCases_FemaleNB','nIncompleteInformativeControls_MaleNB','nIncompleteInformativeControls_FemaleNB','nIncompleteNonInformativeCases','nIncompleteNonInformativeControls','nMIE']
-if TEST == "" or TEST == "tdt": #both or TDT
-	if not MODELS or "a" in MODELS:
-		outputColumns.extend(['ChiSq_TDT_Additive','P-value_TDT_Additive'])
-		if VERSION == "scan" or VERSION == "":
-			outputColumns.extend(['min_ChiSq_rTDT_Additive','min_P-value_rTDT_Additive','max_ChiSq_rTDT_Additive','max_P-value_rTDT_Additive'])
-	if "d" in MODELS:    
-		outputColumns.extend(['ChiSq_TDT_Dominant','P-value_TDT_Dominant'])
-		if VERSION == "scan" or VERSION == "":
-                        outputColumns.extend(['min_ChiSq_rTDT_Dominant','min_P-value_rTDT_Dominant','max_ChiSq_rTDT_Dominant','max_P-value_rTDT_Dominant'])	
-	if "r" in MODELS:
-		outputColumns.extend(['ChiSq_TDT_Recessive','P-value_TDT_Recessive'])
-		if VERSION == "scan" or VERSION == "":	
-			outputColumns.extend(['min_ChiSq_rTDT_Recessive','min_P-value_rTDT_Recessive','max_ChiSq_rTDT_Recessive','max_P-value_rTDT_Recessive'])	
-	if MODELS and "a" not in MODELS and "d" not in MODELS and "r" not in MODELS: 
-		print "Unrecognised model: "+MODELS
-       		sys.exit(1)
-
-
-if TEST == "" or TEST == "fbat": #both or FBAT
-	if not MODELS or "a" in MODELS:
-                outputColumns.extend(['Z_FBAT_Additive','P-value_FBAT_Additive'])
-		if VERSION == "scan" or VERSION == "":
-                        outputColumns.extend(['min_Z_scanFBAT_Additive','min_P-value_scanFBAT_Additive','max_Z_scanFBAT_Additive','max_P-value_scanFBAT_Additive'])
-        if "d" in MODELS:
-                outputColumns.extend(['Z_FBAT_Dominant','P-value_FBAT_Dominant'])
-		if VERSION == "scan" or VERSION == "":
-                        outputColumns.extend(['min_Z_scanFBAT_Dominant','min_P-value_scanFBAT_Dominant','max_Z_scanFBAT_Dominant','max_P-value_scanFBAT_Dominant'])
-        if "r" in MODELS:
-                outputColumns.extend(['Z_FBAT_Recessive','P-value_FBAT_Recessive'])
-		if VERSION == "scan" or VERSION == "":
-                        outputColumns.extend(['min_Z_scanFBAT_Recessive','min_P-value_scanFBAT_Recessive','max_Z_scanFBAT_Recessive','max_P-value_scanFBAT_Recessive'])
-        if not MODELS and "a" not in MODELS and "d" not in MODELS and "r" not in MODELS:
-                print "Unrecognised model: "+MODELS
-                sys.exit(1)	
+if MODELS and not getSelectedModels(MODELS):
+	print "Unrecognised model: "+",".join(MODELS)
+	sys.exit(1)
+#count store columns: marker id, MAF, genotype counts, count vectors and nMIE (see countStore.py)
+countColumns = list(outputColumns)
+#score and p-value columns of the selected tests, versions and models (see blockStatistics.py)
+outputColumns.extend(getStatisticColumns(TEST,VERSION,MODELS))
 
-	
-outputFile.write('\t'.join(outputColumns)+'\n')
+#p-values are evaluated for a block of markers at a time when the block is written
+pValueColumns = [x for x in range(len(outputColumns)) if outputColumns[x].find("P-value") <> -1]
+#empirical p-values and numbers of permutations of each test and model follow the statistics
+if PERMUTATIONS > 0:
+	outputColumns.extend(getPermutationColumns(TEST,MODELS))
+
+if outputFile and not checkpoint:
+	outputFile.write('\t'.join(outputColumns)+'\n')
+	#the header line of a shard is a gzip member of its own, left out when the shard outputs are merged (see shards.py)
+	if shard:
+		outputFile.close()
+		headerBytes = outputRawFile.tell()
+		outputFile = openOutputMember()
+elif outputFile:
+	headerBytes = checkpoint.get('headerBytes')
+#lengths of the count vector columns of autosomal and chrX markers
+countVectorLengths = {'autosomal':{},'chrX':{}}
+for x in range(len(countVectorNames)-1):
+	countVectorLengths['autosomal'][outputColumns[3+x]] = len(getattr(AutosomalMarker(),countVectorNames[x]))
+	countVectorLengths['chrX'][outputColumns[3+x]] = len(getattr(ChrXMarker(),countVectorNames[x]))
+#typed column arrays of the output columns, in a directory named after the output file
+if "npy" in OUTPUT_FORMATS:
+	columnSpecs = getColumnSpecs(outputColumns,countVectorLengths['autosomal'])
+	columnarWriter = ColumnarWriter(OUTPUT_FILENAME[:-len(".gz")]+".columns",columnSpecs,countVectorLengths,checkpoint['columnChunkRows'] if checkpoint else [])
+#markers under -report-pvalue and/or the -top-k smallest p-values of -report-column (see hitReport.py)
+if REPORT_PVALUE is not None or TOP_K > 0:
+	reportColumn = REPORT_COLUMN or outputColumns[pValueColumns[0]]
+	if reportColumn not in outputColumns or reportColumn.find("P-value") == -1:
+		print "Unrecognised -report-column: "+reportColumn+" (p-value columns of this run: "+", ".join([x for x in outputColumns if x.find("P-value") <> -1])+")"
+		sys.exit(1)
+	hitReport = HitReport(outputColumns.index(reportColumn),REPORT_PVALUE,TOP_K)
+	#the rows kept before the checkpoint of a resumed run are read back
+	if checkpoint:
+		hitsFile = open(HITS_FILENAME,"r+")
+		hitsFile.truncate(checkpoint['hitsBytes'])
+		hitsFile.readline()
+		hitReport.addLines(hitsFile.readlines())
+		hitsFile.seek(0,os.SEEK_END)
+	else:
+		hitsFile = open(HITS_FILENAME,"w")
+		hitsFile.write('\t'.join(outputColumns)+'\n')
 
 	
 #READ header line containing pedIDs and 2nd row containing member type of each sample
-idColumns = fmFile.readline().strip().split('\t')[1:]  #1st row of the feature matrix - pedigree ids (skip 1st column)
-memberTypeColumns = fmFile.readline().strip().split('\t')[1:]  #second row of the feature matrix (skip 1st column)
+if plinkReader:
+	idColumns = plinkReader.idColumns
+	memberTypeColumns = plinkReader.memberTypeColumns
+elif vcfReader:
+	idColumns = vcfReader.idColumns
+	memberTypeColumns = vcfReader.memberTypeColumns
+else:
+	idColumns = fmFile.readline().strip().split('\t')[1:]  #1st row of the feature matrix - pedigree ids (skip 1st column)
+	memberTypeColumns = fmFile.readline().strip().split('\t')[1:]  #second row of the feature matrix (skip 1st column)
 
 #assert that all membertype assignments are numeric - 1/2/3 for F/M/NB
 assert(all(v.isdigit() for v in memberTypeColumns[1:len(memberTypeColumns)]))   
 
-#get predigree ids 
-getPedIDs()
-#generate pedigree-phenotype dictionary
-createPedPhenoDict()
-#pedigree-NBgender dictionary
-getPedNBGender()
-#get pedigree member indices and member types from 1st two lines of the feature matrix
-getPedMemberIndicesAndType()
+#trio member columns, phenotypes and NB genders of the pedigrees to analyse
+createPedigreeMetadata()
+#case/control x gender strata for counting trio types
+TrioClassifier.kernel = KERNEL
+#p-value backend, selected before worker processes are started
+setBackend(PVALUE_BACKEND)
+trioClassifier = TrioClassifier(pedigreeMetadata)
+#the count store lists the trios it counts
+if SAVE_COUNTS_DIRECTORY:
+	countStore = createCountStore(SAVE_COUNTS_DIRECTORY,countColumns,countVectorLengths,pedigreeMetadata.pedIDs,checkpoint['countChunkRows'] if checkpoint else [])
+if PERMUTATIONS > 0:
+	permutationEngine = AdaptivePermutations(PERMUTATIONS,PERMUTATION_HITS,PERMUTATION_SEED,TEST,MODELS,OFFSET)
+#markers that cannot be tested usefully are dropped before trio types are counted (see markerFilter.py)
+markerFilter = MarkerFilter(MIN_MAF,MIN_INFORMATIVE,MAX_MISSING,MAX_MIE_RATE)
+#statistics and p-values of repeated trio type count signatures are computed once (see statisticsCache.py)
+if STATS_CACHE_ENTRIES > 0:
+	statisticsCache = StatisticsCache(STATS_CACHE_ENTRIES,TEST,VERSION,MODELS,OFFSET)
+#PLINK and VCF chrX genotypes of males are converted to the hemizygous coding of the feature matrix
+if plinkReader:
+	plinkReader.setMaleColumns(trioClassifier.getMaleColumns())
+if vcfReader:
+	vcfReader.setMaleColumns(trioClassifier.getMaleColumns())
 
 ## ALL GLOBAL CHECKS and ASSERTS HERE
 ## TDT must be provided with only case trios, FBAT must have both case and controls
-if TEST == "tdt" and 1 in pedPhenoDict.values():
+if TEST == "tdt" and pedigreeMetadata.isControl.any():
         print 'Pedigree file must contain only case pedigrees for TDT.'
         sys.exit(1)
-if TEST == "fbat" and 1 not in pedPhenoDict.values():
+if TEST == "fbat" and not pedigreeMetadata.isControl.any():
         print 'Pedigree file must contain control pedigrees for FBAT.'
         sys.exit(1)
 
 
 
-#read feature matrix one line at a time. First two lines have been read above for pedigree ids and member type
-for line in fmFile:
-	#create new marker object
-	#chrM and chrY are not tested
-	if line.startswith('chrM') or line.startswith('chr25') or line.startswith('chrY') or line.startswith('chr24'):
-		continue	
-	elif line.startswith('chrX') or line.startswith('chr23'): 
-		thisMarker = ChrXMarker()
-	else:  #TODO: more thorough check for validity of data format, like chr numbers??
-		thisMarker = AutosomalMarker()
-	
-	#get vcf columns
- 	vcfValues = line.strip().split('\t')
-
-	#assert that all genotype values are numeric #TODO: verify that this assert works
-	assert(all(v.isdigit() or v=="NA" for v in vcfValues[1:]))   #1st column is variant id, 2nd onwards are sample genotypes
+if PROFILE_FILENAME:
+	import cProfile
+	profiler = cProfile.Profile()
+#counters of a resumed run include the markers before the checkpoint
+if checkpoint:
+	runMetrics.counters.update(checkpoint['counters'])
+	outputRows = checkpoint['outputRows']
+lastCheckpoint = time.time()
 
-	
-	#set this marker object's sample values 
-	thisMarker.markerID = vcfValues[0]
-	thisMarker.getSampleGenotypes(vcfValues[1:],pedMemberIndices)
-	
-	#Note: thought of checking if chrX marker has heterozygous males, but it's not possible since the feature matrix comes in with encoded genotypes. 
-	#So all you can check is whether autosomal chrs have any genotypes other than 0/1/2/NA and chrX has any genotypes other that 0/1/NA for males, 0/1/2/NA for females
-	#for chrX
-	#TODO: verify that hasValidGenotypes() works
-	if isinstance(thisMarker,ChrXMarker) and not thisMarker.hasValidGenotypes(pedNBGender,pedMemberType):
-		print 'Invalid genotype found at ',thisMarker.markerID,'. This marker will not be tested.'
-		continue
-	#for autosomal chromosomes
-	elif not isinstance(thisMarker,ChrXMarker) and not thisMarker.hasValidGenotypes():
-		print 'Invalid genotype found at ',thisMarker.markerID,'. This marker will not be tested.'
-                continue
-		
-	#COMPUTE ALLELE FREQUENCY
-	#compute regardless of whether 'mi' has been selected or not, because allele frequency will be reported in the output
-	if isinstance(thisMarker,ChrXMarker):
-		thisMarker.computeMAF(pedNBGender,pedMemberType)
-	else:
-		thisMarker.computeMAF()
-	
-	try:
-		#assert that MAF is always positive
-		assert(thisMarker.maf >= 0)
-	except(AssertionError):
-		print 'Marker ',thisMarker.markerID,', MAF=',thisMarker.maf
-		exit(1)	
-
-        #DEBUG
-#	print 'Ref and Alt Frequencies'
-#       print vcfValues[0],thisMarker.maf
-#       raw_input('continue')
-	
-	#get variant distribution
-	if isinstance(thisMarker,ChrXMarker):	
-		thisMarker.getVariantDistribution(pedNBGender,pedMemberType)
+#read feature matrix one chunk of lines at a time. First two lines have been read above for pedigree ids and member type
+try:
+	if WORKERS > 1:
+		runWorkers()
 	else:
-		thisMarker.getVariantDistribution()
-
-	#count complete and incomplete case and control trio types and populate corresponding vectors
-	thisMarker.populateTrioTypeCountVectors(pedMemberType,pedPhenoDict,pedNBGender)
-	
-	#concatenate output string and print to output file
-        outputColumns = [thisMarker.markerID,str(thisMarker.maf),str(thisMarker.nVariantType),str(thisMarker.nCompleteInformativeCaseTrio_MaleNB),str(thisMarker.nCompleteInformativeCaseTrio_FemaleNB),str(thisMarker.nCompleteInformativeControlTrio_MaleNB),str(thisMarker.nCompleteInformativeControlTrio_FemaleNB),str(thisMarker.nCompleteNonInformativeCaseTrio),str(thisMarker.nCompleteNonInformativeControlTrio),str(thisMarker.nIncompleteInformativeCaseTrio_MaleNB),str(thisMarker.nIncompleteInformativeCaseTrio_FemaleNB),str(thisMarker.nIncompleteInformativeControlTrio_MaleNB),str(thisMarker.nIncompleteInformativeControlTrio_FemaleNB),str(thisMarker.nIncompleteNonInformativeCaseTrio),str(thisMarker.nIncompleteNonInformativeControlTrio),str(thisMarker.nMIE)]			
-	# run appropriate tests based on options selected by the user, add appropriate output columns	
-	#**************TDT***************************************************************************
-	if TEST == "" or TEST == "tdt":
-		#ADDITIVE std. TDT-------------------------------------------------------------------
-		if not MODELS or "a" in MODELS:
-			thisMarker.stdTDT("a")
-			outputColumns.extend([str(thisMarker.chiSq_StdTDT),str(thisMarker.pValue_StdTDT)])
-			#ADDITIVE mi-TDT--------------------------------------
-			if VERSION == "scan" or VERSION == "":
-				thisMarker.extendedTDT("a")
-				outputColumns.extend([str(thisMarker.minChiSq_rTDT),str(thisMarker.minPValue_rTDT),str(thisMarker.maxChiSq_rTDT),str(thisMarker.maxPValue_rTDT)])
-
-		#DOMINANT std. TDT----------------------------------------------------------------------------------
-		if "d" in MODELS:   
-			thisMarker.stdTDT("d")
-			outputColumns.extend([str(thisMarker.chiSq_StdTDT),str(thisMarker.pValue_StdTDT)])
-			#DOMINANT mi-TDT----------------------------------------------------------------------------
-			if VERSION == "scan" or VERSION == "":
-				thisMarker.extendedTDT("d")
-				outputColumns.extend([str(thisMarker.minChiSq_rTDT),str(thisMarker.minPValue_rTDT),str(thisMarker.maxChiSq_rTDT),str(thisMarker.maxPValue_rTDT)])
-		
-		#RECESSIVE std. TDT----------------------------------------------------------------------------------
-                if "r" in MODELS:   
-                        thisMarker.stdTDT("r")
-			outputColumns.extend([str(thisMarker.chiSq_StdTDT),str(thisMarker.pValue_StdTDT)])
-                        #RECESSIVE mi-TDT----------------------------------------------------------------------------
-			if VERSION == "scan" or VERSION == "":	
-                                thisMarker.extendedTDT("r")
-                                outputColumns.extend([str(thisMarker.minChiSq_rTDT),str(thisMarker.minPValue_rTDT),str(thisMarker.maxChiSq_rTDT),str(thisMarker.maxPValue_rTDT)])
-	
-	if TEST == "" or TEST == "fbat":
-		#ADDITIVE std. FBAT-------------------------------------------------------------------
-                if not MODELS or "a" in MODELS:
-			thisMarker.stdFBAT("a",OFFSET)
-                        outputColumns.extend([str(thisMarker.Z_stdFBAT),str(thisMarker.pValue_stdFBAT)])
-                        #ADDITIVE ext-FBAT------------------------------
-			if VERSION == "scan" or VERSION == "":
-				thisMarker.extendedFBAT("a",OFFSET)
-				outputColumns.extend([str(thisMarker.minZ_extFBAT),str(thisMarker.minPValue_extFBAT),str(thisMarker.maxZ_extFBAT),str(thisMarker.maxPValue_extFBAT)])
-		
-		#DOMINANT std. FBAT-------------------------------------------------------------------
-                if "d" in MODELS:
-                        thisMarker.stdFBAT("d",OFFSET)
-                        outputColumns.extend([str(thisMarker.Z_stdFBAT),str(thisMarker.pValue_stdFBAT)])
-                        #DOMINANT ext-FBAT------------------------------
-			if VERSION == "scan" or VERSION == "":
-                                thisMarker.extendedFBAT("d",OFFSET)
-                                outputColumns.extend([str(thisMarker.minZ_extFBAT),str(thisMarker.minPValue_extFBAT),str(thisMarker.maxZ_extFBAT),str(thisMarker.maxPValue_extFBAT)])	
-
-		#RECESSIVE std. FBAT-------------------------------------------------------------------
-                if "r" in MODELS:
-                        thisMarker.stdFBAT("r",OFFSET)
-                        outputColumns.extend([str(thisMarker.Z_stdFBAT),str(thisMarker.pValue_stdFBAT)])
-                        #RECESSIVE ext-FBAT-----------------------------
-			if VERSION == "scan" or VERSION == "":
-                                thisMarker.extendedFBAT("r",OFFSET)
-                                outputColumns.extend([str(thisMarker.minZ_extFBAT),str(thisMarker.minPValue_extFBAT),str(thisMarker.maxZ_extFBAT),str(thisMarker.maxPValue_extFBAT)])
-
-
-	#print to outputfile
-	outputFile.write('\t'.join(outputColumns)+'\n')
+		firstMarker = checkpoint['markersDone'] if checkpoint else 0
+		for chunk,chunkEnd in readChunks():
+			writeResult(processChunkProfiled(chunk,firstMarker),chunkEnd)
+			firstMarker += len(chunk)
+except IOError as e:
+	#with -out=-, the next command of the pipe may exit before reading all the rows (e.g. | head): stop quietly
+	if not (outputStream and isBrokenPipe(e)):
+		raise
+	discardOutput(outputStream)
+	print 'Output stream closed by the next command of the pipe: stopping'
+	sys.exit(0)
+writeRunHeartbeat("done")
+if statisticsCache:
+	nLookups = runMetrics.counters['statisticsCacheHits']+runMetrics.counters['statisticsCacheMisses']
+	print 'Statistics cache: '+str(runMetrics.counters['statisticsCacheHits'])+' of '+str(nLookups)+' markers tested ('+'%.1f' % (100.0*runMetrics.counters['statisticsCacheHits']/max(nLookups,1))+'%) reused the statistics of a cached count signature'
+if profiler:
+	profiler.dump_stats(PROFILE_FILENAME)
+	print 'cProfile statistics written to '+PROFILE_FILENAME
 
 #TODO: close all files
-fmFile.close()
+if fmFile:
+	fmFile.close()
 phenoFile.close()
 if pedIDFile:
 	pedIDFile.close()
-outputFile.close()
-
+if outputFile:
+	outputFile.close()
+if outputRawFile:
+	outputRawFile.close()
+if columnarWriter:
+	columnarWriter.close()
+if countStore:
+	countStore.close()
+if skipFile:
+	skipFile.close()
+#the hits file is replaced by the hits, sorted by p-value
+if hitsFile:
+	hitsFile.close()
+	hits = hitReport.getHits()
+	hitsFile = open(HITS_FILENAME+".tmp","w")
+	hitsFile.write('\t'.join(outputColumns)+'\n'+''.join(hits))
+	hitsFile.close()
+	os.rename(HITS_FILENAME+".tmp",HITS_FILENAME)
+	print 'Hits: '+str(len(hits))+' markers ('+hitReport.getDescription()+' in '+reportColumn+') written to '+HITS_FILENAME
+if shard:
+	shardValues = shard.getValues()
+	shardValues.update({'options':getCheckpointOptions(),'fingerprints':getInputFingerprints(),'header':'\t'.join(outputColumns),'headerBytes':headerBytes,
+		'outputRows':outputRows,'markersRead':runMetrics.counters['markersRead']})
+	writeShardFile(OUTPUT_FILENAME,shardValues)
+	print 'Shard '+str(SHARD[0])+'/'+str(SHARD[1])+' written to '+OUTPUT_FILENAME+', shard file '+OUTPUT_FILENAME+SHARD_SUFFIX
+if CHECKPOINT_INTERVAL > 0:
+	writeRunCheckpoint("complete")
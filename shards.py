@@ -0,0 +1,292 @@
+import os
+import sys
+import glob
+import gzip
+import numpy as np
+from featureMatrixIndex import parseMarkerID
+from checkpoint import writeCheckpoint,readCheckpoint
+
+"""
+Sharding of a scanTDT.py run over cluster job arrays (-shard=i/N) and merge of the shard outputs.
+
+Each shard reads a deterministic slice of the markers of the input, selected with -shard-by:
+  bytes       the marker lines are split into N byte ranges of equal size; a line belongs to the shard in which it starts, so ranges are realigned
+              to line starts without any overlap or gap. Needs a seekable input: an uncompressed feature matrix or VCF file, or a feature matrix
+              indexed with featureMatrixIndex.py, whose index records are split by the compressed offset of their block. A PLINK .bed file is
+              split into N runs of the same number of markers.
+  chromosome  chromosomes 1-22 and X (in this order) are split into N contiguous groups of about the same total length (GRCh38); other contigs
+              go to the last shard, and chrY, chrM and the pseudo-autosomal chrXY markers, which are not tested, to none. Works with any input:
+              indexed feature matrices read only the index records of the shard, other inputs are read through and filtered.
+When a shard run ends, it writes <out>.shard with the shard, its slice of the input, the options and input fingerprints of the run, the output
+rows written and the size of the first gzip member of the text output, which holds only the header line.
+
+The merge checks that every shard 1..N is there exactly once and complete, that all were run with the same options on the same input, that
+their slices tile the input in shard order (so that concatenating them keeps the input marker order) and that each output has the rows
+recorded by its shard; it then concatenates the gzip members of the text outputs, leaving out the header member of all shards but the first.
+Shards by chromosome keep the input marker order only when the chromosomes are not interleaved in the input; the merge stops otherwise.
+
+USAGE: python shards.py -shards=<shard outputs, comma separated, or a quoted glob pattern such as "tdt.shard*.out.gz"> -out=<merged output> DEFAULT tdt.out.gz
+"""
+
+SHARD_SUFFIX = ".shard"
+SHARD_VERSION = 1
+SHARD_MODES = ['bytes','chromosome']
+#GRCh38 lengths of the chromosomes split by -shard-by=chromosome, in shard order
+CHROMOSOME_LENGTHS = [('1',248956422),('2',242193529),('3',198295559),('4',190214555),('5',181538259),('6',170805979),('7',159345973),
+	('8',145138636),('9',138394717),('10',133797422),('11',135086622),('12',133275309),('13',114364328),('14',107043718),('15',101991189),
+	('16',90338345),('17',83257441),('18',80373285),('19',58617616),('20',64444167),('21',46709983),('22',50818468),('X',156040895)]
+UNTESTED_CHROMOSOMES = ['Y','M','25']
+#options that name files of one shard, and input files, which are compared through their fingerprints
+SHARD_OPTIONS = ['shard','save-counts','skip-file','fm','phenotype','pedigrees','gender','vcf-trios']
+READ_SIZE = 1<<20
+
+##Shard option <i>/<N> as (i,N), 1 <= i <= N
+def parseShard(value):
+	index,separator,count = value.strip().partition("/")
+	if not (index.isdigit() and count.isdigit()) or not 1 <= int(index) <= int(count):
+		raise ValueError("-shard must be <i>/<N> with 1 <= i <= N, not "+value)
+	return int(index),int(count)
+
+##Chromosome name of a marker id, VCF CHROM or .bim chromosome, without the 'chr' prefix and with the chrX and chrM synonyms of plinkReader.getMarkerID
+def normalizeChromosome(chromosome):
+	if chromosome.lower().startswith("chr"):
+		chromosome = chromosome[3:]
+	return {"23":"X","X":"X","XY":"25","24":"Y","Y":"Y","MT":"M","M":"M","26":"M"}.get(chromosome.upper(),chromosome)
+
+##Chromosomes of each of count shards: contiguous groups of CHROMOSOME_LENGTHS, a chromosome going to the shard where the middle of it falls
+def getShardChromosomes(count):
+	totalLength = float(sum([length for chromosome,length in CHROMOSOME_LENGTHS]))
+	shardChromosomes = [[] for x in range(count)]
+	position = 0
+	for chromosome,length in CHROMOSOME_LENGTHS:
+		shardChromosomes[min(count-1,int((position+length/2.0)/totalLength*count))].append(chromosome)
+		position += length
+	return shardChromosomes
+
+##----------------------------------------------------------------------------------------------------------------------------------------------------
+class Shard:
+
+	###METHODS
+	#The slice of the input is recorded as it is selected: byteRange and extent (start and end of the marker lines in bytes, of the index record
+	#blocks, or of the markers of a PLINK file) by bytes, or the chromosomes of the shard and its span (first and last marker line or marker read)
+	#by chromosome
+	def __init__(self,index,count,mode="bytes"):
+		self.index = index
+		self.count = count
+		self.mode = mode
+		shardChromosomes = getShardChromosomes(count)
+		self.shardOfChromosome = dict((chromosome,x+1) for x in range(count) for chromosome in shardChromosomes[x])
+		self.chromosomes = shardChromosomes[index-1] if mode == "chromosome" else None
+		self.byteRange = None
+		self.extent = None
+		self.span = None
+
+	###True when a chromosome is read by this shard: other contigs go to the last shard, untested chromosomes to none
+	def isShardChromosome(self,chromosome):
+		chromosome = normalizeChromosome(chromosome)
+		if chromosome in UNTESTED_CHROMOSOMES:
+			return False
+		return self.shardOfChromosome.get(chromosome,self.count) == self.index
+
+	def addToSpan(self,first,last):
+		self.span = [min(self.span[0],first),last] if self.span else [first,last]
+
+	###Byte range [start,end) of the shard among the marker lines in [dataStart,dataEnd)
+	def setByteRange(self,dataStart,dataEnd):
+		self.extent = [dataStart,dataEnd]
+		self.byteRange = [dataStart+(self.index-1)*(dataEnd-dataStart)/self.count,dataStart+self.index*(dataEnd-dataStart)/self.count]
+		return self.byteRange
+
+	###Move a file to the start of the first line beginning in the byte range, and return its offset
+	def seekRangeStart(self,inputFile):
+		start = self.byteRange[0]
+		if start == self.extent[0]:
+			inputFile.seek(start)
+			return start
+		inputFile.seek(start-1)
+		return start-1+len(inputFile.readline())
+
+	###Lines of a file read from offset, up to the last line beginning in the byte range
+	def readRangeLines(self,inputFile,offset):
+		for line in inputFile:
+			if offset >= self.byteRange[1]:
+				break
+			yield line
+			offset += len(line)
+
+	###Markers of a PLINK file (indices into markerIDs) read by the shard
+	def selectMarkers(self,markers,markerIDs):
+		if self.mode == "bytes":
+			self.setByteRange(0,len(markers))
+			return markers[self.byteRange[0]:self.byteRange[1]]
+		markers = np.array([x for x in markers if self.isShardChromosome(parseMarkerID(markerIDs[x])[0])],dtype=np.intp)
+		if len(markers):
+			self.addToSpan(markers[0],markers[-1]+1)
+		return markers
+
+	###Index records (see featureMatrixIndex.readIndex) read by the shard: records whose block starts in the byte range of the blocks, or records of
+	#its chromosomes
+	def selectRecords(self,records,fileSize):
+		if self.mode == "bytes":
+			self.setByteRange(records[0][3] >> 16 if records else 0,fileSize)
+			return [record for record in records if self.byteRange[0] <= (record[3] >> 16) < self.byteRange[1]]
+		selectedRecords = []
+		lineNumber = 0
+		for record in records:
+			if self.isShardChromosome(record[0]):
+				selectedRecords.append(record)
+				self.addToSpan(lineNumber,lineNumber+record[4])
+			lineNumber += record[4]
+		return selectedRecords
+
+	###Lines of the shard chromosomes among the marker lines of an input that is read through. getChromosome returns the chromosome of a line
+	def readChromosomeLines(self,lines,getChromosome):
+		lineNumber = 0
+		for line in lines:
+			if self.isShardChromosome(getChromosome(line)):
+				self.addToSpan(lineNumber,lineNumber+1)
+				yield line
+			lineNumber += 1
+
+	###Shard fields of the shard file
+	def getValues(self):
+		return {'shard':[self.index,self.count],'shardBy':self.mode,'chromosomes':self.chromosomes,'byteRange':self.byteRange,'extent':self.extent,
+			'span':[int(x) for x in self.span] if self.span else None}
+
+##Write the shard file of a shard output: the values of Shard.getValues and of the run (options, fingerprints, header, headerBytes, outputRows)
+def writeShardFile(outputFilename,values):
+	values = dict(values)
+	values['version'] = SHARD_VERSION
+	writeCheckpoint(outputFilename+SHARD_SUFFIX,values)
+
+##Number of lines of a gzip file after the first headerBytes bytes
+def countOutputRows(filename,headerBytes):
+	rawFile = open(filename,"rb")
+	rawFile.seek(headerBytes)
+	outputFile = gzip.GzipFile(filename,"rb",fileobj=rawFile)
+	nRows = 0
+	data = outputFile.read(READ_SIZE)
+	while data:
+		nRows += data.count("\n")
+		data = outputFile.read(READ_SIZE)
+	outputFile.close()
+	rawFile.close()
+	return nRows
+
+##Fingerprints without the file names, so that shards run on copies of the input at other paths compare equal
+def getContentFingerprints(fingerprints):
+	return dict((name,(value['size'],value['md5'])) for name,value in fingerprints.items())
+
+##Problems that prevent merging the shard outputs, as messages (empty when they can be merged). Returns the shard files in shard order
+def validateShards(outputFilenames):
+	messages = []
+	shardFiles = []
+	for filename in outputFilenames:
+		if not os.path.exists(filename+SHARD_SUFFIX):
+			messages.append(filename+" has no shard file "+filename+SHARD_SUFFIX+": the shard run did not finish")
+			continue
+		values = readCheckpoint(filename+SHARD_SUFFIX)
+		values['filename'] = filename
+		if values.get('version') <> SHARD_VERSION:
+			messages.append(filename+SHARD_SUFFIX+": shard file version "+str(values.get('version'))+" is not supported")
+		elif values['headerBytes'] is None:
+			messages.append(filename+" has no text output")
+		else:
+			shardFiles.append(values)
+	if messages or not shardFiles:
+		return messages or ["No shard outputs given"],[]
+
+	first = shardFiles[0]
+	for values in shardFiles[1:]:
+		for name in sorted(set(values['options']) | set(first['options'])):
+			if name not in SHARD_OPTIONS and values['options'].get(name) <> first['options'].get(name):
+				messages.append(values['filename']+": option "+name+" is "+str(values['options'].get(name))+", "+str(first['options'].get(name))+" in "+first['filename'])
+		if getContentFingerprints(values['fingerprints']) <> getContentFingerprints(first['fingerprints']):
+			messages.append(values['filename']+" was run on other input files than "+first['filename'])
+		if values['shard'][1] <> first['shard'][1] or values['shardBy'] <> first['shardBy']:
+			messages.append(values['filename']+" is shard "+"/".join(map(str,values['shard']))+" by "+values['shardBy']+", "+first['filename']+" is shard "+"/".join(map(str,first['shard']))+" by "+first['shardBy'])
+		if values['header'] <> first['header']:
+			messages.append(values['filename']+" has another header line than "+first['filename'])
+	if messages:
+		return messages,[]
+
+	count = first['shard'][1]
+	indices = [values['shard'][0] for values in shardFiles]
+	missing = [x for x in range(1,count+1) if x not in indices]
+	duplicated = sorted(set([x for x in indices if indices.count(x) > 1]))
+	if missing:
+		messages.append("Missing shards: "+",".join(map(str,missing))+" of "+str(count))
+	for index in duplicated:
+		messages.append("Shard "+str(index)+"/"+str(count)+" given more than once: "+", ".join([values['filename'] for values in shardFiles if values['shard'][0] == index]))
+	if messages:
+		return messages,[]
+
+	shardFiles.sort(key=lambda values: values['shard'][0])
+	#byte ranges must tile the input, and the input positions read by consecutive shards must not overlap
+	if first['shardBy'] == "bytes":
+		for previous,values in zip(shardFiles[:-1],shardFiles[1:]):
+			if previous['byteRange'][1] <> values['byteRange'][0]:
+				messages.append("Byte ranges of shards "+str(previous['shard'][0])+" and "+str(values['shard'][0])+" do not join")
+		if shardFiles[0]['byteRange'][0] <> first['extent'][0] or shardFiles[-1]['byteRange'][1] <> first['extent'][1]:
+			messages.append("Byte ranges of the shards do not cover the input")
+	spans = [values for values in shardFiles if values['span']]
+	for previous,values in zip(spans[:-1],spans[1:]):
+		if previous['span'][1] > values['span'][0]:
+			messages.append("Markers of shards "+str(previous['shard'][0])+" and "+str(values['shard'][0])+" are interleaved in the input: the merged output would not keep the input marker order (sort the input by chromosome or use -shard-by=bytes)")
+	for values in shardFiles:
+		nRows = countOutputRows(values['filename'],values['headerBytes'])
+		if nRows <> values['outputRows']:
+			messages.append(values['filename']+" has "+str(nRows)+" output rows, its shard file "+str(values['outputRows']))
+	return messages,shardFiles
+
+##Merge the text outputs of all shards of a run into mergedFilename: the gzip members of the outputs are copied in shard order, without the
+#header member of all but the first shard. Returns the messages of validateShards; nothing is written when there are any
+def mergeShards(outputFilenames,mergedFilename):
+	messages,shardFiles = validateShards(outputFilenames)
+	if messages:
+		return messages
+	temporaryFilename = mergedFilename+".tmp"
+	mergedFile = open(temporaryFilename,"wb")
+	for values in shardFiles:
+		rawFile = open(values['filename'],"rb")
+		if values is not shardFiles[0]:
+			rawFile.seek(values['headerBytes'])
+		data = rawFile.read(READ_SIZE)
+		while data:
+			mergedFile.write(data)
+			data = rawFile.read(READ_SIZE)
+		rawFile.close()
+	mergedFile.close()
+	os.rename(temporaryFilename,mergedFilename)
+	return []
+
+
+if __name__ == "__main__":
+	SHARD_FILENAMES = []
+	MERGED_FILENAME = "tdt.out.gz"
+	while len(sys.argv) > 1:
+		thisArg = sys.argv.pop(1)
+		if thisArg.find("=") == -1:
+			print 'Unrecognised argument: '+thisArg
+			sys.exit(1)
+		name,value = thisArg.split("=")
+		name = name.lower().strip("- ")
+		if name == "shards":
+			for pattern in value.strip(" ").split(","):
+				SHARD_FILENAMES.extend(sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern])
+		elif name == "out":
+			MERGED_FILENAME = value.strip(" ")
+		else:
+			print "unrecognized option:", name
+			sys.exit(1)
+	assert (SHARD_FILENAMES), 'Shard outputs were not provided'
+	if os.path.abspath(MERGED_FILENAME) in [os.path.abspath(x) for x in SHARD_FILENAMES]:
+		print 'The merged output '+MERGED_FILENAME+' is one of the shard outputs'
+		sys.exit(1)
+	messages = mergeShards(SHARD_FILENAMES,MERGED_FILENAME)
+	if messages:
+		print 'Cannot merge the shard outputs:'
+		for message in messages:
+			print '  '+message
+		sys.exit(1)
+	print 'Merged',len(SHARD_FILENAMES),'shard outputs into',MERGED_FILENAME
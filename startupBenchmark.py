@@ -0,0 +1,133 @@
+import os
+import sys
+import time
+import json
+import shutil
+import tempfile
+import subprocess
+import numpy as np
+import gsl
+from pValues import BACKENDS
+from generateTrioData import generateTrioData
+
+"""
+Cold start benchmark of scanTDT.py for short jobs (e.g. one small shard of a genome per job).
+
+1. Import floor: python alone, python with numpy (imported by every run), and the scipy imports of the p-value backends: scipy.stats
+   (imported by the scipy backend before, for scipy.stats.chi2.sf and scipy.stats.norm.sf) and scipy.special (imported now, for the
+   chdtrc and ndtr functions that scipy.stats evaluates). Also the import of the modules that build the look-up tables (classMarker.py,
+   trioClassifier.py, blockStatistics.py, permutations.py), which are built once, at import.
+2. Cold runs: scanTDT.py is run REPEATS times per p-value backend on a small shard; the median and best wall times are reported, with the
+   heavy modules each run loaded (checked in one more run, through a wrapper that lists sys.modules at exit).
+   A serial run of the fast backend must load none of them (no scipy, multiprocessing or cProfile): the benchmark exits with status 1 if it does.
+
+USAGE: python startupBenchmark.py [-workdir=<directory> DEFAULT a temporary directory, removed at the end] [-repeats=<runs per backend> DEFAULT 7]
+	[-trios=<trios of the generated shard> DEFAULT 200] [-markers=<markers of the generated shard> DEFAULT 50]
+	[-fm=<feature matrix> -phenotype=<phenotype file> -gender=<gender file>] to time an existing shard instead
+"""
+
+WORKDIR = ""
+REPEATS = 7
+N_TRIOS = 200
+N_MARKERS = 50
+FM_FILENAME = ""
+PHENO_FILENAME = ""
+GENDER_FILENAME = ""
+
+PACKAGE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+SCAN_TDT = os.path.join(PACKAGE_DIRECTORY,"scanTDT.py")
+#modules reported when a run loads them
+HEAVY_MODULES = ['scipy','scipy.stats','scipy.special','gsl','multiprocessing','cProfile']
+#runs scanTDT.py as __main__ and writes the heavy modules loaded to the file given as first argument
+MODULE_WRAPPER = """
+import sys,json,atexit,runpy
+modulesFilename = sys.argv.pop(1)
+atexit.register(lambda: json.dump(sorted([name for name in %r if name in sys.modules]),open(modulesFilename,"w")))
+sys.argv[0] = %r
+runpy.run_path(sys.argv[0],run_name="__main__")
+""" % (HEAVY_MODULES,SCAN_TDT)
+
+##Wall times of a command run REPEATS times, in seconds
+def timeCommand(command,repeats):
+	times = []
+	for repeat in range(repeats):
+		start = time.time()
+		status = subprocess.call(command,stdout=open(os.devnull,"w"),stderr=subprocess.STDOUT,cwd=PACKAGE_DIRECTORY)
+		times.append(time.time()-start)
+		if status <> 0:
+			raise RuntimeError(" ".join(command)+" exited with status "+str(status))
+	return times
+
+##Seconds to import the given modules in a new interpreter, after numpy (median of the repeats)
+def timeImport(modules,repeats):
+	code = "import time,numpy\nstart=time.time()\nimport "+",".join(modules)+"\nprint time.time()-start"
+	return np.median([float(subprocess.check_output([sys.executable,"-c",code],cwd=PACKAGE_DIRECTORY)) for repeat in range(repeats)])
+
+def runBenchmark(fmFilename,phenoFilename,genderFilename,repeats):
+	scanOptions = ["-fm="+fmFilename,"-phenotype="+phenoFilename,"-gender="+genderFilename,"-out="+os.path.join(os.path.abspath(WORKDIR),"startup.out.gz")]
+	print "Import floor (median of",repeats,"runs, ms):"
+	print "\tpython\t%.1f" % (1000*np.median(timeCommand([sys.executable,"-c","pass"],repeats)))
+	print "\tpython + numpy\t%.1f" % (1000*np.median(timeCommand([sys.executable,"-c","import numpy"],repeats)))
+	for modules in [["scipy.stats"],["scipy.special"],["classMarker","trioClassifier","blockStatistics","permutations"]]:
+		print "\t+ import %s\t%.1f" % (",".join(modules),1000*timeImport(modules,repeats))
+
+	print "Cold runs of scanTDT.py on",fmFilename
+	print "\t".join(["backend","median(ms)","best(ms)","modules loaded"])
+	failed = False
+	modulesFilename = os.path.join(os.path.abspath(WORKDIR),"modules.json")
+	for backend in BACKENDS:
+		if backend == "gsl" and not gsl.available:
+			print "gsl\tlibgsl could not be loaded: skipped"
+			continue
+		times = timeCommand([sys.executable,SCAN_TDT]+scanOptions+["-pvalue-backend="+backend],repeats)
+		subprocess.check_call([sys.executable,"-c",MODULE_WRAPPER,modulesFilename]+scanOptions+["-pvalue-backend="+backend],stdout=open(os.devnull,"w"),cwd=PACKAGE_DIRECTORY)
+		modules = json.load(open(modulesFilename,"r"))
+		status = ""
+		#scipy.special itself imports multiprocessing, so only runs without scipy are checked for it
+		if backend == "fast" and modules:
+			status = "\tUNEXPECTED IMPORT"
+			failed = True
+		print "%s\t%.1f\t%.1f\t%s%s" % (backend,1000*np.median(times),1000*min(times),",".join(modules) or "-",status)
+	return failed
+
+
+if __name__ == "__main__":
+	while len(sys.argv) > 1:
+		thisArg = sys.argv.pop(1)
+		if thisArg.find("=") == -1:
+			print 'Unrecognised argument: '+thisArg
+			sys.exit(1)
+		name,value = thisArg.split("=")
+		name = name.lower().strip("- ")
+		if name == "workdir":
+			WORKDIR = value.strip(" ")
+		elif name == "repeats":
+			REPEATS = int(value.strip(" "))
+		elif name == "trios":
+			N_TRIOS = int(value.strip(" "))
+		elif name == "markers":
+			N_MARKERS = int(value.strip(" "))
+		elif name == "fm":
+			FM_FILENAME = os.path.abspath(value.strip(" "))
+		elif name == "phenotype":
+			PHENO_FILENAME = os.path.abspath(value.strip(" "))
+		elif name == "gender":
+			GENDER_FILENAME = os.path.abspath(value.strip(" "))
+		else:
+			print "unrecognized option:", name
+			sys.exit(1)
+	temporaryWorkdir = WORKDIR == ""
+	if temporaryWorkdir:
+		WORKDIR = tempfile.mkdtemp(prefix="startupBenchmark.")
+	elif not os.path.isdir(WORKDIR):
+		os.makedirs(WORKDIR)
+	try:
+		if FM_FILENAME == "":
+			prefix = os.path.join(os.path.abspath(WORKDIR),"shard")
+			generateTrioData(prefix,N_TRIOS,N_MARKERS)
+			FM_FILENAME,PHENO_FILENAME,GENDER_FILENAME = prefix+".fm",prefix+".pheno",prefix+".gender"
+		failed = runBenchmark(FM_FILENAME,PHENO_FILENAME,GENDER_FILENAME,REPEATS)
+	finally:
+		if temporaryWorkdir:
+			shutil.rmtree(WORKDIR,ignore_errors=True)
+	sys.exit(1 if failed else 0)
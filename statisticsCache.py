@@ -0,0 +1,63 @@
+import collections
+import numpy as np
+from blockStatistics import computeBlockStatistics,getStatisticColumns,countMatrixVectors
+from pValues import setPValueColumns
+
+#Memoization of the statistics and p-values of scanTDT.py (-stats-cache).
+#Every statistic depends only on the complete and incomplete informative count vectors of a marker (the count matrix of blockStatistics.py),
+#given the test, version, models and offset of the run. Rare variants repeat the same few count signatures (a single informative case trio
+#of one type, and nothing else) over and over, so the statistic columns of a signature, with their p-values, are kept in a bounded LRU cache
+#per chromosome class (autosomal and chrX count vectors have different lengths and look-up tables). A repeated signature costs one dictionary
+#look-up; only the signatures new to a block go through computeBlockStatistics and the p-value evaluation.
+#Values are those of the uncached computation (statistics are computed and p-values evaluated one marker at a time in vectorized calls), so the
+#output does not change. Empirical p-values (-permutations) depend on the marker id and are not cached.
+
+##Count signature of each marker of a block: the bytes of its row of the count matrix (int32)
+def getCountSignatures(counts):
+	countMatrix = np.ascontiguousarray(np.hstack([np.asarray(counts[name],dtype=np.int32) for name in countMatrixVectors]))
+	rowBytes = countMatrix.shape[1]*countMatrix.itemsize
+	data = countMatrix.tostring()
+	return [data[x*rowBytes:(x+1)*rowBytes] for x in range(countMatrix.shape[0])]
+
+##----------------------------------------------------------------------------------------------------------------------------------------------------
+class StatisticsCache:
+
+	###METHODS
+	#maxEntries count signatures are kept per chromosome class; statistics are computed with the options of the run
+	def __init__(self,maxEntries,TEST,VERSION,MODELS,OFFSET):
+		self.maxEntries = maxEntries
+		self.options = (TEST,VERSION,MODELS,OFFSET)
+		self.entries = {False:collections.OrderedDict(),True:collections.OrderedDict()}
+		self.statisticColumns = getStatisticColumns(TEST,VERSION,MODELS)
+		self.pValueColumns = [x for x in range(len(self.statisticColumns)) if self.statisticColumns[x].find("P-value") <> -1]
+
+	###Statistic columns of a block of markers of the same chromosome class, with their p-values set, in the row format of computeBlockStatistics.
+	#counts is the dictionary of count matrices from TrioClassifier.countTrioTypes.
+	#Also returns the number of markers whose signature was cached or repeated in the block (hits) and the number of signatures computed
+	def getStatistics(self,counts,isChrX):
+		signatures = getCountSignatures(counts)
+		entries = self.entries[isChrX]
+		statistics = [None]*len(signatures)
+		missingRows = collections.OrderedDict()    #rows of each signature that is not cached, in first row order
+		for row in range(len(signatures)):
+			signature = signatures[row]
+			if signature in entries:
+				#most recently used signatures are at the end
+				values = entries.pop(signature)
+				entries[signature] = values
+				statistics[row] = list(values)
+			elif signature in missingRows:
+				missingRows[signature].append(row)
+			else:
+				missingRows[signature] = [row]
+		if missingRows:
+			firstRows = [rows[0] for rows in missingRows.values()]
+			newStatistics = computeBlockStatistics(dict((name,np.asarray(counts[name])[firstRows]) for name in countMatrixVectors),isChrX,*self.options)
+			setPValueColumns(newStatistics,self.statisticColumns,self.pValueColumns)
+			for signature,values in zip(missingRows.keys(),newStatistics):
+				for row in missingRows[signature]:
+					statistics[row] = list(values)
+				entries[signature] = tuple(values)
+				if len(entries) > self.maxEntries:
+					entries.popitem(last=False)
+		return statistics,len(signatures)-len(missingRows),len(missingRows)
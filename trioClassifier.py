@@ -0,0 +1,299 @@
+import numpy as np
+from bitPlanes import countTrioCodes
+from classMarker import informativeTrioType,informativeTrioType_ChrX_MaleNB,informativeTrioType_ChrX_FemaleNB,nonInformativeMatingType,nonInformativeMotherType_ChrX,incompleteTrioType,incompleteTrioType_ChrX_MaleNB,incompleteTrioType_ChrX_FemaleNB
+
+#Vectorized trio classification engine.
+#Every (father,mother,offspring) genotype triple is encoded as a small integer (trio code) and mapped to its
+#complete/incomplete, informative/non-informative or MIE bin through tables precomputed at import from the look-up tables in classMarker.py.
+#All count vectors of a stratum (case/control x male/female NB) are then filled from the stratum's trio code histogram, computed with
+#one np.bincount over the trio codes ('bincount' kernel) or with ANDs and popcounts over packed bit-planes ('bitplane' kernel, see bitPlanes.py).
+#Rare markers, where few trios have a non-zero or NA member, take a sparse path: only those trios and member genotypes are classified and
+#counted, and the trios with all three members '0' (trio code 0) are the stratum sizes minus the trios listed.
+
+##GENOTYPE CODES
+#genotypes are held as int8: 0 (ref homozygous), 1 (heterozygous), 2 (non ref homozygous), 3 (NA). Anything else is invalid.
+GENOTYPE_NA = 3
+GENOTYPE_INVALID = -1
+genotypeCodes = {'0':0,'1':1,'2':2,'NA':GENOTYPE_NA}
+genotypeStrings = ['0','1','2','NA']
+
+#trio code = father*16 + mother*4 + offspring
+N_TRIO_CODES = 64
+
+#strata in the order [case male NB, case female NB, control male NB, control female NB]
+strataPhenoGender = [(2,1),(2,2),(1,1),(1,2)]
+
+#count vectors in output order, as named in classMarker.py
+countVectorNames = ['nCompleteInformativeCaseTrio_MaleNB','nCompleteInformativeCaseTrio_FemaleNB','nCompleteInformativeControlTrio_MaleNB','nCompleteInformativeControlTrio_FemaleNB','nCompleteNonInformativeCaseTrio','nCompleteNonInformativeControlTrio','nIncompleteInformativeCaseTrio_MaleNB','nIncompleteInformativeCaseTrio_FemaleNB','nIncompleteInformativeControlTrio_MaleNB','nIncompleteInformativeControlTrio_FemaleNB','nIncompleteNonInformativeCaseTrio','nIncompleteNonInformativeControlTrio','nMIE']
+
+#bin kinds within a stratum
+COMPLETE_INFORMATIVE = 0
+COMPLETE_NONINFORMATIVE = 1
+INCOMPLETE_INFORMATIVE = 2
+INCOMPLETE_NONINFORMATIVE = 3
+MIE = 4
+
+#trio code histogram kernels
+KERNELS = ['bincount','bitplane']
+
+
+def decodeTrio(code):
+	return [genotypeStrings[code>>4],genotypeStrings[(code>>2)&3],genotypeStrings[code&3]]
+
+##Classify a single trio exactly as AutosomalMarker/ChrXMarker.populateTrioTypeCountVectors do. Only used to build the tables below.
+def classifyTrio(genoF,genoM,genoNB,isChrX,gender):
+	complete = genoF <> "NA" and genoM <> "NA" and genoNB <> "NA"
+	if isChrX:
+		if complete:
+			informativeTypes = informativeTrioType_ChrX_MaleNB if gender == 1 else informativeTrioType_ChrX_FemaleNB
+		else:
+			informativeTypes = incompleteTrioType_ChrX_MaleNB if gender == 1 else incompleteTrioType_ChrX_FemaleNB
+		trioType = [genoF,genoM,genoNB]
+		matingType = genoM
+		nonInformativeTypes = nonInformativeMotherType_ChrX
+	else:
+		informativeTypes = informativeTrioType if complete else incompleteTrioType
+		trioType = [set([genoF,genoM]),genoNB]
+		matingType = set([genoF,genoM])
+		nonInformativeTypes = nonInformativeMatingType
+
+	if trioType in informativeTypes:
+		return (COMPLETE_INFORMATIVE if complete else INCOMPLETE_INFORMATIVE),informativeTypes.index(trioType)
+	elif matingType in nonInformativeTypes:
+		return (COMPLETE_NONINFORMATIVE if complete else INCOMPLETE_NONINFORMATIVE),nonInformativeTypes.index(matingType)
+	return MIE,0
+
+##Build the (trio code x bin) aggregation matrix for one chromosome class and NB gender
+#bins are laid out as [complete informative | complete non-informative | incomplete informative | incomplete non-informative | MIE]
+def buildAggregationMatrix(isChrX,gender):
+	if isChrX:
+		binSizes = [len(informativeTrioType_ChrX_MaleNB if gender == 1 else informativeTrioType_ChrX_FemaleNB),len(nonInformativeMotherType_ChrX),len(incompleteTrioType_ChrX_MaleNB if gender == 1 else incompleteTrioType_ChrX_FemaleNB),len(nonInformativeMotherType_ChrX),1]
+	else:
+		binSizes = [len(informativeTrioType),len(nonInformativeMatingType),len(incompleteTrioType),len(nonInformativeMatingType),1]
+	binOffsets = np.cumsum([0]+binSizes)
+	aggregation = np.zeros((N_TRIO_CODES,binOffsets[-1]),dtype=np.int64)
+	isMIE = np.zeros(N_TRIO_CODES,dtype=bool)
+	for code in range(N_TRIO_CODES):
+		genoF,genoM,genoNB = decodeTrio(code)
+		kind,index = classifyTrio(genoF,genoM,genoNB,isChrX,gender)
+		aggregation[code,binOffsets[kind]+index] = 1
+		isMIE[code] = kind == MIE
+	return aggregation,binOffsets,isMIE
+
+#precomputed tables, indexed [isChrX][gender] (gender 1 = male, 2 = female)
+aggregationTables = {}
+for isChrX in [False,True]:
+	for gender in [1,2]:
+		aggregationTables[(isChrX,gender)] = buildAggregationMatrix(isChrX,gender)
+#trio codes counted as complete informative, indexed [isChrX][gender], for the pre-filter (see markerFilter.py)
+completeInformativeTables = {}
+for (isChrX,gender),(aggregation,binOffsets,isMIE) in aggregationTables.items():
+	completeInformativeTables[(isChrX,gender)] = aggregation[:,binOffsets[COMPLETE_INFORMATIVE]:binOffsets[COMPLETE_INFORMATIVE+1]].any(axis=1)
+
+
+##----------------------------------------------------------------------------------------------------------------------------------------------------
+class TrioClassifier:
+
+	#trio code histogram kernel, one of KERNELS
+	kernel = 'bincount'
+	#markers where at most this fraction of trios have a non-zero or NA member take the sparse path
+	sparseFraction = 0.1
+
+	###METHODS
+	#pedigreeMetadata is the PedigreeMetadata of the analysed trios (see pedigreeMetadata.py)
+	def __init__(self,pedigreeMetadata):
+		self.pedIDs = pedigreeMetadata.pedIDs
+		#sample column of each trio member, in the order of self.pedIDs
+		self.fatherColumns = pedigreeMetadata.fatherColumns
+		self.motherColumns = pedigreeMetadata.motherColumns
+		self.offspringColumns = pedigreeMetadata.offspringColumns
+		#trio indices of each stratum. Trios with unknown phenotype or NB gender are not counted.
+		self.strataTrios = []
+		for pheno,gender in strataPhenoGender:
+			self.strataTrios.append(np.nonzero((pedigreeMetadata.phenotypes == pheno) & (pedigreeMetadata.genders == gender))[0])
+		#stratum of each trio (-1 if not counted) and number of trios of each stratum, for the sparse path
+		self.trioStrata = np.repeat(-1,len(self.pedIDs))
+		for stratum in range(len(strataPhenoGender)):
+			self.trioStrata[self.strataTrios[stratum]] = stratum
+		self.strataSizes = np.array([len(x) for x in self.strataTrios],dtype=np.int64)
+		#ploidy of each trio member column [fathers | mothers | offspring] for allele counts. On chrX, offspring of unknown gender are not counted.
+		self.memberColumns = np.concatenate([self.fatherColumns,self.motherColumns,self.offspringColumns])
+		nTrios = len(self.pedIDs)
+		self.memberPloidy = {False:np.repeat(2,3*nTrios),True:np.concatenate([np.repeat(1,nTrios),np.repeat(2,nTrios),np.where(pedigreeMetadata.isMale,1,np.where(pedigreeMetadata.isFemale,2,0))])}
+		#member position in [fathers | mothers | offspring] of each sample column (-1 for samples that are not trio members), for the sparse path
+		nSamples = self.memberColumns.max()+1 if len(self.memberColumns) else 0
+		self.sampleMembers = np.repeat(-1,nSamples)
+		self.sampleMembers[self.memberColumns] = np.arange(len(self.memberColumns))
+
+	###Sample columns of the male trio members: fathers and offspring with NB gender 1
+	def getMaleColumns(self):
+		return np.concatenate([self.fatherColumns,self.offspringColumns[self.memberPloidy[True][2*len(self.pedIDs):] == 1]])
+
+	###Check the genotypes of a block of markers of the same chromosome class. Returns one boolean per marker; same result as hasValidGenotypes of the marker classes.
+	#On chrX, fathers and male offspring can only be 0, 1 or NA
+	def hasValidGenotypes(self,genotypes,isChrX):
+		memberGenotypes = genotypes[:,self.memberColumns]
+		maxGenotypes = np.where(self.memberPloidy[isChrX] == 1,1,2)
+		return (((memberGenotypes >= 0) & (memberGenotypes <= maxGenotypes)) | (memberGenotypes == GENOTYPE_NA)).all(axis=1)
+
+	###Reference and alternate allele counts of a block of markers, as two vectors; same counts as computeMAF of the marker classes
+	def getAlleleCounts(self,genotypes,isChrX):
+		ploidy = self.memberPloidy[isChrX]
+		refCounts = np.zeros(genotypes.shape[0],dtype=np.int64)
+		altCounts = np.zeros(genotypes.shape[0],dtype=np.int64)
+		sparseRows,denseRows = self.splitSparseRows(genotypes)
+		if len(denseRows):
+			memberGenotypes = genotypes[denseRows][:,self.memberColumns].astype(np.int64)
+			isCounted = (memberGenotypes <> GENOTYPE_NA) & (ploidy > 0)
+			altCounts[denseRows] = (memberGenotypes*isCounted).sum(axis=1)
+			refCounts[denseRows] = (ploidy*isCounted).sum(axis=1) - altCounts[denseRows]
+		if len(sparseRows):
+			#'0' genotypes only add reference alleles: all alleles minus those of the NA members and the alternate alleles
+			markers,columns,values = self.getNonZeroMembers(genotypes[sparseRows])
+			isNA = values == GENOTYPE_NA
+			altCounts[sparseRows] = np.bincount(markers[~isNA],weights=values[~isNA]*(ploidy[columns[~isNA]] > 0),minlength=len(sparseRows)).astype(np.int64)
+			naAlleles = np.bincount(markers[isNA],weights=ploidy[columns[isNA]],minlength=len(sparseRows)).astype(np.int64)
+			refCounts[sparseRows] = ploidy.sum() - naAlleles - altCounts[sparseRows]
+		return refCounts,altCounts
+
+	###Genotype counts [0/0,0/1,1/1,./.] of a block of markers, as a (nMarkers x 4) matrix; same counts as getVariantDistribution of the marker classes
+	#On chrX, hemizygous 0 and 1 of fathers and male offspring are counted as 0/0 and 1/1
+	def getVariantDistribution(self,genotypes,isChrX):
+		ploidy = self.memberPloidy[isChrX]
+		nVariantType = np.zeros((genotypes.shape[0],4),dtype=np.int64)
+		sparseRows,denseRows = self.splitSparseRows(genotypes)
+		if len(denseRows):
+			memberGenotypes = genotypes[denseRows][:,self.memberColumns]
+			diploid = memberGenotypes[:,ploidy == 2]
+			haploid = memberGenotypes[:,ploidy == 1]
+			for genotype in [0,1,2]:
+				nVariantType[denseRows,genotype] = (diploid == genotype).sum(axis=1)
+			nVariantType[denseRows,0] += (haploid == 0).sum(axis=1)
+			nVariantType[denseRows,2] += (haploid == 1).sum(axis=1)
+			nVariantType[denseRows,3] = (memberGenotypes == GENOTYPE_NA).sum(axis=1)
+		if len(sparseRows):
+			#'0' genotypes are the members of each ploidy minus the non-zero ones
+			markers,columns,values = self.getNonZeroMembers(genotypes[sparseRows])
+			memberPloidy = ploidy[columns]
+			countRows = lambda isCounted: np.bincount(markers[isCounted],minlength=len(sparseRows))
+			nVariantType[sparseRows,0] = (ploidy == 2).sum() - countRows(memberPloidy == 2) + (ploidy == 1).sum() - countRows(memberPloidy == 1)
+			nVariantType[sparseRows,1] = countRows((values == 1) & (memberPloidy == 2))
+			nVariantType[sparseRows,2] = countRows((values == 2) & (memberPloidy == 2)) + countRows((values == 1) & (memberPloidy == 1))
+			nVariantType[sparseRows,3] = countRows(values == GENOTYPE_NA)
+		return nVariantType
+
+	###Split the rows of a block into rare markers (sparse path: at most sparseFraction x nTrios non-zero genotypes) and the others
+	def splitSparseRows(self,genotypes):
+		isSparse = np.count_nonzero(genotypes,axis=1) <= self.sparseFraction*len(self.pedIDs)
+		return np.nonzero(isSparse)[0],np.nonzero(~isSparse)[0]
+
+	###Non-zero (non reference or NA) member genotypes of a block, as (marker rows, member positions in [fathers | mothers | offspring] order, genotypes)
+	#The block is scanned 8 genotypes (one 64-bit word) at a time and only the non-zero words are examined, so the work beyond this scan scales with the number of carriers.
+	def getNonZeroMembers(self,genotypes):
+		nSamples = genotypes.shape[1]
+		flatGenotypes = np.ascontiguousarray(genotypes).ravel()
+		nWords = len(flatGenotypes)/8
+		words = np.flatnonzero(flatGenotypes[:nWords*8].view(np.uint64))
+		positions = (words.reshape(-1,1)*8 + np.arange(8)).ravel()
+		positions = np.concatenate([positions,np.arange(nWords*8,len(flatGenotypes))])
+		positions = positions[flatGenotypes[positions] <> 0]
+		markers = positions/nSamples
+		members = self.getSampleMembers(nSamples)[positions%nSamples]
+		isMember = members >= 0
+		return markers[isMember],members[isMember],flatGenotypes[positions[isMember]]
+
+	###Member position of each of nSamples sample columns (-1 for samples that are not trio members)
+	def getSampleMembers(self,nSamples):
+		if len(self.sampleMembers) < nSamples:
+			self.sampleMembers = np.concatenate([self.sampleMembers,np.repeat(-1,nSamples-len(self.sampleMembers))])
+		return self.sampleMembers
+
+	###Trio codes of a (nMarkers x nSamples) genotype matrix, as a (nMarkers x nTrios) array
+	def getTrioCodes(self,genotypes):
+		genotypes = genotypes.astype(np.intp)
+		return (genotypes[:,self.fatherColumns]<<4) | (genotypes[:,self.motherColumns]<<2) | genotypes[:,self.offspringColumns]
+
+	###Count all trio types for a block of markers of the same chromosome class
+	#returns a dictionary of count matrices (nMarkers x vector length) keyed by countVectorNames; 'nMIE' is a vector of length nMarkers
+	def countTrioTypes(self,genotypes,isChrX):
+		nMarkers = genotypes.shape[0]
+		codeCounts = np.zeros((len(strataPhenoGender),nMarkers,N_TRIO_CODES),dtype=np.int64)
+		sparseRows,denseRows = self.splitSparseRows(genotypes)
+		if len(sparseRows):
+			codeCounts[:,sparseRows] = self.countSparseTrioCodes(genotypes[sparseRows])
+		counts = {}
+		for stratum in range(len(strataPhenoGender)):
+			pheno,gender = strataPhenoGender[stratum]
+			aggregation,binOffsets,isMIE = aggregationTables[(isChrX,gender)]
+			if len(denseRows):
+				codeCounts[stratum,denseRows] = self.countStratumTrioCodes(genotypes[denseRows],stratum)
+			binCounts = codeCounts[stratum].dot(aggregation)
+			self.addStratumCounts(counts,binCounts,binOffsets,pheno,gender)
+		return counts
+
+	###Complete informative trios and MIE trios of a block of markers of the same chromosome class, as two vectors: the sums of the
+	#nCompleteInformative count vectors and nMIE of countTrioTypes, from one table look-up per trio instead of the trio code histograms.
+	#Trio codes of valid genotypes fit in int8, so they are computed without widening the genotypes
+	def getInformativeAndMIECounts(self,genotypes,isChrX):
+		nInformative = np.zeros(genotypes.shape[0],dtype=np.int64)
+		nMIE = np.zeros(genotypes.shape[0],dtype=np.int64)
+		for stratum in range(len(strataPhenoGender)):
+			pheno,gender = strataPhenoGender[stratum]
+			trios = self.strataTrios[stratum]
+			if not len(trios):
+				continue
+			trioCodes = (genotypes[:,self.fatherColumns[trios]]<<4) | (genotypes[:,self.motherColumns[trios]]<<2) | genotypes[:,self.offspringColumns[trios]]
+			nInformative += completeInformativeTables[(isChrX,gender)][trioCodes].sum(axis=1)
+			nMIE += aggregationTables[(isChrX,gender)][2][trioCodes].sum(axis=1)
+		return nInformative,nMIE
+
+	###Trio code histogram (nMarkers x 64) of one stratum
+	def countStratumTrioCodes(self,genotypes,stratum):
+		trios = self.strataTrios[stratum]
+		if self.kernel == 'bitplane':
+			return countTrioCodes(genotypes[:,self.fatherColumns[trios]],genotypes[:,self.motherColumns[trios]],genotypes[:,self.offspringColumns[trios]])
+		nMarkers = genotypes.shape[0]
+		markerOffsets = (np.arange(nMarkers,dtype=np.intp)*N_TRIO_CODES).reshape(-1,1)
+		stratumCodes = ((genotypes[:,self.fatherColumns[trios]].astype(np.intp)<<4) | (genotypes[:,self.motherColumns[trios]].astype(np.intp)<<2) | genotypes[:,self.offspringColumns[trios]]) + markerOffsets
+		return np.bincount(stratumCodes.ravel(),minlength=nMarkers*N_TRIO_CODES).reshape(nMarkers,N_TRIO_CODES)
+
+	###Trio code histograms (strata x nMarkers x 64) of rare markers, from the trios with a non-zero or NA member only
+	def countSparseTrioCodes(self,genotypes):
+		nMarkers = genotypes.shape[0]
+		nTrios = len(self.pedIDs)
+		markers,members,values = self.getNonZeroMembers(genotypes)
+		markerTrios = np.unique(markers*nTrios + members%nTrios)
+		markers,trios = markerTrios/nTrios,markerTrios%nTrios
+		strata = self.trioStrata[trios]
+		isCounted = strata >= 0
+		markers,trios,strata = markers[isCounted],trios[isCounted],strata[isCounted]
+		codes = (genotypes[markers,self.fatherColumns[trios]].astype(np.intp)<<4) | (genotypes[markers,self.motherColumns[trios]].astype(np.intp)<<2) | genotypes[markers,self.offspringColumns[trios]]
+		codeCounts = np.bincount(((strata*nMarkers)+markers)*N_TRIO_CODES+codes,minlength=len(strataPhenoGender)*nMarkers*N_TRIO_CODES).reshape(len(strataPhenoGender),nMarkers,N_TRIO_CODES)
+		#trios that are not listed have trio code 0
+		codeCounts[:,:,0] = self.strataSizes.reshape(-1,1) - codeCounts.sum(axis=2)
+		return codeCounts
+
+	###Split the bin counts of one stratum into the count vectors
+	def addStratumCounts(self,counts,binCounts,binOffsets,pheno,gender):
+		phenoLabel = 'Case' if pheno == 2 else 'Control'
+		genderLabel = 'MaleNB' if gender == 1 else 'FemaleNB'
+		names = ['nCompleteInformative'+phenoLabel+'Trio_'+genderLabel,'nCompleteNonInformative'+phenoLabel+'Trio','nIncompleteInformative'+phenoLabel+'Trio_'+genderLabel,'nIncompleteNonInformative'+phenoLabel+'Trio','nMIE']
+		for kind in range(len(names)):
+			binCount = binCounts[:,binOffsets[kind]:binOffsets[kind+1]]
+			if names[kind] == 'nMIE':
+				binCount = binCount[:,0]
+			if names[kind] in counts:
+				counts[names[kind]] = counts[names[kind]] + binCount
+			else:
+				counts[names[kind]] = binCount
+
+	###List the trios counted as MIE at one marker row, as (pedID,[genoF,genoM,genoNB])
+	def getMIETrios(self,genotypes,isChrX,row=0):
+		trioCodes = self.getTrioCodes(genotypes[row:row+1])[0]
+		mieTrios = []
+		for stratum in range(len(strataPhenoGender)):
+			pheno,gender = strataPhenoGender[stratum]
+			isMIE = aggregationTables[(isChrX,gender)][2]
+			for trio in self.strataTrios[stratum][isMIE[trioCodes[self.strataTrios[stratum]]]]:
+				mieTrios.append((self.pedIDs[trio],decodeTrio(trioCodes[trio])))
+		return mieTrios
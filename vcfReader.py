@@ -0,0 +1,176 @@
+import re
+import sys
+import gzip
+import numpy as np
+from trioClassifier import GENOTYPE_NA,GENOTYPE_INVALID
+from plinkReader import getMarkerID
+from classMarker import getMarkerClass
+from pipeStreams import StreamReader,STREAM_FILENAME
+
+#VCF genotypes as a feature matrix source (-vcf=<file.vcf[.gz]>), read as a stream of marker lines like a text feature matrix.
+#-vcf=- reads a plain or gzip VCF stream from the standard input (see pipeStreams.py).
+#Trios come from a sidecar file (-vcf-trios): one line per trio member with the VCF sample name, the trio id and the member type
+#(1 father, 2 mother, 3 offspring), the first two rows of a feature matrix in long form. Samples that are not in the sidecar are not read.
+#Genotypes are the count of the ALT allele: 0, 1, 2 or NA; half calls (./1) are NA, phased and unphased calls are read alike.
+#Only the GT subfield (the first one, as required by the VCF specification) is read: the other FORMAT subfields of all samples of a line
+#are removed with one regular expression substitution instead of splitting every sample field. When all GTs of a line are then 3 bytes
+#(biallelic diploid calls), the genotypes of all such lines are decoded in bulk with np.frombuffer and a byte look-up table; other lines
+#(haploid calls, multi-allelic markers) are decoded call by call. Haploid calls count as homozygous, as in PLINK, so that male chrX calls
+#coded either way are converted to the hemizygous coding of the feature matrix (0 or 1, heterozygous male calls are invalid).
+#Marker ids are <chr:position>, with the chromosome names of plinkReader.getMarkerID, so chrY and chrM lines are skipped by the same routing
+#as feature matrix lines, before their genotypes are decoded.
+#Multi-allelic markers (ALT with several alleles) are skipped (-vcf-multiallelic=skip) or split into one biallelic marker per ALT allele
+#(split), each counting its ALT allele against all other alleles; split markers have ids <chr:position:ALT>, e.g. chr1:60:G and chr1:60:T.
+
+MULTIALLELIC_OPTIONS = ['skip','split']
+FORMAT_SUBFIELDS = re.compile(r':[^\t]*')
+ALLELE_MISSING = 8                #allele code of '.'; any sum of two alleles >= ALLELE_MISSING has a missing allele
+
+#allele code of each byte value in a 3 byte diploid call: REF 0, ALT 1, missing, or -1 (anything else)
+byteAlleles = np.repeat(np.int8(-1),256)
+byteAlleles[ord('0')] = 0
+byteAlleles[ord('1')] = 1
+byteAlleles[ord('.')] = ALLELE_MISSING
+isSeparatorByte = np.zeros(256,dtype=bool)
+isSeparatorByte[[ord('/'),ord('|')]] = True
+
+#hemizygous coding of male chrX genotypes, indexed by genotype+1 (GENOTYPE_INVALID, 0, 1, 2, GENOTYPE_NA): ALT count 2 is coded 1,
+#heterozygous calls are invalid
+maleChrXGenotypes = np.array([GENOTYPE_INVALID,0,GENOTYPE_INVALID,1,GENOTYPE_NA],dtype=np.int8)
+
+##Count of ALT allele number altAllele (1 for biallelic markers) in a GT call
+def decodeCall(call,altAllele):
+	alleles = call.replace('|','/').split('/')
+	if '.' in alleles:
+		return GENOTYPE_NA
+	if len(alleles) > 2 or not all(allele.isdigit() for allele in alleles):
+		return GENOTYPE_INVALID
+	if len(alleles) == 1:
+		return 2*(int(alleles[0]) == altAllele)
+	return (int(alleles[0]) == altAllele)+(int(alleles[1]) == altAllele)
+
+##Genotypes of the GT calls seen so far, for ALT allele number altAllele: calls repeat across samples and lines, so each distinct call is decoded once
+class CallGenotypes(dict):
+
+	def __init__(self,altAllele):
+		dict.__init__(self)
+		self.altAllele = altAllele
+
+	def __missing__(self,call):
+		self[call] = decodeCall(call,self.altAllele)
+		return self[call]
+
+##----------------------------------------------------------------------------------------------------------------------------------------------------
+class VcfReader:
+
+	###METHODS
+	#The meta-information and header lines are read here; self.file is then positioned at the first marker line
+	def __init__(self,vcfFilename,triosFilename,multiallelic="skip"):
+		if vcfFilename == STREAM_FILENAME:
+			self.file = StreamReader(sys.stdin)
+		elif vcfFilename.endswith("gz"):
+			self.file = gzip.open(vcfFilename,"r")
+		else:
+			self.file = open(vcfFilename,"r")
+		self.multiallelic = multiallelic
+		line = self.file.readline()
+		while line.startswith("##"):
+			line = self.file.readline()
+		if not line.startswith("#CHROM"):
+			raise IOError(vcfFilename+" has no #CHROM header line")
+		self.sampleNames = line.rstrip("\r\n").split("\t")[9:]
+		self.nSamples = len(self.sampleNames)
+		self.readTrios(triosFilename)
+		self.maleColumns = np.array([],dtype=np.intp)
+		self.callGenotypes = {}       #CallGenotypes of each ALT allele number
+
+	###Trio members of the sidecar file, as the first two rows of a feature matrix (idColumns, memberTypeColumns), and their VCF sample indices
+	def readTrios(self,triosFilename):
+		sampleIndex = dict((name,x) for x,name in enumerate(self.sampleNames))
+		self.idColumns = []
+		self.memberTypeColumns = []
+		sampleIndices = []
+		notInVcf = []
+		for line in open(triosFilename,"r"):
+			columns = line.split()
+			if len(columns) < 3 or columns[0].startswith("#"):
+				continue
+			if columns[0] not in sampleIndex:
+				notInVcf.append(columns[0])
+				continue
+			self.idColumns.append(columns[1])
+			self.memberTypeColumns.append(columns[2])
+			sampleIndices.append(sampleIndex[columns[0]])
+		if notInVcf:
+			print len(notInVcf),"samples of",triosFilename,"are not in the VCF file:",",".join(notInVcf)
+		self.sampleIndices = np.array(sampleIndices,dtype=np.intp)
+
+	###Columns (in idColumns order) of the male trio members, converted to hemizygous genotypes on chrX
+	def setMaleColumns(self,maleColumns):
+		self.maleColumns = np.array(maleColumns,dtype=np.intp)
+
+	###Parse a chunk of VCF marker lines into (markerIDs, genotypes), genotypes a (nMarkers x nTrioMembers) int8 array in idColumns order.
+	#chrY and chrM lines are left out; multi-allelic lines are left out or split. Also returns the number of chrY/chrM lines and the ids of the multi-allelic markers left out
+	def parseLines(self,lines):
+		markerIDs = []
+		rowCalls = []                 #(GT calls of all samples, ALT allele number, number of ALT alleles) of each marker
+		nUntested = 0
+		skippedIDs = []
+		for line in lines:
+			fields = line.split("\t",9)
+			if len(fields) < 10:
+				continue
+			markerID = getMarkerID(fields[0],fields[1])
+			if not getMarkerClass(markerID):
+				nUntested += 1
+				continue
+			nAlternateAlleles = fields[4].count(",")+1
+			if nAlternateAlleles > 1 and self.multiallelic == "skip":
+				skippedIDs.append(markerID)
+				continue
+			calls = fields[9].rstrip("\r\n")
+			if not fields[8].startswith("GT"):
+				calls = ""
+			elif fields[8] <> "GT":
+				calls = FORMAT_SUBFIELDS.sub("",calls)
+			if nAlternateAlleles == 1:
+				markerIDs.append(markerID)
+				rowCalls.append((calls,1,1))
+				continue
+			#split markers are told apart by their ALT allele: <chr:position:ALT>
+			alternateAlleles = fields[4].split(",")
+			for altAllele in range(1,nAlternateAlleles+1):
+				markerIDs.append(markerID+":"+alternateAlleles[altAllele-1])
+				rowCalls.append((calls,altAllele,nAlternateAlleles))
+
+		genotypes = np.empty((len(markerIDs),len(self.sampleIndices)),dtype=np.int8)
+		bulkRows = [x for x in range(len(markerIDs)) if rowCalls[x][2] == 1 and len(rowCalls[x][0]) == 4*self.nSamples-1]
+		otherRows = sorted(set(range(len(markerIDs)))-set(bulkRows))
+		if bulkRows:
+			callBytes = np.frombuffer("".join([rowCalls[x][0]+"\t" for x in bulkRows]),dtype=np.uint8).reshape(len(bulkRows),self.nSamples,4)
+			#every fourth byte must be a tab, otherwise a call was not 3 bytes long
+			isBulk = (callBytes[:,:,3] == ord("\t")).all(axis=1)
+			callBytes = callBytes[isBulk][:,self.sampleIndices]
+			first = byteAlleles[callBytes[:,:,0]]
+			second = byteAlleles[callBytes[:,:,2]]
+			isInvalid = (first < 0) | (second < 0) | ~isSeparatorByte[callBytes[:,:,1]]
+			rows = np.array(bulkRows,dtype=np.intp)
+			genotypes[rows[isBulk]] = np.where(isInvalid,GENOTYPE_INVALID,np.where(first+second >= ALLELE_MISSING,GENOTYPE_NA,first+second))
+			otherRows.extend(rows[~isBulk].tolist())
+		for row in otherRows:
+			genotypes[row] = self.decodeCalls(rowCalls[row][0],rowCalls[row][1])[self.sampleIndices]
+
+		chrXRows = np.array([x for x in range(len(markerIDs)) if markerIDs[x].startswith("chrX") or markerIDs[x].startswith("chr23")],dtype=np.intp)
+		if len(chrXRows) and len(self.maleColumns):
+			males = genotypes[chrXRows.reshape(-1,1),self.maleColumns]
+			genotypes[chrXRows.reshape(-1,1),self.maleColumns] = maleChrXGenotypes[males.astype(np.intp)+1]
+		return markerIDs,genotypes,nUntested,skippedIDs
+
+	###Genotypes of all samples from the GT calls of a line, one call at a time. Lines without a call per sample are invalid
+	def decodeCalls(self,calls,altAllele):
+		calls = calls.split("\t")
+		if len(calls) < self.nSamples:
+			return np.repeat(np.int8(GENOTYPE_INVALID),self.nSamples)
+		if altAllele not in self.callGenotypes:
+			self.callGenotypes[altAllele] = CallGenotypes(altAllele)
+		return np.fromiter(map(self.callGenotypes[altAllele].__getitem__,calls[:self.nSamples]),dtype=np.int8,count=self.nSamples)